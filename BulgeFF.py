@@ -1,45 +1,27 @@
 import sys
 import os
+import glob
 import argparse
-import warnings
-from Bio import BiopythonDeprecationWarning
-
-warnings.simplefilter('ignore', BiopythonDeprecationWarning)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from utils import (
-    get_atom_id,
-    get_trinucleotides,
-    get_prototype,
-    get_function,
-    sugar_type,
-    write_plumed
-)
-
-def main(bulge_pdb_name, md_pdb_name, bulge_resi_list, bulge_res_list, prototype_path, func_file, plumed_file):
-    eta_list = []
-    theta_list = []
-    eta_func_list = []
-    theta_func_list = []
-
-    for bulge_resi, bulge_res in zip(bulge_resi_list, bulge_res_list):
-        reference = get_trinucleotides(bulge_pdb_name, bulge_resi, bulge_res)
-        eta, theta = get_atom_id(md_pdb_name, bulge_resi, bulge_res)
-        sugar = sugar_type(bulge_pdb_name, bulge_resi, bulge_res)
-        model, model_type = get_prototype(sugar, reference, prototype_path)
-
-        if model_type is None:
-            print(model)
-            continue
-
-        eta_func, theta_func = get_function(model_type, model, func_file)
+from utils.generate_plumed import generate_plumed
+from utils.batch import run_batch
+from utils.cache import ResultCache, CACHE_ENV
+from utils.ensemble import CONSENSUS_MODES
+from utils.find_bulges import find_bulges, bulge_residue_ids
+from utils.read_structure import read_structure
+from utils.incremental import watch_inputs
+from utils.profiling import PROFILER, LOG_LEVELS, configure_logging
 
-        eta_list.append(eta)
-        theta_list.append(theta)
-        eta_func_list.append(eta_func)
-        theta_func_list.append(theta_func)
-
-    write_plumed(plumed_file, eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list, bulge_resi_list)
+def main(bulge_pdb_name, md_pdb_name, bulge_resi_list, bulge_res_list, prototype_path, func_file, plumed_file, md_index=False,
+         plumed_options=None, cache=None, consensus='majority', incremental=False):
+    results = generate_plumed(bulge_pdb_name, md_pdb_name, bulge_resi_list, bulge_res_list, prototype_path, func_file,
+                              plumed_file, md_index=md_index, plumed_options=plumed_options, cache=cache,
+                              consensus=consensus, incremental=incremental)
+    for result in results:
+        if result['message']:
+            print(result['message'])
+    return results
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -48,22 +30,94 @@ if __name__ == "__main__":
         add_help=True
     )
 
-    parser.add_argument("--bulge_pdb", type=str, default="2jym.pdb", help="Name of PDB file. Default: 2jym.pdb")
-    parser.add_argument("--md_pdb", type=str, default="reference.pdb", help="Name of PDB file for MD. Default: reference.pdb")
+    parser.add_argument("--bulge_pdb", type=str, default="2jym.pdb", help="Bulge structure (PDB, mmCIF or .gro). Default: 2jym.pdb")
+    parser.add_argument("--md_pdb", type=str, default="reference.pdb", help="MD structure (PDB, mmCIF or .gro) the atom IDs are taken from.\nDefault: reference.pdb")
     parser.add_argument("--bulge_name", type=str, nargs='+', default=["G"], help="List of bulge residue names. Default: G")
     parser.add_argument("--bulge_id", type=int, nargs='+', default=[6], help="List of bulge residue IDs. Default: 6")
+    parser.add_argument("--auto_bulge", action="store_true", help="Detect bulge residues from the base pairs of --bulge_pdb\ninstead of using --bulge_name/--bulge_id.")
+    parser.add_argument("--max_bulge_size", type=int, default=1, help="Largest number of consecutive unpaired residues treated as a bulge\nby --auto_bulge. Default: 1")
+    parser.add_argument("--output", type=str, default="plumed.dat", help="Path of the PLUMED file to write. Default: plumed.dat")
+    parser.add_argument("--md_index", action="store_true", help="Keep a residue offset index next to the MD PDB (<md_pdb>.bfidx.npz)\nso repeat runs seek straight to the bulge residues.")
+    parser.add_argument("--bias_mode", type=str, choices=["custom", "grid"], default="custom", help="custom: CUSTOM expressions evaluated by PLUMED at every step.\ngrid: pre-tabulated EXTERNAL grid biases written next to the PLUMED file.\nDefault: custom")
+    parser.add_argument("--grid_bins", type=int, default=3600, help="Number of grid points over [-pi, pi) for --bias_mode grid. Default: 3600")
+    parser.add_argument("--plumed_layout", type=str, choices=["default", "lean"], default="default", help="default: one block per bulge with its own bias actions and PRINT files.\nlean: a single merged CUSTOM/BIASVALUE bias and one COLVAR file, no MOLINFO.\nDefault: default")
+    parser.add_argument("--print_stride", type=int, default=5000, help="Stride of the PRINT actions; 0 disables printing. Default: 5000")
+    parser.add_argument("--consensus", type=str, choices=CONSENSUS_MODES, default="majority", help="How a multi-model --bulge_pdb (NMR ensemble) is assigned.\nmajority: the prototype assigned to the most models.\nmean_rmsd: the prototype with the lowest RMSD averaged over the models.\nDefault: majority")
+    parser.add_argument("--incremental", action="store_true", help="Keep per-bulge input fingerprints next to the output (<output>.bfstate.json)\nand recompute/rewrite only the bulges whose inputs changed.")
+    parser.add_argument("--watch", action="store_true", help="Stay running and regenerate incrementally whenever --bulge_pdb, --md_pdb,\nthe function file or the prototypes change (Ctrl-C to stop).")
+    parser.add_argument("--watch_interval", type=float, default=1.0, help="Polling interval of --watch in seconds. Default: 1.0")
+    parser.add_argument("--cache", action="store_true", help="Read and write the persistent prototype assignment cache. Also enabled by\n--cache_dir or $BULGEFF_CACHE_DIR. Default: off")
+    parser.add_argument("--no_cache", action="store_true", help="Do not read or write the prototype assignment cache, even if\n--cache_dir or $BULGEFF_CACHE_DIR is set.")
+    parser.add_argument("--clear_cache", action="store_true", help="Remove all prototype assignment cache entries before running.")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory of the prototype assignment cache.\nDefault: $BULGEFF_CACHE_DIR or ~/.cache/bulgeff")
+    parser.add_argument("--manifest", type=str, default=None, help="CSV or JSON-lines manifest of jobs to run in batch mode.\nColumns: bulge_pdb, md_pdb, bulge_name, bulge_id, output_dir [, job, plumed_file]")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes in batch mode. Default: 1")
+    parser.add_argument("--summary", type=str, default="batch_summary.csv", help="Summary table written in batch mode. Default: batch_summary.csv")
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+    parser.add_argument("--profile", type=str, default=None, help="Write a JSON report with the stage timings, RMSD evaluation counts\nand peak memory to this file.")
 
     args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
 
-    if len(args.bulge_name) != len(args.bulge_id):
-        print("Error: The number of bulge residues and residue IDs must match.")
-        sys.exit(1)
+    plumed_options = {"bias_mode": args.bias_mode, "grid_bins": args.grid_bins, "layout": args.plumed_layout,
+                      "print_stride": args.print_stride}
+
+    use_cache = (args.cache or args.cache_dir or os.environ.get(CACHE_ENV)) and not args.no_cache
+    cache = ResultCache(args.cache_dir) if use_cache else None
+    if args.clear_cache:
+        removed = ResultCache(args.cache_dir).clear()
+        print(f"Removed {removed} cache entries.")
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(script_dir, 'function')
 
     prototype_path = os.path.join(script_dir, 'prototype_db')
     func_file = os.path.join(data_dir, 'fix_function.txt')
-    plumed_file = os.path.join(os.getcwd(), 'plumed.dat')
 
-    main(args.bulge_pdb, args.md_pdb, args.bulge_id, args.bulge_name, prototype_path, func_file, plumed_file)
\ No newline at end of file
+    if args.manifest:
+        summary = run_batch(args.manifest, prototype_path, func_file, args.workers, args.summary, md_index=args.md_index,
+                            plumed_options=plumed_options, cache=cache, consensus=args.consensus)
+        failed = [row['job'] for row in summary if row['status'] != 'ok']
+        print(f"Processed {len(summary)} jobs, {len(failed)} failed. Summary written to {args.summary}")
+        if args.profile:
+            PROFILER.write_report(args.profile, mode="batch", manifest=args.manifest, workers=args.workers,
+                                  jobs=len(summary), failed=len(failed))
+        sys.exit(1 if failed else 0)
+
+    if args.auto_bulge:
+        with PROFILER.stage('bulge_detection'):
+            bulge_structure = read_structure(args.bulge_pdb)
+            bulges = find_bulges(bulge_structure, max_size=args.max_bulge_size)
+        if not bulges:
+            print(f"No bulge residues found in {args.bulge_pdb}.")
+            sys.exit(1)
+        try:
+            args.bulge_name, args.bulge_id = bulge_residue_ids(bulges, bulge_structure)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Detected bulge residues: {' '.join(f'{name}{resi}' for name, resi in zip(args.bulge_name, args.bulge_id))}")
+
+    if len(args.bulge_name) != len(args.bulge_id):
+        print("Error: The number of bulge residues and residue IDs must match.")
+        sys.exit(1)
+
+    plumed_file = os.path.join(os.getcwd(), args.output)
+
+    if args.watch:
+        watched = [args.bulge_pdb, args.md_pdb, func_file] + sorted(glob.glob(os.path.join(prototype_path, '*.pdb')))
+        print(f"Watching {', '.join(watched[:2])}, the function file and the prototypes (Ctrl-C to stop).")
+        watch_inputs(watched, lambda: main(args.bulge_pdb, args.md_pdb, args.bulge_id, args.bulge_name, prototype_path,
+                                           func_file, plumed_file, md_index=args.md_index, plumed_options=plumed_options,
+                                           cache=cache, consensus=args.consensus, incremental=True),
+                     args.watch_interval, on_error=lambda e: print(f"Error: {e}"))
+        sys.exit(0)
+
+    results = main(args.bulge_pdb, args.md_pdb, args.bulge_id, args.bulge_name, prototype_path, func_file, plumed_file,
+                   md_index=args.md_index, plumed_options=plumed_options, cache=cache, consensus=args.consensus,
+                   incremental=args.incremental)
+    if args.profile:
+        PROFILER.write_report(args.profile, mode="single", bulge_pdb=args.bulge_pdb, md_pdb=args.md_pdb,
+                              bulges=[{'bulge': result['bulge'], 'model': result['model'], 'cached': result['cached']}
+                                      for result in results])
@@ -0,0 +1,39 @@
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.analyze_trajectory import analyze_trajectory
+from utils.profiling import LOG_LEVELS, configure_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute eta/theta and BulgeFF bias energies for every frame of a trajectory.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        add_help=True
+    )
+
+    parser.add_argument("--plumed", type=str, default="plumed.dat", help="BulgeFF PLUMED file with the torsions and bias functions. Default: plumed.dat")
+    parser.add_argument("--traj", type=str, required=True, help="Trajectory file (XTC/TRR/DCD/multi-model PDB).")
+    parser.add_argument("--top", type=str, default=None, help="Topology/structure of the MD system (e.g., reference.pdb).\nRequired for non-PDB trajectories.")
+    parser.add_argument("--output", type=str, default="bias_analysis.dat", help="Per-frame output table. Default: bias_analysis.dat")
+    parser.add_argument("--chunk", type=int, default=10000, help="Frames per chunk. Default: 10000")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes. Default: 1")
+    parser.add_argument("--temperature", type=float, default=300.0, help="Temperature in K for the reweighting weights. Default: 300")
+    parser.add_argument("--mode", type=str, choices=["biased", "unbiased"], default="biased",
+                        help="biased: trajectory run with the BulgeFF bias, weights exp(+V/kT) recover the unbiased ensemble.\n"
+                             "unbiased: trajectory run without it, weights exp(-V/kT) predict the biased ensemble.\nDefault: biased")
+
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
+
+    summary = analyze_trajectory(args.plumed, args.traj, args.top, args.output, args.chunk, args.workers,
+                                 args.temperature, args.mode)
+    print(f"Analyzed {summary['frames']} frames. Effective sample size: {summary['effective_sample_size']:.1f}")
+    for label, bias in summary['mean_bias'].items():
+        print(f"  <bias_{label}> = {bias:.3f} kJ/mol")
+    print(f"Per-frame results written to {args.output}")
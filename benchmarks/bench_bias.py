@@ -0,0 +1,112 @@
+import sys
+import os
+import time
+import math
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.get_function import read_function_table, compile_function_table
+from utils.fourier import FourierStack, BiasGrid, write_bias_grid
+
+"""
+Compares the per-step cost and the numerical agreement of the three forms of the BulgeFF bias:
+
+- custom: the CUSTOM expression string, compiled once and interpreted at every step (as PLUMED's lepton does);
+- fourier: the compiled coefficient arrays, all bias terms evaluated in one NumPy call per step;
+- grid: the pre-tabulated EXTERNAL grids with cubic Hermite interpolation, all terms interpolated in one call.
+
+Energies and derivatives of the fourier and grid forms are checked against the analytic series on random angles.
+Absolute timings are Python timings and only indicate the relative cost of the forms.
+"""
+
+
+def _time_per_step(step, n_steps):
+    start = time.perf_counter()
+    for i in range(n_steps):
+        step(i)
+    return (time.perf_counter() - start) / n_steps * 1e6
+
+
+def run(func_file, n_terms, n_steps, grid_bins, seed=0):
+    table = read_function_table(func_file)
+    compiled = compile_function_table(func_file)
+    keys = [list(table)[i % len(table)] for i in range(n_terms)]
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(-np.pi, np.pi, (n_steps, n_terms))
+
+    expressions = [compile(table[key], '<bias>', 'eval') for key in keys]
+    namespace = {'cos': math.cos, 'sin': math.sin}
+
+    def custom_step(i):
+        energy = 0.0
+        for expression, x in zip(expressions, angles[i].tolist()):
+            namespace['x'] = x
+            energy += eval(expression, namespace)
+        return energy
+
+    stack = FourierStack([compiled[key] for key in keys])
+
+    def fourier_step(i):
+        energy, derivative = stack.energy_and_derivative(angles[i])
+        return energy.sum()
+
+    with tempfile.TemporaryDirectory() as grid_dir:
+        grids = []
+        for term, key in enumerate(keys):
+            grid_file = os.path.join(grid_dir, f"term{term}.grid")
+            write_bias_grid(grid_file, "x", "bias", compiled[key], grid_bins)
+            grids.append(BiasGrid.read(grid_file))
+
+    stacked_grid = BiasGrid.stack(grids)
+
+    def grid_step(i):
+        energy, derivative = stacked_grid.energy_and_derivative(angles[i])
+        return energy.sum()
+
+    timings = {
+        'custom': _time_per_step(custom_step, n_steps),
+        'fourier': _time_per_step(fourier_step, n_steps),
+        'grid': _time_per_step(grid_step, n_steps),
+    }
+
+    samples = rng.uniform(-np.pi, np.pi, 20000)
+    custom_error = 0.0
+    grid_energy_error = 0.0
+    grid_derivative_error = 0.0
+    for key, expression in zip(keys, expressions):
+        series = compiled[key]
+        energy, derivative = series.energy_and_derivative(samples)
+        reference = np.array([eval(expression, dict(namespace, x=x)) for x in samples[:500].tolist()])
+        custom_error = max(custom_error, float(np.abs(reference - energy[:500]).max()))
+
+        with tempfile.TemporaryDirectory() as grid_dir:
+            grid_file = os.path.join(grid_dir, "term.grid")
+            write_bias_grid(grid_file, "x", "bias", series, grid_bins)
+            grid_energy, grid_derivative = BiasGrid.read(grid_file).energy_and_derivative(samples)
+        grid_energy_error = max(grid_energy_error, float(np.abs(grid_energy - energy).max()))
+        grid_derivative_error = max(grid_derivative_error, float(np.abs(grid_derivative - derivative).max()))
+
+    return timings, {'fourier_vs_custom_energy': custom_error,
+                     'grid_energy': grid_energy_error,
+                     'grid_derivative': grid_derivative_error}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CUSTOM, compiled Fourier and grid bias forms.")
+    parser.add_argument("--func_file", type=str,
+                        default=os.path.join(os.path.dirname(__file__), '..', 'function', 'fix_function.txt'))
+    parser.add_argument("--terms", type=int, nargs='+', default=[2, 20, 100], help="Numbers of bias terms (2 per bulge).")
+    parser.add_argument("--steps", type=int, default=2000, help="Number of MD steps to time.")
+    parser.add_argument("--grid_bins", type=int, default=3600, help="Grid points over [-pi, pi).")
+    args = parser.parse_args()
+
+    print(f"{'terms':>6} {'custom us/step':>15} {'fourier us/step':>16} {'grid us/step':>13}")
+    for n_terms in args.terms:
+        timings, errors = run(args.func_file, n_terms, args.steps, args.grid_bins)
+        print(f"{n_terms:>6} {timings['custom']:>15.2f} {timings['fourier']:>16.2f} {timings['grid']:>13.2f}")
+    print(f"max |E_fourier - E_custom| = {errors['fourier_vs_custom_energy']:.3e} kJ/mol")
+    print(f"max |E_grid - E_fourier|   = {errors['grid_energy']:.3e} kJ/mol ({args.grid_bins} bins)")
+    print(f"max |F_grid - F_fourier|   = {errors['grid_derivative']:.3e} kJ/mol/rad ({args.grid_bins} bins)")
@@ -0,0 +1,66 @@
+import sys
+import os
+import argparse
+import subprocess
+import statistics
+
+"""
+Tracks the startup cost of BulgeFF: the wall time of fresh interpreters importing the library and running the
+CLI, and the slowest top-level modules reported by `python -X importtime`.
+
+Every target runs in a new process `--repeat` times and the median is reported; the bare interpreter start-up
+and `import numpy` are included as the floor that BulgeFF cannot go below.
+"""
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+TARGETS = {
+    'python': ['-c', 'pass'],
+    'numpy': ['-c', 'import numpy'],
+    'utils': ['-c', 'import utils'],
+    'bulgeff': ['-c', 'import bulgeff'],
+    'BulgeFF.py --help': [os.path.join(ROOT_DIR, 'BulgeFF.py'), '--help'],
+}
+
+
+def _wall_time(args):
+    command = [sys.executable, '-c',
+               'import subprocess, sys, time; start = time.perf_counter(); '
+               'subprocess.run(sys.argv[1:], stdout=subprocess.DEVNULL, check=True); '
+               'print(time.perf_counter() - start)',
+               sys.executable] + args
+    output = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    return float(output.stdout) * 1000
+
+
+def import_profile(module, top=10):
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only the direct imports of the module (one nesting level, i.e. three leading spaces).
+        if name.startswith('   ') and not name.startswith('     '):
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run(repeat=5):
+    return {target: statistics.median(_wall_time(args) for _ in range(repeat)) for target, args in TARGETS.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import and CLI start-up time of BulgeFF.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters per target.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest direct imports of utils to list.")
+    args = parser.parse_args()
+
+    print(f"{'target':>20} {'median ms':>10}")
+    for target, milliseconds in run(args.repeat).items():
+        print(f"{target:>20} {milliseconds:>10.1f}")
+
+    print("\nSlowest direct imports of utils (cumulative ms):")
+    for milliseconds, name in import_profile('utils', args.top):
+        print(f"{milliseconds:>10.1f}  {name}")
@@ -0,0 +1,194 @@
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.generate_plumed import generate_plumed
+from utils.profiling import PROFILER
+from benchmarks.synthetic import (ROOT_DIR, BULGE_PDB, MD_PDB, PROTOTYPE_PATH, synthetic_rna, synthetic_md,
+                                  synthetic_ensemble, synthetic_prototype_db)
+
+"""
+Times every pipeline stage on synthetic inputs along four scaling axes, keeps a history of the results and
+fails on regressions.
+
+The axes are varied one at a time around a small base case (1 bulge, 1000 waters, the bundled 28 prototypes,
+a single-model bulge structure):
+- bulges: the number of bulges in the RNA (2jym tiled, see benchmarks.synthetic);
+- waters: the number of SOL molecules in the MD PDB;
+- models: the number of models in the prototype database;
+- ensemble: the number of models in the bulge structure (an NMR-style ensemble of 2jym, one bulge).
+
+Every case runs `--repeat` times through generate_plumed and the fastest time of every stage (as recorded by
+utils.profiling: parse, trinucleotides, atom_ids, pucker, rmsd_search, select, function_lookup, write) and of
+the whole run is kept. The results are appended to the history file (JSON lines) unless `--no_record` is given.
+A stage regresses when it is slower than the median of the last `--window` recorded runs by more than
+`--threshold` (relative) and `--min_delta` seconds (absolute).
+
+Before timing, the 2jym/G6 PLUMED file is generated with the default options and compared byte for byte with
+benchmarks/golden/2jym_plumed.dat. The script exits with status 1 on a golden mismatch or a regression.
+"""
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_FILE = os.path.join(BENCH_DIR, 'golden', '2jym_plumed.dat')
+FUNC_FILE = os.path.join(ROOT_DIR, 'function', 'fix_function.txt')
+
+AXES = {
+    'bulges': [1, 10, 100],
+    'waters': [1000, 10000, 100000],
+    'models': [28, 1000, 10000],
+    'ensemble': [1, 20, 200],
+}
+QUICK_AXES = {
+    'bulges': [1, 10],
+    'waters': [1000, 10000],
+    'models': [28, 1000],
+    'ensemble': [1, 20],
+}
+BASE_CASE = {'bulges': 1, 'waters': 1000, 'models': 28, 'ensemble': 1}
+
+
+def check_golden(golden_file=GOLDEN_FILE):
+    with tempfile.TemporaryDirectory() as output_dir:
+        plumed_file = os.path.join(output_dir, 'plumed.dat')
+        generate_plumed(BULGE_PDB, MD_PDB, [6], ['G'], PROTOTYPE_PATH, FUNC_FILE, plumed_file)
+        with open(plumed_file, 'rb') as file:
+            generated = file.read()
+    with open(golden_file, 'rb') as file:
+        return generated == file.read()
+
+
+def _prepare_case(work_dir, case):
+    name = '_'.join(f"{axis}{value}" for axis, value in sorted(case.items()))
+    case_dir = os.path.join(work_dir, name)
+    os.makedirs(case_dir, exist_ok=True)
+
+    bulge_pdb = os.path.join(case_dir, 'bulge.pdb')
+    if case['ensemble'] > 1:
+        bulges = synthetic_ensemble(bulge_pdb, case['ensemble'])
+    else:
+        bulges = synthetic_rna(bulge_pdb, case['bulges'])
+
+    md_pdb = os.path.join(work_dir, f"md_bulges{case['bulges']}_waters{case['waters']}.pdb")
+    if not os.path.exists(md_pdb):
+        synthetic_md(md_pdb, case['bulges'], case['waters'])
+
+    prototype_path = os.path.join(work_dir, f"prototypes{case['models']}")
+    if not os.path.isdir(prototype_path):
+        synthetic_prototype_db(prototype_path, case['models'])
+    return case_dir, bulge_pdb, md_pdb, prototype_path, bulges
+
+
+def time_case(work_dir, case, repeat=3):
+    case_dir, bulge_pdb, md_pdb, prototype_path, bulges = _prepare_case(work_dir, case)
+    bulge_ids = [resi for _, resi in bulges]
+    bulge_names = [name for name, _ in bulges]
+    plumed_file = os.path.join(case_dir, 'plumed.dat')
+
+    # One untimed run compiles the prototype store and warms the in-process caches.
+    generate_plumed(bulge_pdb, md_pdb, bulge_ids, bulge_names, prototype_path, FUNC_FILE, plumed_file)
+
+    best = {}
+    for _ in range(repeat):
+        PROFILER.reset()
+        start = time.perf_counter()
+        generate_plumed(bulge_pdb, md_pdb, bulge_ids, bulge_names, prototype_path, FUNC_FILE, plumed_file)
+        timings = dict(PROFILER.timings, total=time.perf_counter() - start)
+        for stage, seconds in timings.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+    return {'stages': best, 'counters': dict(PROFILER.counters)}
+
+
+def cases(axes):
+    seen = set()
+    for axis, values in axes.items():
+        for value in values:
+            case = dict(BASE_CASE, **{axis: value})
+            key = tuple(sorted(case.items()))
+            if key not in seen:
+                seen.add(key)
+                yield f"{axis}={value}", case
+
+
+def read_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def find_regressions(results, history, window=5, threshold=0.25, min_delta=0.002):
+    regressions = []
+    for name, result in results.items():
+        previous = [record['results'][name]['stages'] for record in history if name in record['results']][-window:]
+        for stage, seconds in result['stages'].items():
+            baseline = [stages[stage] for stages in previous if stage in stages]
+            if not baseline:
+                continue
+            reference = statistics.median(baseline)
+            if seconds > reference * (1 + threshold) and seconds - reference > min_delta:
+                regressions.append((name, stage, reference, seconds))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(axes, repeat=3, work_dir=None):
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='bulgeff_bench_')
+    try:
+        return {name: time_case(work_dir, case, repeat) for name, case in cases(axes)}
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the BulgeFF pipeline stages on synthetic inputs.")
+    parser.add_argument("--quick", action="store_true", help="Use the smaller values of every axis.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the fastest is kept.")
+    parser.add_argument("--history", type=str, default=os.path.join(BENCH_DIR, 'history.jsonl'),
+                        help="JSON-lines file the results are appended to and compared with.")
+    parser.add_argument("--no_record", action="store_true", help="Compare with the history without appending to it.")
+    parser.add_argument("--window", type=int, default=5, help="Number of previous runs the baseline is taken from.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown of a stage.")
+    parser.add_argument("--min_delta", type=float, default=0.002, help="Allowed absolute slowdown of a stage in seconds.")
+    parser.add_argument("--work_dir", type=str, default=None, help="Keep the synthetic inputs in this directory.")
+    args = parser.parse_args()
+
+    golden_ok = check_golden()
+    print(f"golden 2jym plumed.dat: {'identical' if golden_ok else 'DIFFERENT'}")
+
+    results = run(QUICK_AXES if args.quick else AXES, args.repeat, args.work_dir)
+    stages = sorted({stage for result in results.values() for stage in result['stages']},
+                    key=lambda stage: (stage == 'total', stage))
+    print(f"{'case':>14} " + ' '.join(f"{stage[:12]:>12}" for stage in stages) + "   (ms)")
+    for name, result in results.items():
+        print(f"{name:>14} " + ' '.join(f"{result['stages'].get(stage, 0.0) * 1000:>12.2f}" for stage in stages))
+
+    history = read_history(args.history)
+    regressions = find_regressions(results, history, args.window, args.threshold, args.min_delta)
+    for name, stage, reference, seconds in regressions:
+        print(f"REGRESSION {name} {stage}: {reference * 1000:.2f} ms -> {seconds * 1000:.2f} ms")
+
+    if not args.no_record:
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': _git_commit(), 'python': platform.python_version(),
+                  'machine': platform.machine(), 'quick': args.quick, 'results': results}
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+    sys.exit(0 if golden_ok and not regressions else 1)
@@ -0,0 +1,127 @@
+import os
+import glob
+import numpy as np
+
+"""
+Builds synthetic BulgeFF inputs of any size from the bundled 2jym example and prototype database.
+
+- `synthetic_rna(bulge_pdb, n_bulges)`: The 22-nt 2jym duplex (bulge G6) tiled `n_bulges` times along x into one
+  chain, residues renumbered consecutively, so the structure has a bulge G(6 + 22k) in every copy.
+- `synthetic_md(md_pdb, n_copies, n_waters)`: The RNA of reference.pdb tiled the same way, followed by `n_waters`
+  SOL molecules cycled from its solvent. Atom serials wrap at 100000 and residue numbers at 10000 as in GROMACS.
+- `synthetic_ensemble(bulge_pdb, n_models)`: 2jym written as an NMR-style ensemble of `n_models` MODEL records,
+  the first model unchanged and the others with Gaussian noise on every coordinate.
+- `synthetic_prototype_db(prototype_dir, n_models)`: The bundled prototype files padded to `n_models` models in
+  total with copies whose coordinates carry Gaussian noise, numbered after the original models.
+
+Every function writes its files and returns the residue list, the path or the directory it created.
+"""
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BULGE_PDB = os.path.join(ROOT_DIR, '2jym.pdb')
+MD_PDB = os.path.join(ROOT_DIR, 'reference.pdb')
+PROTOTYPE_PATH = os.path.join(ROOT_DIR, 'prototype_db')
+
+TILE_SHIFT = 80.0
+N_RESIDUES = 22
+BULGE = ('G', 6)
+
+
+def _atom_lines(pdb_file, keep):
+    with open(pdb_file, 'r') as file:
+        return [line.rstrip('\n') for line in file if line.startswith('ATOM') and keep(line)]
+
+
+def _shifted(line, serial, resid, shift):
+    x = float(line[30:38]) + shift
+    return f"{line[:6]}{serial % 100000:5d}{line[11:22]}{resid % 10000:4d}{line[26:30]}{x:8.3f}{line[38:]}\n"
+
+
+def synthetic_rna(bulge_pdb, n_bulges, source=BULGE_PDB):
+    lines = _atom_lines(source, lambda line: True)
+    with open(bulge_pdb, 'w') as file:
+        serial = 0
+        for copy in range(n_bulges):
+            for line in lines:
+                serial += 1
+                file.write(_shifted(line, serial, int(line[22:26]) + copy * N_RESIDUES, copy * TILE_SHIFT))
+        file.write("END\n")
+    return [(BULGE[0], BULGE[1] + copy * N_RESIDUES) for copy in range(n_bulges)]
+
+
+def synthetic_md(md_pdb, n_copies, n_waters, source=MD_PDB):
+    rna = _atom_lines(source, lambda line: line[17:20].strip() not in ('SOL', 'NA', 'CL'))
+    water = _atom_lines(source, lambda line: line[17:20].strip() == 'SOL')
+    molecules = [water[k:k + 3] for k in range(0, len(water) - 2, 3)]
+    with open(md_pdb, 'w') as file:
+        file.write("TITLE     Synthetic BulgeFF benchmark system\n")
+        serial = 0
+        for copy in range(n_copies):
+            for line in rna:
+                serial += 1
+                file.write(_shifted(line, serial, int(line[22:26]) + copy * N_RESIDUES, copy * TILE_SHIFT))
+        resid = n_copies * N_RESIDUES
+        for k in range(n_waters):
+            resid += 1
+            shift = (k // len(molecules)) * TILE_SHIFT
+            for line in molecules[k % len(molecules)]:
+                serial += 1
+                file.write(_shifted(line, serial, resid, shift))
+        file.write("TER\nENDMDL\n")
+    return md_pdb
+
+
+def synthetic_ensemble(bulge_pdb, n_models, source=BULGE_PDB, noise=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = _atom_lines(source, lambda line: True)
+    with open(bulge_pdb, 'w') as file:
+        for model in range(1, n_models + 1):
+            offsets = rng.normal(0.0, noise if model > 1 else 0.0, (len(lines), 3))
+            file.write(f"MODEL     {model:4d}\n")
+            for line, (dx, dy, dz) in zip(lines, offsets):
+                file.write(f"{line[:30]}{float(line[30:38]) + dx:8.3f}{float(line[38:46]) + dy:8.3f}"
+                           f"{float(line[46:54]) + dz:8.3f}{line[54:]}\n")
+            file.write("ENDMDL\n")
+        file.write("END\n")
+    return [BULGE]
+
+
+def _models(prototype_file):
+    models = []
+    with open(prototype_file, 'r') as file:
+        for line in file:
+            if line.startswith('MODEL'):
+                models.append([int(line.split()[1]), []])
+            elif line.startswith('ATOM') and models:
+                models[-1][1].append(line.rstrip('\n'))
+    return models
+
+
+def synthetic_prototype_db(prototype_dir, n_models, source=PROTOTYPE_PATH, noise=0.8, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(prototype_dir, exist_ok=True)
+    files = sorted(glob.glob(os.path.join(source, '*.pdb')))
+    originals = {path: _models(path) for path in files}
+    n_original = sum(len(models) for models in originals.values())
+    next_index = max(index for models in originals.values() for index, _ in models) + 1
+
+    # Share the extra models between the classes in proportion to their size.
+    n_extra_total = max(n_models - n_original, 0)
+    shares = [n_extra_total * len(originals[path]) // n_original for path in files]
+    shares[-1] += n_extra_total - sum(shares)
+
+    for path, n_extra in zip(files, shares):
+        models = originals[path]
+        with open(os.path.join(prototype_dir, os.path.basename(path)), 'w') as file:
+            for index, lines in models:
+                file.write(f"MODEL     {index:4d}\n" + '\n'.join(lines) + "\nENDMDL\n")
+            for k in range(n_extra):
+                _, lines = models[k % len(models)]
+                offsets = rng.normal(0.0, noise, (len(lines), 3))
+                file.write(f"MODEL     {next_index:4d}\n")
+                for line, (dx, dy, dz) in zip(lines, offsets):
+                    file.write(f"{line[:30]}{float(line[30:38]) + dx:8.3f}{float(line[38:46]) + dy:8.3f}"
+                               f"{float(line[46:54]) + dz:8.3f}{line[54:]}\n")
+                file.write("ENDMDL\n")
+                next_index += 1
+    return prototype_dir
@@ -0,0 +1,46 @@
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.build_prototypes import build_prototypes
+from utils.profiling import PROFILER, LOG_LEVELS, configure_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build a BulgeFF prototype database by clustering the bulge trinucleotides of a structure collection.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        add_help=True
+    )
+
+    parser.add_argument("--structures", type=str, required=True, help="Directory with the PDB/mmCIF structures (searched recursively).")
+    parser.add_argument("--output", type=str, default="prototype_db_built", help="Directory the prototype files are written to.\nDefault: prototype_db_built")
+    parser.add_argument("--cutoff", type=float, default=1.0, help="RMSD cutoff in Å for neighbours in a cluster. Default: 1.0")
+    parser.add_argument("--min_size", type=int, default=2, help="Smallest cluster that becomes a prototype. Default: 2")
+    parser.add_argument("--max_prototypes", type=int, default=None, help="Largest number of prototypes per pucker class.\nDefault: no limit")
+    parser.add_argument("--max_size", type=int, default=1, help="Largest number of consecutive unpaired residues counted\nas a bulge. Default: 1")
+    parser.add_argument("--block", type=int, default=1024, help="Fragments per block of the RMSD matrix. Default: 1024")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes. Default: 1")
+    parser.add_argument("--profile", type=str, default=None, help="Write the stage timings and counters to this JSON file.")
+
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
+
+    try:
+        summary = build_prototypes(args.structures, args.output, args.cutoff, args.min_size, args.max_prototypes,
+                                   args.max_size, args.block, args.workers)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Scanned {summary['files']} files: {summary['fragments']} bulge trinucleotides.")
+    for sugar, counts in summary['classes'].items():
+        print(f"  {sugar}: {counts['fragments']} fragments, {counts['pairs']} pairs within {args.cutoff} Å, "
+              f"{counts['clusters']} clusters, {counts['prototypes']} prototypes")
+    print(f"Prototypes written to {args.output}")
+    if args.profile:
+        PROFILER.write_report(args.profile)
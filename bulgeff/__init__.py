@@ -0,0 +1,10 @@
+from .api import generate, BulgeFFResult, PROTOTYPE_PATH, FUNC_FILE
+from .client import BulgeFFClient
+
+__all__ = [
+    'generate',
+    'BulgeFFResult',
+    'PROTOTYPE_PATH',
+    'FUNC_FILE',
+    'BulgeFFClient'
+]
@@ -0,0 +1,99 @@
+import os
+import re
+from utils.cache import ResultCache
+from utils.find_bulges import find_bulges, bulge_residue_ids
+from utils.read_structure import as_structure
+from utils.generate_plumed import generate_plumed
+
+"""
+In-process library API of BulgeFF.
+
+`generate` runs the same pipeline as BulgeFF.py without spawning Python: it assigns a prototype to every
+bulge, writes the PLUMED file and returns a BulgeFFResult. The bundled prototype database and function file
+are used unless other ones are given.
+
+Parameters:
+- bulge_pdb (str or Structure): The bulge structure.
+- md_pdb (str or Structure): The MD structure used for the atom IDs.
+- bulges (list, optional): The bulges as (resname, resid) pairs or strings such as "G6". None detects them
+  from the base pairs of `bulge_pdb` (see find_bulges). Default: None.
+- plumed_file (str): The path of the PLUMED file to write. Default: plumed.dat.
+- max_bulge_size (int): The largest unpaired run treated as a bulge when detecting bulges. Default: 1.
+- prototype_path (str), func_file (str): The prototype database and function file.
+- md_index (bool): Whether to keep a residue offset index next to the MD PDB.
+- cache (bool, str or ResultCache, optional): True uses the default result cache, a string a cache directory.
+  Default: None (no cache).
+- consensus (str): The consensus mode for a multi-model `bulge_pdb`, 'majority' or 'mean_rmsd'. Default: 'majority'.
+- **plumed_options: Extra keyword arguments for write_plumed (bias_mode, grid_bins, layout, print_stride, ...).
+
+Returns:
+- result (BulgeFFResult): `result.plumed_file`, `result.bulges` (one dict per bulge with keys `bulge`, `sugar`,
+  `model`, `model_type`, `eta`, `theta`, `message`, `cached`, and `agreement`/`ensemble` for multi-model
+  structures), `result.assigned`, `result.unassigned` and
+  `result.plumed_text()`.
+"""
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROTOTYPE_PATH = os.path.join(ROOT_DIR, 'prototype_db')
+FUNC_FILE = os.path.join(ROOT_DIR, 'function', 'fix_function.txt')
+
+_BULGE = re.compile(r"^([A-Za-z]+)(-?\d+)$")
+
+
+class BulgeFFResult:
+    def __init__(self, plumed_file, bulges):
+        self.plumed_file = plumed_file
+        self.bulges = bulges
+
+    @property
+    def assigned(self):
+        return [bulge for bulge in self.bulges if bulge['model_type'] is not None]
+
+    @property
+    def unassigned(self):
+        return [bulge for bulge in self.bulges if bulge['model_type'] is None]
+
+    def plumed_text(self):
+        with open(self.plumed_file, 'r') as file:
+            return file.read()
+
+    def __repr__(self):
+        return f"<BulgeFFResult {self.plumed_file}: {len(self.assigned)} of {len(self.bulges)} bulges assigned>"
+
+
+def _parse_bulges(bulges):
+    names, ids = [], []
+    for bulge in bulges:
+        if isinstance(bulge, str):
+            match = _BULGE.match(bulge.strip())
+            if match is None:
+                raise ValueError(f"Invalid bulge '{bulge}'. Expected a residue name followed by its number, e.g. G6.")
+            name, resi = match.group(1), match.group(2)
+        else:
+            name, resi = bulge
+        names.append(str(name))
+        ids.append(int(resi))
+    return names, ids
+
+
+def _result_cache(cache):
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return ResultCache()
+    if isinstance(cache, str):
+        return ResultCache(cache)
+    return cache
+
+
+def generate(bulge_pdb, md_pdb, bulges=None, plumed_file='plumed.dat', max_bulge_size=1, prototype_path=PROTOTYPE_PATH,
+             func_file=FUNC_FILE, md_index=False, cache=None, consensus='majority', **plumed_options):
+    if bulges is None:
+        bulge_pdb = as_structure(bulge_pdb)
+        bulges = list(zip(*bulge_residue_ids(find_bulges(bulge_pdb, max_size=max_bulge_size), bulge_pdb)))
+    bulge_names, bulge_ids = _parse_bulges(bulges)
+
+    results = generate_plumed(bulge_pdb, md_pdb, bulge_ids, bulge_names, prototype_path, func_file, plumed_file,
+                              md_index=md_index, plumed_options=plumed_options, cache=_result_cache(cache),
+                              consensus=consensus)
+    return BulgeFFResult(plumed_file, results)
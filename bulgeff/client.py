@@ -0,0 +1,74 @@
+import os
+import json
+import socket
+import itertools
+from utils.server import parse_address
+from bulgeff.api import _parse_bulges
+
+"""
+Client of the resident BulgeFF server (see serve.py and utils.server).
+
+`BulgeFFClient` keeps one connection open and sends requests one at a time. Paths are made absolute before
+they are sent, since the server resolves them against its own working directory.
+
+Parameters:
+- address (str): The Unix socket path or host:port of the server. Default: bulgeff.sock.
+- timeout (float, optional): The socket timeout in seconds. Default: None (wait indefinitely).
+
+Returns:
+- client (BulgeFFClient): `client.generate(bulge_pdb, md_pdb, bulges=None, plumed_file=None, **options)`, with
+  `bulges` as in bulgeff.generate (None detects them), returns
+  the server response (a dict with `status`, `bulges`, `files` or `plumed_file`, `message` and `elapsed_ms`);
+  `client.ping()` and `client.stats()` check the server.
+"""
+
+DEFAULT_ADDRESS = 'bulgeff.sock'
+
+
+class BulgeFFClient:
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=None):
+        host, port = parse_address(address)
+        if port is None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(host)
+        else:
+            self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.socket.makefile('rb')
+        self.ids = itertools.count()
+
+    def request(self, request):
+        request = dict(request, id=next(self.ids))
+        self.socket.sendall((json.dumps(request) + '\n').encode())
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The BulgeFF server closed the connection.")
+        return json.loads(line)
+
+    def ping(self):
+        return self.request({'op': 'ping'})
+
+    def stats(self):
+        return self.request({'op': 'stats'})
+
+    def generate(self, bulge_pdb, md_pdb, bulges=None, plumed_file=None, md_index=False, cache=True, consensus='majority',
+                 **options):
+        request = {'bulge_pdb': os.path.abspath(bulge_pdb), 'md_pdb': os.path.abspath(md_pdb), 'md_index': md_index,
+                   'cache': cache, 'consensus': consensus, 'options': options}
+        if bulges is None:
+            request['auto_bulge'] = True
+        else:
+            request['bulge_name'], request['bulge_id'] = _parse_bulges(bulges)
+        if plumed_file is not None:
+            request['plumed_file'] = os.path.abspath(plumed_file)
+        return self.request(request)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
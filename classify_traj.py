@@ -0,0 +1,49 @@
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.classify_trajectory import classify_trajectory, bulges_from_plumed
+from utils.profiling import LOG_LEVELS, configure_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Assign every trajectory frame of every bulge to its closest BulgeFF prototype.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        add_help=True
+    )
+
+    parser.add_argument("--traj", type=str, required=True, help="Trajectory file (XTC/TRR/DCD/multi-model PDB).")
+    parser.add_argument("--top", type=str, default=None, help="Structure of the MD system (e.g., reference.pdb).\nRequired for non-PDB trajectories.")
+    parser.add_argument("--plumed", type=str, default="plumed.dat", help="BulgeFF PLUMED file the bulges are taken from\nunless --bulge_name/--bulge_id are given. Default: plumed.dat")
+    parser.add_argument("--bulge_name", type=str, nargs='+', default=None, help="List of bulge residue names.")
+    parser.add_argument("--bulge_id", type=int, nargs='+', default=None, help="List of bulge residue IDs.")
+    parser.add_argument("--output", type=str, default="prototype_states.dat", help="Per-frame state table. Default: prototype_states.dat")
+    parser.add_argument("--populations", type=str, default="prototype_populations.dat", help="Population table. Default: prototype_populations.dat")
+    parser.add_argument("--chunk", type=int, default=10000, help="Frames per chunk. Default: 10000")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes. Default: 1")
+
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
+
+    if args.bulge_name or args.bulge_id:
+        if not args.bulge_name or not args.bulge_id or len(args.bulge_name) != len(args.bulge_id):
+            print("Error: The number of bulge residues and residue IDs must match.")
+            sys.exit(1)
+        bulges = list(zip(args.bulge_name, args.bulge_id))
+    else:
+        bulges = bulges_from_plumed(args.plumed)
+
+    prototype_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prototype_db')
+    summary = classify_trajectory(args.traj, args.top, bulges, prototype_path, args.output, args.populations,
+                                  args.chunk, args.workers)
+    print(f"Classified {summary['frames']} frames.")
+    for label, populations in summary['populations'].items():
+        top = sorted(populations.items(), key=lambda item: -item[1])[:3]
+        print(f"  {label}: " + ', '.join(f"{'none' if state is None else f'model{state[1]} ({state[0]})'} {fraction:.1%}"
+                                        for state, fraction in top))
+    print(f"Per-frame states written to {args.output}, populations to {args.populations}")
@@ -0,0 +1,51 @@
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.fit_functions import fit_functions, TorsionHistograms
+from utils.profiling import LOG_LEVELS, configure_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fit the BulgeFF eta/theta correction functions from reference and simulated trajectories.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        add_help=True
+    )
+
+    parser.add_argument("--manifest", type=str, default=None, help="CSV or JSON-lines manifest of the trajectories with the fields\nsugar_type, prototype, role (reference/simulated), trajectory,\nbulge_name, bulge_id and optionally topology.")
+    parser.add_argument("--output", type=str, default="fix_function_fitted.txt", help="Function file to write. Default: fix_function_fitted.txt")
+    parser.add_argument("--histograms", type=str, default=None, help="Histogram file (.npz) to add the trajectories to and to save\nthe updated counts in. Without --manifest the saved counts are refitted.")
+    parser.add_argument("--base", type=str, default=None, help="Function file whose functions are kept for the prototypes\nthat are not fitted (e.g., function/fix_function.txt).")
+    parser.add_argument("--bins", type=int, default=72, help="Histogram bins over [-pi, pi) for new histograms. Default: 72")
+    parser.add_argument("--order", type=int, default=5, help="Number of Fourier orders. Default: 5")
+    parser.add_argument("--temperature", type=float, default=300.0, help="Temperature in K. Default: 300")
+    parser.add_argument("--pseudocount", type=float, default=0.5, help="Count added to every histogram bin. Default: 0.5")
+    parser.add_argument("--chunk", type=int, default=10000, help="Frames per chunk. Default: 10000")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes. Default: 1")
+
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
+
+    if not args.manifest and not (args.histograms and os.path.exists(args.histograms)):
+        print("Error: Provide --manifest or an existing --histograms file.")
+        sys.exit(1)
+
+    histograms = None
+    if args.histograms and os.path.exists(args.histograms):
+        histograms = TorsionHistograms.load(args.histograms)
+
+    summary = fit_functions(args.manifest, args.output, histograms, args.bins, args.order, args.temperature,
+                            args.pseudocount, args.chunk, args.workers, args.base)
+    if args.histograms:
+        summary['histograms'].save(args.histograms)
+
+    print(f"Read {summary['frames']} frames; fitted {len(summary['fits'])} functions.")
+    for (sugar_type, prototype, dihedral), fit in summary['fits'].items():
+        print(f"  {sugar_type} {prototype} {dihedral}: {fit['reference_samples']} reference / "
+              f"{fit['simulated_samples']} simulated samples, RMS residual {fit['rms_residual']:.3f} kJ/mol")
+    print(f"Functions written to {args.output}")
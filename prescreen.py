@@ -0,0 +1,84 @@
+import sys
+import os
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.prescreen import prescreen, SAMPLERS
+from utils.find_bulges import find_bulges, bulge_residue_ids
+from utils.read_structure import read_structure
+from utils.ensemble import CONSENSUS_MODES
+from utils.profiling import PROFILER, LOG_LEVELS, configure_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Predict the eta/theta population shift of every bulge under its BulgeFF correction without MD.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        add_help=True
+    )
+
+    parser.add_argument("--bulge_pdb", type=str, default="2jym.pdb", help="Bulge structure (PDB, mmCIF or .gro). Default: 2jym.pdb")
+    parser.add_argument("--bulge_name", type=str, nargs='+', default=["G"], help="List of bulge residue names. Default: G")
+    parser.add_argument("--bulge_id", type=int, nargs='+', default=[6], help="List of bulge residue IDs. Default: 6")
+    parser.add_argument("--auto_bulge", action="store_true", help="Detect bulge residues from the base pairs of --bulge_pdb\ninstead of using --bulge_name/--bulge_id.")
+    parser.add_argument("--max_bulge_size", type=int, default=1, help="Largest number of consecutive unpaired residues treated as a bulge\nby --auto_bulge. Default: 1")
+    parser.add_argument("--output", type=str, default="prescreen.dat", help="Population table. Default: prescreen.dat")
+    parser.add_argument("--baseline", type=str, default=None, help="Histogram file (.npz) of fit_functions.py whose simulated counts\ngive the unbiased landscape. Default: flat (the bias alone)")
+    parser.add_argument("--sampler", type=str, choices=SAMPLERS, default="mc", help="mc: Metropolis Monte Carlo.\nlangevin: overdamped Langevin dynamics.\nDefault: mc")
+    parser.add_argument("--walkers", type=int, default=4096, help="Walkers per landscape. Default: 4096")
+    parser.add_argument("--steps", type=int, default=2000, help="Steps per walker. Default: 2000")
+    parser.add_argument("--step_size", type=float, default=10.0, help="Step size in degrees. Default: 10")
+    parser.add_argument("--window", type=float, default=30.0, help="Half-width in degrees of the window around the prototype's\neta/theta counted as its population. Default: 30")
+    parser.add_argument("--grid", type=int, default=360, help="Grid points per torsion over [-pi, pi). Default: 360")
+    parser.add_argument("--temperature", type=float, default=300.0, help="Temperature in K. Default: 300")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed.")
+    parser.add_argument("--consensus", type=str, choices=CONSENSUS_MODES, default="majority", help="How a multi-model --bulge_pdb (NMR ensemble) is assigned. Default: majority")
+    parser.add_argument("--surface_dir", type=str, default=None, help="Directory of the cached surfaces.\nDefault: $BULGEFF_CACHE_DIR/surfaces or ~/.cache/bulgeff/surfaces")
+    parser.add_argument("--profile", type=str, default=None, help="Write the stage timings and counters to this JSON file.")
+
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
+
+    if args.auto_bulge:
+        bulge_structure = read_structure(args.bulge_pdb)
+        bulges = find_bulges(bulge_structure, max_size=args.max_bulge_size)
+        if not bulges:
+            print(f"No bulge residues found in {args.bulge_pdb}.")
+            sys.exit(1)
+        try:
+            args.bulge_name, args.bulge_id = bulge_residue_ids(bulges, bulge_structure)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    if len(args.bulge_name) != len(args.bulge_id):
+        print("Error: The number of bulge residues and residue IDs must match.")
+        sys.exit(1)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    prototype_path = os.path.join(script_dir, 'prototype_db')
+    func_file = os.path.join(script_dir, 'function', 'fix_function.txt')
+
+    try:
+        results = prescreen(args.bulge_pdb, args.bulge_id, args.bulge_name, prototype_path, func_file, args.output,
+                            args.baseline, args.grid, args.walkers, args.steps, args.sampler, args.step_size,
+                            args.window, args.temperature, seed=args.seed, surface_dir=args.surface_dir,
+                            consensus=args.consensus)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    for result in results:
+        if result['model_type'] is None:
+            print(f"  {result['bulge']}: {result['message']}")
+            continue
+        eta, theta = result['prototype']
+        print(f"  {result['bulge']} -> {result['model']} ({result['model_type']}, eta {eta:.0f}, theta {theta:.0f}): "
+              f"population {result['baseline']['population']:.1%} -> {result['biased']['population']:.1%} "
+              f"({result['shift']:+.1%})")
+    print(f"Populations written to {args.output}")
+    if args.profile:
+        PROFILER.write_report(args.profile)
@@ -0,0 +1,41 @@
+import sys
+import os
+import asyncio
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.server import BulgeFFServer
+from utils.profiling import LOG_LEVELS, configure_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run BulgeFF as a resident server answering JSON-lines requests.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        add_help=True
+    )
+
+    parser.add_argument("--address", type=str, default="bulgeff.sock", help="Unix socket path, or localhost host:port for a TCP server\n(127.0.0.1, ::1 or localhost, e.g., 127.0.0.1:8765).\nDefault: bulgeff.sock")
+    parser.add_argument("--output_root", type=str, default=None, help="Directory the server may write PLUMED, grid and index files to.\nDefault: the working directory")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes. Default: 2")
+    parser.add_argument("--structure_cache", type=int, default=16, help="Number of parsed structures kept in memory per worker. Default: 16")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory of a prototype assignment cache shared by the workers.\nDefault: no result cache")
+
+    parser.add_argument("--log_level", type=str.upper, choices=LOG_LEVELS, default="INFO", help="Level of the messages written to the log file. Default: INFO")
+    parser.add_argument("--log_file", type=str, default="BulgeFix.log", help="Log file. Default: BulgeFix.log")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_file)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    prototype_path = os.path.join(script_dir, 'prototype_db')
+    func_file = os.path.join(script_dir, 'function', 'fix_function.txt')
+
+    try:
+        server = BulgeFFServer(args.address, prototype_path, func_file, workers=args.workers,
+                               structure_cache=args.structure_cache, cache_dir=args.cache_dir,
+                               output_root=args.output_root)
+        asyncio.run(server.serve(ready=lambda: print(f"BulgeFF server listening on {args.address}", flush=True)))
+    except (ValueError, FileExistsError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -1,19 +1,58 @@
-from .get_pdb_info import get_pdb_info
-from .get_atom_id import get_atom_id
-from .get_trinucleotides import get_trinucleotides
-from .get_prototype import get_prototype
-from .calc_rmsd import calc_rmsd
-from .sugar_type import sugar_type
-from .get_function import get_function
-from .write_plumed import write_plumed
-
-__all__ = [
-    'get_pdb_info',
-    'get_atom_id',
-    'get_trinucleotides',
-    'get_prototype',
-    'get_function',
-    'calc_rmsd',
-    'sugar_type',
-    'write_plumed'
-]
\ No newline at end of file
+import sys
+import types
+import importlib
+
+# Submodules are imported on first access, so `import utils` or importing one submodule does not load the rest
+# (MDAnalysis, the batch and server machinery, ...).
+_EXPORTS = {
+    'get_pdb_info': 'get_pdb_info',
+    'read_structure': 'read_structure',
+    'Structure': 'read_structure',
+    'get_atom_id': 'get_atom_id',
+    'get_trinucleotides': 'get_trinucleotides',
+    'get_prototype': 'get_prototype',
+    'search_prototypes': 'search_prototypes',
+    'get_function': 'get_function',
+    'calc_rmsd': 'calc_rmsd',
+    'sugar_type': 'sugar_type',
+    'sugar_types': 'sugar_type',
+    'write_plumed': 'write_plumed',
+    'generate_plumed': 'generate_plumed',
+    'find_bulges': 'find_bulges',
+    'read_plumed': 'read_plumed',
+    'analyze_trajectory': 'analyze_trajectory',
+    'classify_trajectory': 'classify_trajectory',
+    'fit_functions': 'fit_functions',
+    'build_prototypes': 'build_prototypes',
+    'prescreen': 'prescreen',
+    'run_batch': 'batch',
+    'ResultCache': 'cache',
+    'assign_ensemble': 'ensemble'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _LazyPackage(types.ModuleType):
+    def __setattr__(self, name, value):
+        # The import system binds every loaded submodule on its package, which would shadow the exported function
+        # of the same name (utils.read_structure the module instead of the function); those are resolved by
+        # __getattr__ instead.
+        if name in _EXPORTS and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _LazyPackage
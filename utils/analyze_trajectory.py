@@ -0,0 +1,100 @@
+from utils.read_plumed import read_plumed, bias_function
+from utils.torsions import dihedral
+from utils.trajectory import open_trajectory, frame_chunks, ordered_map
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Computes the eta/theta pseudo-torsions and the BulgeFF bias energy for every frame of a trajectory.
+
+The torsions and bias functions are read from the PLUMED file used (or to be used) for the simulation. Frames
+are streamed in chunks of `chunk_size`, so memory stays bounded for any trajectory length, and chunks are
+spread over `workers` processes. Every chunk computes all torsions with one vectorized dihedral call.
+
+The per-frame output table has the columns frame, time, every torsion (radians), every bias term, the total
+bias (kJ/mol) and the log reweighting weight. For a trajectory run with the bias (`mode='biased'`) the
+weight is exp(+V/kT), which recovers the unbiased ensemble; for an unbiased trajectory (`mode='unbiased'`) it
+is exp(-V/kT), which predicts the biased ensemble. Weights are reported as logarithms and are not normalized.
+
+Parameters:
+- plumed_file (str): The BulgeFF PLUMED file.
+- trajectory (str): The trajectory (XTC/TRR/DCD/multi-model PDB, ...).
+- topology (str, optional): The MD structure (e.g., reference.pdb); required for non-PDB trajectories.
+- output (str): The per-frame output table.
+- chunk_size (int): The number of frames per chunk. Default: 10000.
+- workers (int): The number of worker processes. Default: 1.
+- temperature (float): The temperature in K used for kT. Default: 300.
+- mode (str): 'biased' or 'unbiased'. Default: 'biased'.
+
+Returns:
+- summary (dict): The number of frames, the mean bias of each term and the effective sample size of the weights.
+"""
+
+BOLTZMANN = 0.0083144626  # kJ/mol/K, PLUMED's default energy unit
+
+
+def _analyze_chunk(trajectory, topology, start, stop, atom_indices, functions, log_weight_scale):
+    reader = open_trajectory(trajectory, topology)
+    flat = atom_indices.reshape(-1)
+    frames, times, coords = reader.read(start, stop, flat)
+    coords = coords.reshape(len(frames), len(atom_indices), 4, 3)
+
+    angles = dihedral(coords[:, :, 0], coords[:, :, 1], coords[:, :, 2], coords[:, :, 3])
+    bias = np.column_stack([series(angles[:, term]) for term, series in enumerate(functions)])
+    total = bias.sum(axis=1)
+    return frames, times, angles, bias, total, log_weight_scale * total
+
+
+def analyze_trajectory(plumed_file, trajectory, topology=None, output='bias_analysis.dat', chunk_size=10000,
+                       workers=1, temperature=300.0, mode='biased'):
+    if mode not in ('biased', 'unbiased'):
+        raise ValueError(f"Unknown mode: {mode}. Valid modes are 'biased' and 'unbiased'.")
+
+    terms = read_plumed(plumed_file)
+    if not terms:
+        error_msg = f"No biased torsions found in {plumed_file}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    atom_indices = np.array([term['atoms'] for term in terms], dtype=np.int64) - 1
+    functions = [bias_function(term) for term in terms]
+    kT = BOLTZMANN * temperature
+    log_weight_scale = (1.0 if mode == 'biased' else -1.0) / kT
+
+    n_frames = open_trajectory(trajectory, topology).n_frames
+    tasks = ((trajectory, topology, start, stop, atom_indices, functions, log_weight_scale)
+             for start, stop in frame_chunks(n_frames, chunk_size))
+
+    labels = [term['label'] for term in terms]
+    header = ' '.join(['frame', 'time'] + labels + [f"bias_{label}" for label in labels] + ['bias_total', 'logweight'])
+
+    frames_done = 0
+    bias_sum = np.zeros(len(terms))
+    log_max = -np.inf
+    weight_sum = 0.0
+    weight_sq_sum = 0.0
+    with open(output, 'w') as file:
+        file.write(f"# {header}\n")
+        for frames, times, angles, bias, total, log_weight in ordered_map(_analyze_chunk, tasks, workers):
+            table = np.column_stack([frames, times, angles, bias, total, log_weight])
+            np.savetxt(file, table, fmt=['%d'] + ['%.6f'] * (table.shape[1] - 1))
+
+            frames_done += len(frames)
+            bias_sum += bias.sum(axis=0)
+            if len(log_weight):
+                # Running sums of w and w^2 relative to the largest log weight seen so far.
+                new_max = max(log_max, float(log_weight.max()))
+                weight_sum = weight_sum * np.exp(log_max - new_max) + np.exp(log_weight - new_max).sum()
+                weight_sq_sum = weight_sq_sum * np.exp(2 * (log_max - new_max)) + np.exp(2 * (log_weight - new_max)).sum()
+                log_max = new_max
+
+    summary = {
+        'frames': frames_done,
+        'mean_bias': dict(zip(labels, (bias_sum / max(frames_done, 1)).tolist())),
+        'effective_sample_size': weight_sum ** 2 / weight_sq_sum if weight_sq_sum > 0 else 0.0
+    }
+    logger.info(f"Analyzed {frames_done} frames of {trajectory}: effective sample size "
+                 f"{summary['effective_sample_size']:.1f}. Output: {output}")
+    return summary
@@ -0,0 +1,154 @@
+import os
+import csv
+import json
+import traceback
+import logging
+from utils.generate_plumed import generate_plumed
+from utils.get_function import read_function_table
+from utils.prototype_db import load_prototype_db
+from utils.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+"""
+Runs BulgeFF for every job listed in a manifest, fanning the jobs out over a process pool.
+
+The manifest is either a CSV file with a header row or a JSON-lines file (`.jsonl`/`.json`). Every job has the
+fields `bulge_pdb`, `md_pdb`, `bulge_name`, `bulge_id` and `output_dir`, plus the optional fields `job`
+(a label, defaults to the line number) and `plumed_file` (defaults to plumed.dat). In CSV manifests the
+residue lists are separated by spaces or semicolons. Relative paths are resolved against the manifest directory.
+
+The prototype database and the function table are loaded before the pool starts, so forked workers share them;
+each worker also warms its own copy in its initializer. A failing job is recorded in the summary and never
+aborts the batch. The stage timings of the workers are merged into utils.profiling.PROFILER.
+
+Parameters:
+- manifest (str): The path to the manifest file.
+- prototype_path (str): The directory containing the prototype database.
+- func_file (str): The path to the function file.
+- workers (int): The number of worker processes. 1 runs the jobs in the current process.
+- summary_file (str): The path of the CSV summary table to write.
+- md_index (bool): Whether to keep a residue offset index next to each MD PDB (see read_structure).
+- plumed_options (dict, optional): Extra keyword arguments for write_plumed.
+- cache (ResultCache, optional): A result cache shared by all jobs (see utils.cache).
+- consensus (str): The consensus mode for multi-model bulge structures (see utils.ensemble). Default: 'majority'.
+
+Returns:
+- summary (list of dict): One row per job with keys `job`, `status`, `bulges`, `assigned`, `plumed_file`, `message`.
+"""
+
+SUMMARY_FIELDS = ['job', 'status', 'bulges', 'assigned', 'plumed_file', 'message']
+
+
+def _split_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return str(value).replace(';', ' ').split()
+
+
+def read_manifest(manifest):
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, 'r', newline='') as file:
+        if manifest.endswith(('.jsonl', '.json')):
+            rows = [json.loads(line) for line in file if line.strip()]
+        else:
+            rows = list(csv.DictReader(file))
+
+    jobs = []
+    for line_number, row in enumerate(rows, start=1):
+        try:
+            bulge_name = _split_list(row['bulge_name'])
+            bulge_id = [int(resi) for resi in _split_list(row['bulge_id'])]
+            if len(bulge_name) != len(bulge_id):
+                raise ValueError("The number of bulge residues and residue IDs must match.")
+
+            output_dir = os.path.join(base_dir, row.get('output_dir') or '.')
+            jobs.append({
+                'job': str(row.get('job') or line_number),
+                'bulge_pdb': os.path.join(base_dir, row['bulge_pdb']),
+                'md_pdb': os.path.join(base_dir, row['md_pdb']),
+                'bulge_name': bulge_name,
+                'bulge_id': bulge_id,
+                'plumed_file': os.path.join(output_dir, row.get('plumed_file') or 'plumed.dat')
+            })
+        except (KeyError, ValueError) as e:
+            error_msg = f"Invalid manifest entry {line_number} in {manifest}: {e}"
+            logger.error(error_msg)
+            jobs.append({'job': str(row.get('job') or line_number), 'error': error_msg})
+
+    return jobs
+
+
+def _init_worker(prototype_path, func_file):
+    load_prototype_db(prototype_path)
+    read_function_table(func_file)
+
+
+def run_job(job, prototype_path, func_file, md_index=False, plumed_options=None, cache=None, consensus='majority'):
+    summary = {'job': job['job'], 'status': 'error', 'bulges': len(job.get('bulge_id', [])),
+               'assigned': 0, 'plumed_file': job.get('plumed_file', ''), 'message': job.get('error', '')}
+    if 'error' in job:
+        return summary
+
+    try:
+        os.makedirs(os.path.dirname(job['plumed_file']), exist_ok=True)
+        results = generate_plumed(job['bulge_pdb'], job['md_pdb'], job['bulge_id'], job['bulge_name'],
+                                  prototype_path, func_file, job['plumed_file'], md_index=md_index,
+                                  plumed_options=plumed_options, cache=cache, consensus=consensus)
+        summary['assigned'] = sum(result['model_type'] is not None for result in results)
+        summary['status'] = 'ok'
+        summary['message'] = '; '.join(f"{result['bulge']}: {result['message']}"
+                                       for result in results if result['message'])
+    except Exception as e:
+        logger.error(f"Job {job['job']} failed: {e}\n{traceback.format_exc()}")
+        summary['message'] = str(e)
+
+    return summary
+
+
+def _run_job_profiled(job, prototype_path, func_file, md_index, plumed_options, cache, consensus):
+    PROFILER.reset()
+    summary = run_job(job, prototype_path, func_file, md_index, plumed_options, cache, consensus)
+    return summary, PROFILER.snapshot()
+
+
+def write_summary(summary_file, summary):
+    with open(summary_file, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary)
+
+
+def run_batch(manifest, prototype_path, func_file, workers=1, summary_file='batch_summary.csv', md_index=False,
+              plumed_options=None, cache=None, consensus='majority'):
+    jobs = read_manifest(manifest)
+    logger.info(f"Running {len(jobs)} jobs from {manifest} with {workers} worker(s).")
+
+    _init_worker(prototype_path, func_file)
+
+    if workers <= 1:
+        summary = [run_job(job, prototype_path, func_file, md_index, plumed_options, cache, consensus)
+                   for job in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        summary = [None] * len(jobs)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(prototype_path, func_file)) as executor:
+            futures = {executor.submit(_run_job_profiled, job, prototype_path, func_file, md_index, plumed_options,
+                                       cache, consensus): position for position, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    summary[position], profile = future.result()
+                    PROFILER.merge(profile)
+                except Exception as e:
+                    job = jobs[position]
+                    logger.error(f"Job {job['job']} crashed its worker: {e}")
+                    summary[position] = {'job': job['job'], 'status': 'error', 'bulges': len(job.get('bulge_id', [])),
+                                         'assigned': 0, 'plumed_file': job.get('plumed_file', ''), 'message': str(e)}
+
+    write_summary(summary_file, summary)
+    failed = sum(row['status'] != 'ok' for row in summary)
+    logger.info(f"Batch finished: {len(summary) - failed} succeeded, {failed} failed. Summary: {summary_file}")
+    return summary
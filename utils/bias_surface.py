@@ -0,0 +1,133 @@
+import os
+import hashlib
+import logging
+import numpy as np
+from utils.cache import default_cache_dir
+from utils.fourier import FourierSeries
+from utils.analyze_trajectory import BOLTZMANN
+
+logger = logging.getLogger(__name__)
+
+"""
+Tabulates the eta/theta landscape of a bulge on a dense periodic 2D grid and caches it on disk.
+
+The BulgeFF bias of a bulge is the sum of its eta and theta corrections, so the biased landscape on the grid is
+F(eta, theta) = F0(eta, theta) + V_eta(eta) + V_theta(theta), with F0 the baseline free energy of the bulge
+without the bias. Without a baseline F0 is flat and the surface is the bias alone. A baseline from the simulated
+histograms of utils.fit_functions is F0 = -kT ln P_sim(eta) - kT ln P_sim(theta), linearly interpolated (periodic)
+between the bin centres. Grid point (i, j) is at eta = -pi + i*h, theta = -pi + j*h with h = 2*pi/n_grid.
+
+Surfaces are stored as `<sha256>.npz` (float32, shape (n_grid, n_grid)) in `surface_dir`, keyed on the two
+functions, the grid size and the baseline, so a bulge assigned to the same prototype again is read back instead
+of evaluated. `SurfaceLookup` interpolates a stack of surfaces bilinearly at arbitrary (eta, theta), one surface
+per leading index, together with the gradient (periodic central differences on the grid), in one call for all
+walkers.
+
+Parameters:
+- eta_func, theta_func (str): The Fourier correction functions (see utils.fourier).
+- n_grid (int): The number of grid points per torsion over [-pi, pi). Default: 360.
+- baseline (tuple of numpy.ndarray, optional): The baseline free energies (kJ/mol) of eta and theta, each of shape
+  (n_grid,). Default: None (flat).
+- surface_dir (str, optional): The surface cache. Default: $BULGEFF_CACHE_DIR/surfaces or ~/.cache/bulgeff/surfaces.
+
+Returns:
+- surface (numpy.ndarray): The free energy (kJ/mol) on the grid, shape (n_grid, n_grid).
+- cached (bool): Whether the surface was read from the cache.
+"""
+
+SURFACE_FORMAT = 1
+
+
+def grid_angles(n_grid):
+    return -np.pi + np.arange(n_grid) * 2 * np.pi / n_grid
+
+
+def baseline_energies(counts, n_grid=360, temperature=300.0, pseudocount=0.5):
+    # counts has shape (2, n_bins): the eta and theta histograms of one prototype over [-pi, pi).
+    counts = np.asarray(counts, dtype=np.float64) + pseudocount
+    n_bins = counts.shape[-1]
+    centres = -np.pi + (np.arange(n_bins) + 0.5) * 2 * np.pi / n_bins
+    free_energy = -BOLTZMANN * temperature * np.log(counts / counts.sum(axis=-1, keepdims=True))
+    free_energy -= free_energy.min(axis=-1, keepdims=True)
+    x = grid_angles(n_grid)
+    return tuple(np.interp(x, centres, row, period=2 * np.pi) for row in free_energy)
+
+
+def surface_key(eta_func, theta_func, n_grid, baseline=None):
+    digest = hashlib.sha256()
+    for part in (SURFACE_FORMAT, eta_func, theta_func, n_grid):
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+    if baseline is not None:
+        for row in baseline:
+            digest.update(np.ascontiguousarray(row, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def bias_surface(eta_func, theta_func, n_grid=360, baseline=None, surface_dir=None):
+    surface_dir = surface_dir or os.path.join(default_cache_dir(), 'surfaces')
+    path = os.path.join(surface_dir, f"{surface_key(eta_func, theta_func, n_grid, baseline)}.npz")
+    try:
+        with np.load(path) as data:
+            return data['surface'].astype(np.float64), True
+    except (OSError, KeyError, ValueError):
+        pass
+
+    x = grid_angles(n_grid)
+    try:
+        eta_energy = FourierSeries.parse(eta_func)(x)
+        theta_energy = FourierSeries.parse(theta_func)(x)
+    except ValueError as e:
+        logger.error(f"Error evaluating the bias surface: {e}")
+        raise
+    if baseline is not None:
+        eta_energy = eta_energy + baseline[0]
+        theta_energy = theta_energy + baseline[1]
+    surface = eta_energy[:, np.newaxis] + theta_energy[np.newaxis, :]
+
+    try:
+        os.makedirs(surface_dir, exist_ok=True)
+        tmp_file = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, surface=surface.astype(np.float32))
+        os.replace(tmp_file, path)
+    except OSError as e:
+        logger.warning(f"Could not cache the bias surface in {surface_dir}: {e}")
+    return surface, False
+
+
+class SurfaceLookup:
+    def __init__(self, surfaces):
+        values = np.asarray(surfaces, dtype=np.float64)
+        self.n_grid = values.shape[-1]
+        self.spacing = 2 * np.pi / self.n_grid
+        # dF/deta and dF/dtheta at the grid points by periodic central differences.
+        gradients = [(np.roll(values, -1, axis=axis) - np.roll(values, 1, axis=axis)) / (2 * self.spacing)
+                     for axis in (1, 2)]
+        # Every grid gets a periodic copy of its first row and column, so the four corners of a cell are at fixed
+        # offsets of one flat index and no wrapping is needed per lookup.
+        self.values, self.eta_gradient, self.theta_gradient = (
+            np.pad(grid, ((0, 0), (0, 1), (0, 1)), mode='wrap').reshape(-1) for grid in [values] + gradients)
+        self.stride = self.n_grid + 1
+        self.offsets = (np.arange(len(values)) * self.stride ** 2)[:, np.newaxis]
+
+    def _corners(self, eta, theta):
+        # Angles in [-pi, pi): the cell indices are the truncated grid coordinates.
+        u = (eta + np.pi) / self.spacing
+        v = (theta + np.pi) / self.spacing
+        i, j = np.minimum(u.astype(np.int64), self.n_grid - 1), np.minimum(v.astype(np.int64), self.n_grid - 1)
+        fu, fv = u - i, v - j
+        index = self.offsets + i * self.stride + j
+        return index, fu, fv
+
+    def _interpolate(self, grid, index, fu, fv):
+        v00, v10 = grid.take(index), grid.take(index + self.stride)
+        v01, v11 = grid.take(index + 1), grid.take(index + self.stride + 1)
+        return (1 - fv) * (v00 + fu * (v10 - v00)) + fv * (v01 + fu * (v11 - v01))
+
+    def energy(self, eta, theta):
+        # eta and theta have shape (n_surfaces, n_walkers) and lie in [-pi, pi).
+        return self._interpolate(self.values, *self._corners(eta, theta))
+
+    def gradient(self, eta, theta):
+        corners = self._corners(eta, theta)
+        return self._interpolate(self.eta_gradient, *corners), self._interpolate(self.theta_gradient, *corners)
@@ -0,0 +1,257 @@
+import os
+import csv
+import glob
+import tempfile
+import numpy as np
+import logging
+from utils.read_structure import read_structure
+from utils.find_bulges import find_bulges
+from utils.get_trinucleotides import trinucleotide_rows
+from utils.atom_to_pdb import atom_to_pdb
+from utils.torsions import SUGAR_ATOMS, sugar_torsions, pucker_phase, classify_pucker
+from utils.calc_rmsd import BACKBONE_ATOMS, backbone_descriptors, pairwise_lower_bounds, pair_rmsd
+from utils.trajectory import ordered_map
+from utils.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+"""
+Builds a prototype database from a directory of experimental structures by clustering their bulge trinucleotides.
+
+Every PDB/mmCIF file of the directory is scanned for bulges (see find_bulges, first model only). For every bulge
+the trinucleotide (the bulge and its two neighbours in the same chain) is kept when its six backbone atoms
+P/C4' of each residue are present; the sugar pucker of the bulge residue is classified for all bulges of a
+file in one vectorized call, and "Others" puckers are dropped. Files are scanned on `workers` processes and
+only the C4'/P coordinates (and where they came from) are kept, about 150 bytes per fragment.
+
+The fragments of each pucker class are compared in blocks of `block_size` x `block_size` pairs on the worker
+processes. The RMSD lower bounds of calc_rmsd (computed for a whole block with matrix products) discard most
+pairs, the remaining ones are superposed in one batched Kabsch call, and only the pairs within `cutoff` are
+kept: they are spooled to a temporary file as the blocks finish and read back into a compressed sparse
+neighbour list, so the full RMSD matrix is never held. The neighbour lists are clustered with the
+Butina algorithm: the fragment with most neighbours becomes a centroid and takes all its unassigned
+neighbours, and so on. Memory is linear in the number of fragments plus the number of close pairs.
+
+Every cluster with at least `min_size` members (at most `max_prototypes` per class, largest first) becomes a
+prototype: its centroid trinucleotide is written as a MODEL record numbered from 1 to "<output_dir>/<class>.pdb",
+the layout get_prototype_models reads. `clusters.csv` lists the source of every prototype and its cluster size.
+New prototypes need correction functions before they can be used in a PLUMED file (see fit_functions).
+
+Parameters:
+- structure_dir (str): The directory with the structure files (searched recursively).
+- output_dir (str): The directory the prototype files are written to.
+- cutoff (float): The RMSD cutoff in Å for neighbours in a cluster. Default: 1.0.
+- min_size (int): The smallest cluster that becomes a prototype. Default: 2.
+- max_prototypes (int, optional): The largest number of prototypes per class. Default: no limit.
+- max_size (int): The largest number of consecutive unpaired residues counted as a bulge. Default: 1.
+- block_size (int): The number of fragments per block of the RMSD matrix. Default: 1024.
+- workers (int): The number of worker processes. Default: 1.
+
+Returns:
+- summary (dict): The number of files and fragments, and per class the number of fragments, close pairs,
+  clusters and prototypes written.
+"""
+
+STRUCTURE_EXTENSIONS = ('.pdb', '.ent', '.cif', '.mmcif')
+PROTOTYPE_CLASSES = ("C2'-endo", "C3'-endo")
+SUMMARY_FIELDS = ['class', 'model', 'members', 'source', 'chain', 'residue_number', 'residue_name']
+
+# Candidate pairs superposed per batched Kabsch call inside a block.
+PAIR_BATCH = 65536
+
+
+def structure_files(structure_dir):
+    files = glob.glob(os.path.join(structure_dir, '**', '*'), recursive=True)
+    return sorted(path for path in files if path.lower().endswith(STRUCTURE_EXTENSIONS) and os.path.isfile(path))
+
+
+def _backbone_rows(structure, chain_id, bulge_resi):
+    rows = [structure.find(chain_id, resi, atom_name) for resi in (bulge_resi - 1, bulge_resi, bulge_resi + 1)
+            for atom_name in ('P', "C4'")]
+    return None if None in rows else rows
+
+
+def _scan_file(path, max_size):
+    try:
+        structure = read_structure(path)
+        if len(structure.models) > 1:
+            structure = structure.select_model()
+        bulges = find_bulges(structure, max_size=max_size)
+    except Exception as e:
+        logger.warning(f"Skipping {path}: {e}")
+        return path, np.empty((0, len(BACKBONE_ATOMS) * 3, 3)), [], []
+
+    coords, sugars, sources = [], [], []
+    for chain_id, bulge_resi, bulge_res in bulges:
+        backbone = _backbone_rows(structure, chain_id, bulge_resi)
+        sugar = [structure.find(chain_id, bulge_resi, atom_name) for atom_name in SUGAR_ATOMS]
+        if backbone is None or None in sugar:
+            logger.debug("Skipping %s %s%s in %s: incomplete backbone or sugar.", chain_id, bulge_res, bulge_resi, path)
+            continue
+        coords.append(structure.coords[backbone])
+        sugars.append(structure.coords[sugar])
+        sources.append((chain_id, int(bulge_resi), bulge_res))
+
+    if not coords:
+        return path, np.empty((0, len(BACKBONE_ATOMS) * 3, 3)), [], []
+    sugars = np.stack(sugars)
+    phases, _ = pucker_phase(sugar_torsions(*(sugars[:, k] for k in range(len(SUGAR_ATOMS)))))
+    return path, np.stack(coords), classify_pucker(phases).tolist(), sources
+
+
+def scan_structures(files, max_size=1, workers=1):
+    coords, classes, sources = [], [], []
+    for path, file_coords, file_classes, file_sources in ordered_map(_scan_file, ((path, max_size) for path in files),
+                                                                     workers):
+        for fragment, sugar, source in zip(file_coords, file_classes, file_sources):
+            if sugar in PROTOTYPE_CLASSES:
+                coords.append(fragment)
+                classes.append(sugar)
+                sources.append((path,) + source)
+    PROFILER.count('fragments', len(coords))
+    coords = np.stack(coords) if coords else np.empty((0, len(BACKBONE_ATOMS) * 3, 3))
+    return coords, np.asarray(classes, dtype=object), sources
+
+
+def _rmsd_block(coords_a, coords_b, start_a, start_b, cutoff):
+    bounds = pairwise_lower_bounds(backbone_descriptors(coords_a), backbone_descriptors(coords_b))
+    candidates = bounds <= cutoff
+    n_compared = candidates.size
+    if start_a == start_b:
+        candidates &= np.triu(np.ones(candidates.shape, dtype=bool), k=1)
+        n_compared = len(coords_a) * (len(coords_a) - 1) // 2
+    rows, columns = np.nonzero(candidates)
+
+    keep = []
+    for start in range(0, len(rows), PAIR_BATCH):
+        batch = slice(start, start + PAIR_BATCH)
+        keep.append(pair_rmsd(coords_a[rows[batch]], coords_b[columns[batch]]) <= cutoff)
+    keep = np.concatenate(keep) if keep else np.zeros(0, dtype=bool)
+    return (np.stack([rows[keep] + start_a, columns[keep] + start_b], axis=1).astype(np.int32),
+            n_compared - len(rows))
+
+
+def neighbour_lists(coords, cutoff=1.0, block_size=1024, workers=1, spool_dir=None):
+    n = len(coords)
+    starts = range(0, n, block_size)
+    tasks = ((coords[a:a + block_size], coords[b:b + block_size], a, b, cutoff)
+             for a in starts for b in starts if b >= a)
+
+    counts = np.zeros(n, dtype=np.int64)
+    n_pairs = 0
+    pruned = 0
+    with tempfile.TemporaryDirectory(dir=spool_dir) as tmp_dir:
+        spool_file = os.path.join(tmp_dir, 'pairs.bin')
+        with open(spool_file, 'wb') as spool:
+            for pairs, block_pruned in ordered_map(_rmsd_block, tasks, workers):
+                pairs.tofile(spool)
+                counts += np.bincount(pairs.reshape(-1), minlength=n)
+                n_pairs += len(pairs)
+                pruned += block_pruned
+        PROFILER.count('rmsd_pruned', pruned)
+
+        # Compressed sparse rows: every close pair is listed under both of its fragments.
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        indices = np.empty(2 * n_pairs, dtype=np.int32)
+        cursor = indptr[:-1].copy()
+        pairs = np.memmap(spool_file, dtype=np.int32, mode='r', shape=(n_pairs, 2)) if n_pairs else np.empty((0, 2))
+        for start in range(0, n_pairs, 1 << 20):
+            chunk = np.asarray(pairs[start:start + (1 << 20)])
+            for source, target in ((chunk[:, 0], chunk[:, 1]), (chunk[:, 1], chunk[:, 0])):
+                order = np.argsort(source, kind='stable')
+                source, target = source[order], target[order]
+                first = np.searchsorted(source, source, side='left')
+                positions = cursor[source] + np.arange(len(source)) - first
+                indices[positions] = target
+                cursor += np.bincount(source, minlength=n)
+        del pairs
+    return indptr, indices, n_pairs
+
+
+def butina_clusters(indptr, indices):
+    n = len(indptr) - 1
+    order = np.argsort(-np.diff(indptr), kind='stable')
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    for centroid in order.tolist():
+        if assigned[centroid]:
+            continue
+        neighbours = indices[indptr[centroid]:indptr[centroid + 1]]
+        members = np.concatenate([[centroid], neighbours[~assigned[neighbours]]]).astype(np.int64)
+        assigned[members] = True
+        clusters.append(members)
+    return clusters
+
+
+def _fragment_text(structure, chain_id, bulge_resi, bulge_res):
+    rows = trinucleotide_rows(structure, bulge_resi, bulge_res)
+    rows = rows[structure.chain_id[rows] == chain_id]
+    return atom_to_pdb(structure.atom_info(rows))
+
+
+def write_prototypes(output_dir, prototypes):
+    # prototypes: (class, model, members, (path, chain_id, residue_number, residue_name)) in output order.
+    os.makedirs(output_dir, exist_ok=True)
+    structures = {}
+    texts = {}
+    for _, _, _, (path, chain_id, bulge_resi, bulge_res) in prototypes:
+        if path not in structures:
+            structure = read_structure(path)
+            structures[path] = structure.select_model() if len(structure.models) > 1 else structure
+        texts[(path, chain_id, bulge_resi)] = _fragment_text(structures[path], chain_id, bulge_resi, bulge_res)
+
+    for sugar in PROTOTYPE_CLASSES:
+        models = [entry for entry in prototypes if entry[0] == sugar]
+        if not models:
+            continue
+        with open(os.path.join(output_dir, f"{sugar}.pdb"), 'w') as file:
+            for _, model, _, (path, chain_id, bulge_resi, _) in models:
+                file.write(f"MODEL     {model:4d}\n{texts[(path, chain_id, bulge_resi)]}\nENDMDL\n\n")
+            file.write("END\n")
+
+    with open(os.path.join(output_dir, 'clusters.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(SUMMARY_FIELDS)
+        for sugar, model, members, (path, chain_id, bulge_resi, bulge_res) in prototypes:
+            writer.writerow([sugar, model, members, path, chain_id, bulge_resi, bulge_res])
+
+
+def build_prototypes(structure_dir, output_dir, cutoff=1.0, min_size=2, max_prototypes=None, max_size=1,
+                     block_size=1024, workers=1):
+    files = structure_files(structure_dir)
+    if not files:
+        error_msg = f"No structure files found in {structure_dir}"
+        logger.error(error_msg)
+        raise FileNotFoundError(error_msg)
+    os.makedirs(output_dir, exist_ok=True)
+
+    with PROFILER.stage('scan'):
+        coords, classes, sources = scan_structures(files, max_size, workers)
+    logger.info(f"Found {len(coords)} bulge trinucleotides in {len(files)} files.")
+
+    summary = {'files': len(files), 'fragments': len(coords), 'classes': {}}
+    prototypes = []
+    for sugar in PROTOTYPE_CLASSES:
+        members = np.flatnonzero(classes == sugar)
+        with PROFILER.stage('rmsd_matrix'):
+            indptr, indices, n_pairs = neighbour_lists(coords[members], cutoff, block_size, workers, output_dir)
+        with PROFILER.stage('cluster'):
+            clusters = butina_clusters(indptr, indices)
+
+        selected = [cluster for cluster in clusters if len(cluster) >= min_size][:max_prototypes]
+        for model, cluster in enumerate(selected, start=1):
+            prototypes.append((sugar, model, len(cluster), sources[members[cluster[0]]]))
+        summary['classes'][sugar] = {'fragments': len(members), 'pairs': n_pairs, 'clusters': len(clusters),
+                                     'prototypes': len(selected)}
+        logger.info(f"{sugar}: {len(members)} fragments, {n_pairs} pairs within {cutoff} Å, {len(clusters)} clusters, "
+                    f"{len(selected)} prototypes.")
+
+    if not prototypes:
+        error_msg = f"No cluster of {structure_dir} has at least {min_size} members."
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    with PROFILER.stage('write'):
+        write_prototypes(output_dir, prototypes)
+    logger.info(f"Wrote {len(prototypes)} prototypes to {output_dir}")
+    return summary
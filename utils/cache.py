@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Persistent, content-addressed cache of prototype assignments.
+
+An entry is keyed on the SHA-256 of the trinucleotide atoms (the PDB text written by get_trinucleotides,
+i.e. every atom name and coordinate of the bulge and its neighbours), the version of the compiled prototype
+database and the SHA-256 of the function file. A change to any of them gives a new key, so stale entries are
+never returned; they simply age out. Each entry is a small JSON file holding the sugar type, the RMSD values
+of the closest prototypes with their model indices and types, the selected model and the eta/theta functions.
+
+Entries are written atomically (temporary file + rename), so concurrent batch workers can share a cache
+directory. A hit refreshes the entry's mtime, and when the cache grows past `max_entries` or `max_bytes` the
+least recently used entries are removed until both are below LOW_WATER of their limits. The number of entries
+and their total size are kept as a running estimate in `index.json`, so a write only updates that small file. The
+cache tree is scanned only when the estimate passes a limit, every SWEEP_INTERVAL writes (concurrent writers can
+lose index updates; the scan corrects the count) or when the index is missing. `clear()` always scans.
+
+Parameters:
+- cache_dir (str, optional): The cache directory. Default: $BULGEFF_CACHE_DIR or ~/.cache/bulgeff.
+- max_entries (int): The largest number of entries kept. Default: 10000.
+- max_bytes (int): The largest total size of the entries in bytes. Default: 256 MiB.
+
+Returns:
+- cache (ResultCache): `cache.key(...)`, `cache.get(key)`, `cache.put(key, value)` and `cache.clear()`.
+"""
+
+CACHE_FORMAT = 2
+CACHE_ENV = 'BULGEFF_CACHE_DIR'
+INDEX_FILE = 'index.json'
+SWEEP_INTERVAL = 1000
+# Eviction trims the cache to this fraction of its limits, so the writes that follow do not trigger it again.
+LOW_WATER = 0.9
+
+_DIGEST_CACHE = {}
+
+
+def default_cache_dir():
+    return os.environ.get(CACHE_ENV) or os.path.join(os.path.expanduser('~'), '.cache', 'bulgeff')
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    key = os.path.realpath(path)
+    cached = _DIGEST_CACHE.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime, stat.st_size):
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    _DIGEST_CACHE[key] = ((stat.st_mtime, stat.st_size), digest.hexdigest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir=None, max_entries=10000, max_bytes=256 << 20):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def key(self, trinucleotides, db_version, func_file):
+        digest = hashlib.sha256()
+        for part in (str(CACHE_FORMAT), db_version, file_digest(func_file), trinucleotides):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as file:
+                value = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        logger.debug("Result cache hit %s in %s", key[:12], self.cache_dir)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            # Overwriting an existing entry (e.g. two workers assigning the same bulge) changes its size only.
+            previous_size = os.stat(path).st_size if os.path.exists(path) else None
+        except OSError:
+            previous_size = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w') as file:
+                json.dump(value, file)
+            os.replace(tmp_path, path)
+            size = os.stat(path).st_size
+        except OSError as e:
+            logger.warning(f"Could not write result cache entry {path}: {e}")
+            return
+
+        index = self._read_index()
+        if index is None:
+            self.evict()
+            return
+        if previous_size is None:
+            index['entries'] += 1
+            index['bytes'] += size
+        else:
+            index['bytes'] += size - previous_size
+        index['puts'] += 1
+        if (index['entries'] > self.max_entries or index['bytes'] > self.max_bytes
+                or index['puts'] >= SWEEP_INTERVAL):
+            self.evict()
+        else:
+            self._write_index(index)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), 'r') as file:
+                index = json.load(file)
+            return {name: int(index[name]) for name in ('entries', 'bytes', 'puts')}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_index(self, index):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(index, file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug("Could not write the result cache index %s: %s", path, e)
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if len(entries) <= self.max_entries and total <= self.max_bytes:
+            self._write_index({'entries': len(entries), 'bytes': total, 'puts': 0})
+            return 0
+
+        entries.sort()
+        removed = 0
+        max_entries, max_bytes = int(LOW_WATER * self.max_entries), int(LOW_WATER * self.max_bytes)
+        for _, size, path in entries:
+            if len(entries) - removed <= max_entries and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            removed += 1
+        self._write_index({'entries': len(entries) - removed, 'bytes': total, 'puts': 0})
+        logger.info(f"Evicted {removed} result cache entries from {self.cache_dir}")
+        return removed
+
+    def clear(self):
+        removed = 0
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        self._write_index({'entries': 0, 'bytes': 0, 'puts': 0})
+        logger.info(f"Cleared {removed} result cache entries from {self.cache_dir}")
+        return removed
@@ -1,49 +1,133 @@
-import MDAnalysis as mda
-from MDAnalysis.analysis import align
-from MDAnalysis.analysis.rms import rmsd
-from io import StringIO
+import numpy as np
 import logging
-import warnings
+from utils.profiling import PROFILER
 
-logging.basicConfig(filename='BulgeFix.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 """
 Calculates the Root Mean Square Deviation (RMSD) between a reference structure and a prototype structure.
-    
+
+The C4'/P atoms of both structures are superposed with the Kabsch algorithm. `batch_rmsd` scores one
+(or several) references against a stack of prototypes in a single batched SVD.
+
+`backbone_descriptors` returns rotation-invariant descriptors of C4'/P coordinates: the distance of every atom
+to the centroid and the internal distance matrix (upper triangle). `rmsd_lower_bounds` turns them into lower
+bounds of the superposed RMSD without superposing. The optimal superposition puts both centroids at the
+origin and moves every atom by at most its own deviation e_i, so ||a_i| - |b_i|| <= e_i, and by the triangle
+inequality |d_ij(A) - d_ij(B)| <= e_i + e_j, whose squares summed over the pairs are at most 2(n - 1) sum(e_i^2).
+The larger of the two bounds is returned.
+
+`pair_rmsd` superposes matching pairs of coordinate sets (a[k] on b[k]) in one batched SVD, and
+`pairwise_lower_bounds` gives the bound of every pair of two descriptor sets as a matrix, via matrix products.
+
 Parameters:
 reference (str): The reference PDB structure as a string.
 prototype (str): The prototype PDB structure as a string.
-    
+
 Returns:
 float: The RMSD value between the reference and prototype structures.
 """
 
-def calc_rmsd(reference, prototype):
-    try:
-        logging.info("Starting RMSD calculation.")
-        reference_pdb = StringIO(reference)
-        prototype_pdb = StringIO(prototype)
+BACKBONE_ATOMS = ("C4'", "P")
+
+
+def backbone_coords(pdb_text):
+    coords = []
+    for line in pdb_text.splitlines():
+        if line.startswith(('ATOM', 'HETATM')) and line[12:16].strip() in BACKBONE_ATOMS:
+            coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+
+def batch_rmsd(reference, prototypes):
+    reference = np.asarray(reference, dtype=np.float64)
+    prototypes = np.asarray(prototypes, dtype=np.float64)
+    single = reference.ndim == 2
+    if single:
+        reference = reference[np.newaxis]
+
+    if reference.shape[-2] != prototypes.shape[-2]:
+        raise ValueError(f"Atom count mismatch for RMSD: {reference.shape[-2]} atoms in reference, "
+                         f"{prototypes.shape[-2]} atoms in prototype.")
+
+    PROFILER.count('rmsd_evaluations', reference.shape[0] * prototypes.shape[0])
+    n_atoms = reference.shape[-2]
+    ref = reference - reference.mean(axis=-2, keepdims=True)
+    mob = prototypes - prototypes.mean(axis=-2, keepdims=True)
+
+    covariance = np.einsum('rni,mnj->rmij', ref, mob)
+    singular = np.linalg.svd(covariance, compute_uv=False)
+    sign = np.sign(np.linalg.det(covariance))
+    singular[..., -1] *= np.where(sign == 0, 1.0, sign)
+
+    e0 = np.einsum('rni,rni->r', ref, ref)[:, np.newaxis] + np.einsum('mni,mni->m', mob, mob)[np.newaxis, :]
+    msd = (e0 - 2.0 * singular.sum(axis=-1)) / n_atoms
+    rmsd_values = np.sqrt(np.maximum(msd, 0.0))
 
-        u1 = mda.Universe(reference_pdb, format='pdb')
-        u2 = mda.Universe(prototype_pdb, format='pdb')
+    return rmsd_values[0] if single else rmsd_values
 
-        ref_atoms = u1.select_atoms("name C4' P")
-        prototype_atoms = u2.select_atoms("name C4' P")
 
-        logging.info(f"Selected atoms for alignment: {len(ref_atoms)} atoms in reference, {len(prototype_atoms)} atoms in prototype.")
+def pair_rmsd(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    PROFILER.count('rmsd_evaluations', len(a))
+    ref = a - a.mean(axis=-2, keepdims=True)
+    mob = b - b.mean(axis=-2, keepdims=True)
 
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            aligner = align.AlignTraj(u1, u2, select="name C4' P", in_memory=True)
-            aligner.run()
+    covariance = np.einsum('kni,knj->kij', ref, mob)
+    singular = np.linalg.svd(covariance, compute_uv=False)
+    sign = np.sign(np.linalg.det(covariance))
+    singular[..., -1] *= np.where(sign == 0, 1.0, sign)
 
-            rmsd_value = rmsd(prototype_atoms.positions, ref_atoms.positions, superposition=True)
+    e0 = np.einsum('kni,kni->k', ref, ref) + np.einsum('kni,kni->k', mob, mob)
+    msd = (e0 - 2.0 * singular.sum(axis=-1)) / a.shape[-2]
+    return np.sqrt(np.maximum(msd, 0.0))
+
+
+def backbone_descriptors(coords):
+    coords = np.asarray(coords, dtype=np.float64)
+    centred = coords - coords.mean(axis=-2, keepdims=True)
+    centroid_distances = np.linalg.norm(centred, axis=-1)
+    upper = np.triu_indices(coords.shape[-2], k=1)
+    pair_distances = np.linalg.norm(coords[..., upper[0], :] - coords[..., upper[1], :], axis=-1)
+    return centroid_distances, pair_distances
+
+
+def rmsd_lower_bounds(reference_descriptors, descriptors):
+    ref_centroid, ref_pairs = reference_descriptors
+    centroid_distances, pair_distances = descriptors
+    n_atoms = centroid_distances.shape[-1]
+
+    centroid_bound = np.sqrt(np.mean((centroid_distances - ref_centroid) ** 2, axis=-1))
+    if n_atoms < 2:
+        return centroid_bound
+    pair_bound = np.sqrt(np.sum((pair_distances - ref_pairs) ** 2, axis=-1) / (2.0 * n_atoms * (n_atoms - 1)))
+    return np.maximum(centroid_bound, pair_bound)
+
+
+def _squared_distances(a, b):
+    return np.maximum(np.sum(a * a, axis=1)[:, np.newaxis] + np.sum(b * b, axis=1)[np.newaxis, :] - 2.0 * a @ b.T, 0.0)
+
+
+def pairwise_lower_bounds(descriptors_a, descriptors_b):
+    (centroid_a, pairs_a), (centroid_b, pairs_b) = descriptors_a, descriptors_b
+    n_atoms = centroid_a.shape[-1]
+
+    bounds = np.sqrt(_squared_distances(centroid_a, centroid_b) / n_atoms)
+    if n_atoms < 2:
+        return bounds
+    return np.maximum(bounds, np.sqrt(_squared_distances(pairs_a, pairs_b) / (2.0 * n_atoms * (n_atoms - 1))))
+
+
+def calc_rmsd(reference, prototype):
+    try:
+        ref_atoms = backbone_coords(reference)
+        prototype_atoms = backbone_coords(prototype)
 
-        logging.info(f"RMSD calculation completed: {rmsd_value:.3f} Å")
+        rmsd_value = float(batch_rmsd(ref_atoms, prototype_atoms[np.newaxis])[0])
 
         return rmsd_value
 
     except Exception as e:
-        logging.error(f"An error occurred during RMSD calculation: {str(e)}")
+        logger.error(f"An error occurred during RMSD calculation: {str(e)}")
         raise
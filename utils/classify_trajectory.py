@@ -0,0 +1,181 @@
+import re
+import numpy as np
+import logging
+from utils.read_structure import read_structure
+from utils.read_plumed import read_plumed
+from utils.get_trinucleotides import trinucleotide_rows
+from utils.torsions import SUGAR_ATOMS, sugar_torsions, pucker_phase, classify_pucker
+from utils.calc_rmsd import BACKBONE_ATOMS, batch_rmsd
+from utils.prototype_db import load_prototype_db
+from utils.get_prototype import RMSD_THRESHOLDS
+from utils.generate_plumed import md_residue_request
+from utils.trajectory import open_trajectory, frame_chunks, ordered_map
+
+logger = logging.getLogger(__name__)
+
+"""
+Assigns every bulge in every trajectory frame to its closest prototype, as the pipeline does for a structure.
+
+For every frame and bulge the sugar pucker of the bulge residue selects the prototype class ("Others" keeps
+all models), the C4'/P atoms of the trinucleotide are superposed on every model of the class, and the model
+with the lowest RMSD is the state of the frame (model index and class, since model indices repeat between the
+class files), or -1 when that RMSD exceeds the threshold of its class (1.3 Å for C2'-endo, 1.2 Å for
+C3'-endo). The atoms are taken from the MD structure by position, so the
+trajectory needs no topology beyond the one used for the simulation.
+
+Frames are streamed in chunks of `chunk_size` and chunks are spread over `workers` processes. A chunk scores
+all frames x bulges against all prototypes in one batched superposition (see calc_rmsd.batch_rmsd), so no
+Universe or PDB text is built per frame.
+
+The state table has the columns frame, time and, per bulge, `state_<bulge>` (the prototype model index or
+-1), `class_<bulge>` (the position of its class in the header line `# classes:`, or -1) and `rmsd_<bulge>`
+(Å). The population table lists for every bulge and state the model type, the number of frames and their
+fraction.
+
+Parameters:
+- trajectory (str): The trajectory (XTC/TRR/DCD/multi-model PDB, ...).
+- topology (str, optional): The MD structure (PDB, mmCIF or .gro); required for non-PDB trajectories.
+  Default: the first model of a PDB trajectory.
+- bulges (list of (str, int)): The bulges as (residue name, residue number) pairs.
+- prototype_path (str): The directory containing the prototype database.
+- output (str): The per-frame state table. Default: prototype_states.dat.
+- populations (str): The population table. Default: prototype_populations.dat.
+- chunk_size (int): The number of frames per chunk. Default: 10000.
+- workers (int): The number of worker processes. Default: 1.
+
+Returns:
+- summary (dict): The number of frames and, per bulge, the fraction of frames in every state, keyed by
+  (model_type, model index) or None for frames without a suitable prototype.
+
+`bulges_from_plumed` returns the bulges biased in a BulgeFF PLUMED file.
+"""
+
+UNASSIGNED = -1
+
+_BULGE_LABEL = re.compile(r"^(?:eta|theta)_([A-Za-z]+)(-?\d+)$")
+
+
+def bulges_from_plumed(plumed_file):
+    bulges = []
+    for term in read_plumed(plumed_file):
+        match = _BULGE_LABEL.match(term['label'])
+        if match and (match.group(1), int(match.group(2))) not in bulges:
+            bulges.append((match.group(1), int(match.group(2))))
+    return bulges
+
+
+def _bulge_atoms(structure, bulge_resi, bulge_res, n_atoms):
+    chain_id = structure.find_chain(bulge_resi, bulge_res)
+    if chain_id is None:
+        error_msg = f"Residue {bulge_res}-{bulge_resi} not found in {structure.source}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    rows = trinucleotide_rows(structure, bulge_resi, bulge_res)
+    backbone = rows[np.isin(structure.atom_name[rows], BACKBONE_ATOMS)]
+    if len(backbone) != n_atoms:
+        error_msg = (f"Bulge {bulge_res}{bulge_resi} has {len(backbone)} C4'/P atoms in {structure.source}, "
+                     f"the prototypes have {n_atoms}.")
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    sugar = [structure.find(chain_id, bulge_resi, atom_name) for atom_name in SUGAR_ATOMS]
+    if None in sugar:
+        missing = [atom_name for atom_name, row in zip(SUGAR_ATOMS, sugar) if row is None]
+        error_msg = f"Missing sugar atom(s) of {bulge_res}{bulge_resi} in {structure.source}: {', '.join(missing)}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    # Trajectory positions are 0-based PLUMED atom numbers.
+    return structure.atom_number[backbone] - 1, structure.atom_number[sugar] - 1
+
+
+def _classify_chunk(trajectory, topology, start, stop, backbone_indices, sugar_indices, prototype_path):
+    reader = open_trajectory(trajectory, topology)
+    n_bulges, n_atoms = backbone_indices.shape
+    frames, times, coords = reader.read(start, stop, np.concatenate([backbone_indices.reshape(-1),
+                                                                     sugar_indices.reshape(-1)]))
+    n_frames = len(frames)
+    backbone = coords[:, :n_bulges * n_atoms].reshape(n_frames * n_bulges, n_atoms, 3)
+    sugar = coords[:, n_bulges * n_atoms:].reshape(n_frames, n_bulges, len(SUGAR_ATOMS), 3)
+
+    phases, _ = pucker_phase(sugar_torsions(*(sugar[:, :, k] for k in range(len(SUGAR_ATOMS)))))
+    sugars = classify_pucker(phases)
+
+    db = load_prototype_db(prototype_path)
+    rmsd = batch_rmsd(backbone, db.coords).reshape(n_frames, n_bulges, len(db))
+
+    # Models outside the pucker class of the frame cannot be selected; "Others" keeps every model.
+    class_names = np.asarray(db.classes, dtype=object)[db.pucker]
+    allowed = (class_names == sugars[..., np.newaxis]) | (sugars == "Others")[..., np.newaxis]
+    rmsd = np.where(allowed, rmsd, np.inf)
+
+    best = np.argmin(rmsd, axis=-1)
+    best_rmsd = np.take_along_axis(rmsd, best[..., np.newaxis], axis=-1)[..., 0]
+    thresholds = np.array([RMSD_THRESHOLDS.get(name, np.inf) for name in db.classes])
+    assigned = best_rmsd <= thresholds[db.pucker[best]]
+    states = np.where(assigned, db.model_indices[best], UNASSIGNED)
+    classes = np.where(assigned, db.pucker[best], UNASSIGNED)
+    return frames, times, states, classes, best_rmsd
+
+
+def _write_populations(populations_file, labels, counts, n_frames):
+    with open(populations_file, 'w') as file:
+        file.write("# bulge state model_type frames fraction\n")
+        for label in labels:
+            for state, count in sorted(counts[label].items(), key=lambda item: -item[1]):
+                model_type, model = state if state is not None else ('none', UNASSIGNED)
+                file.write(f"{label} {model} {model_type} {count} {count / max(n_frames, 1):.6f}\n")
+
+
+def classify_trajectory(trajectory, topology, bulges, prototype_path, output='prototype_states.dat',
+                        populations='prototype_populations.dat', chunk_size=10000, workers=1):
+    if not bulges:
+        error_msg = "No bulges to classify."
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    db = load_prototype_db(prototype_path)
+    n_atoms = db.coords.shape[1]
+    bulge_names = [name for name, _ in bulges]
+    bulge_ids = [int(resi) for _, resi in bulges]
+    structure = read_structure(topology or trajectory, residues=md_residue_request(bulge_ids, bulge_names))
+    atoms = [_bulge_atoms(structure, resi, name, n_atoms) for name, resi in zip(bulge_names, bulge_ids)]
+    backbone_indices = np.array([backbone for backbone, _ in atoms], dtype=np.int64)
+    sugar_indices = np.array([sugar for _, sugar in atoms], dtype=np.int64)
+
+    n_frames = open_trajectory(trajectory, topology).n_frames
+    tasks = ((trajectory, topology, start, stop, backbone_indices, sugar_indices, prototype_path)
+             for start, stop in frame_chunks(n_frames, chunk_size))
+
+    labels = [f"{name}{resi}" for name, resi in zip(bulge_names, bulge_ids)]
+    header = ' '.join(['frame', 'time'] + [f"{column}_{label}" for label in labels
+                                           for column in ('state', 'class', 'rmsd')])
+    counts = {label: {} for label in labels}
+    frames_done = 0
+    with open(output, 'w') as file:
+        file.write(f"# classes: {' '.join(db.classes)}\n# {header}\n")
+        for frames, times, states, classes, rmsd in ordered_map(_classify_chunk, tasks, workers):
+            columns = [frames, times]
+            for k in range(len(labels)):
+                columns.extend([states[:, k], classes[:, k], rmsd[:, k]])
+            np.savetxt(file, np.column_stack(columns), fmt=['%d', '%.6f'] + ['%d', '%d', '%.4f'] * len(labels))
+
+            frames_done += len(frames)
+            for k, label in enumerate(labels):
+                pairs, pair_counts = np.unique(np.stack([classes[:, k], states[:, k]], axis=1), axis=0,
+                                               return_counts=True)
+                for (class_id, model), count in zip(pairs.tolist(), pair_counts.tolist()):
+                    state = (db.classes[class_id], model) if class_id != UNASSIGNED else None
+                    counts[label][state] = counts[label].get(state, 0) + count
+
+    _write_populations(populations, labels, counts, frames_done)
+
+    summary = {
+        'frames': frames_done,
+        'populations': {label: {state: count / max(frames_done, 1) for state, count in counts[label].items()}
+                        for label in labels}
+    }
+    logger.info(f"Classified {frames_done} frames of {trajectory} for {len(labels)} bulge(s). "
+                f"States: {output}, populations: {populations}")
+    return summary
@@ -0,0 +1,146 @@
+from collections import Counter
+import hashlib
+import numpy as np
+import logging
+from utils.read_structure import as_structure
+from utils.get_trinucleotides import trinucleotide_rows
+from utils.torsions import SUGAR_ATOMS, sugar_torsions, pucker_phase, classify_pucker
+from utils.calc_rmsd import BACKBONE_ATOMS, batch_rmsd
+from utils.prototype_db import load_prototype_db
+from utils.get_prototype import RMSD_THRESHOLDS
+
+logger = logging.getLogger(__name__)
+
+"""
+Assigns a prototype to a bulge of a multi-model structure (NMR ensemble) from all of its models.
+
+The sugar atoms and the trinucleotide C4'/P atoms of the bulge are gathered from every model into
+(n_models, n_atoms, 3) arrays. The pucker of every model is classified in one vectorized call, and every model
+is superposed on every prototype in one batched RMSD call, so each extra model adds a row to the kernels
+rather than another pass through the pipeline. Every model is then assigned like a single structure: the
+best prototype of its own pucker class, subject to the RMSD thresholds.
+
+Consensus modes:
+- 'majority': the prototype assigned to the most models; ties go to the lowest mean RMSD of its voters. Models
+  without a suitable prototype vote for no assignment, which wins only with a strict plurality.
+- 'mean_rmsd': the prototype of the majority pucker class with the lowest RMSD averaged over all models.
+
+Parameters:
+- pdb_name (str or Structure): The multi-model bulge structure.
+- bulge_resi (int): The residue number of the bulge.
+- bulge_res (str): The residue name of the bulge.
+- prototype_path (str): The directory containing the prototype database.
+- consensus (str): 'majority' or 'mean_rmsd'. Default: 'majority'.
+
+Returns:
+- assignment (dict): `sugar` (the majority pucker class), `model`, `model_type` (None without a suitable
+  prototype, `model` is then the message), `rmsd`/`model_indices`/`model_types` (the RMSD averaged over the
+  models for every candidate of the majority class), `consensus`, `agreement` (the fraction of models assigned
+  the consensus prototype) and `ensemble` (one dict per model with `model`, `phase`, `sugar`, `prototype`,
+  `model_type` and `rmsd`).
+
+`ensemble_signature` returns the SHA-256 of the consensus mode and the trinucleotide coordinates of every model,
+which extends the result cache key of the first model's trinucleotide to the whole ensemble.
+"""
+
+CONSENSUS_MODES = ('majority', 'mean_rmsd')
+
+
+def _ensemble_coords(structure, keys):
+    rows = structure.ensemble_rows(keys)
+    missing = rows < 0
+    if missing.any():
+        model = structure.models[int(np.argmax(missing.any(axis=1)))]
+        names = [f"{key[1]}:{key[2]}" for key, absent in zip(keys, missing[structure.models.index(model)]) if absent]
+        error_msg = f"Model {model} of {structure.source} lacks atoms present in the first model: {', '.join(names)}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    return structure.coords[rows]
+
+
+def _best_prototype(rmsd_values, indices, model_types):
+    best = int(np.argmin(rmsd_values))
+    model_type = model_types[best]
+    if model_type in RMSD_THRESHOLDS and rmsd_values[best] > RMSD_THRESHOLDS[model_type]:
+        return None, model_type, float(rmsd_values[best])
+    return f"model{indices[best]}", model_type, float(rmsd_values[best])
+
+
+def ensemble_signature(structure, bulge_resi, bulge_res, consensus='majority'):
+    rows = trinucleotide_rows(structure, bulge_resi, bulge_res)
+    keys = list(zip(structure.chain_id[rows].tolist(), structure.residue_number[rows].tolist(),
+                    structure.atom_name[rows].tolist()))
+    model_rows = structure.ensemble_rows(keys)
+    coords = np.where((model_rows >= 0)[..., None], structure.coords[model_rows], np.nan).astype(np.float64)
+    digest = hashlib.sha256(consensus.encode())
+    digest.update(coords.tobytes())
+    return digest.hexdigest()
+
+
+def assign_ensemble(pdb_name, bulge_resi, bulge_res, prototype_path, consensus='majority'):
+    if consensus not in CONSENSUS_MODES:
+        raise ValueError(f"Unknown consensus mode: {consensus}. Valid modes are {', '.join(CONSENSUS_MODES)}.")
+
+    structure = as_structure(pdb_name)
+    chain_id = structure.find_chain(bulge_resi, bulge_res)
+    if chain_id is None:
+        error_msg = f"Residue {bulge_res}-{bulge_resi} not found in {structure.source}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    sugar_coords = _ensemble_coords(structure, [(chain_id, bulge_resi, atom_name) for atom_name in SUGAR_ATOMS])
+    phases, _ = pucker_phase(sugar_torsions(*(sugar_coords[:, k] for k in range(len(SUGAR_ATOMS)))))
+    sugars = classify_pucker(phases).tolist()
+
+    rows = trinucleotide_rows(structure, bulge_resi, bulge_res)
+    rows = rows[np.isin(structure.atom_name[rows], BACKBONE_ATOMS)]
+    backbone_keys = list(zip(structure.chain_id[rows].tolist(), structure.residue_number[rows].tolist(),
+                             structure.atom_name[rows].tolist()))
+    backbone = _ensemble_coords(structure, backbone_keys)
+
+    db = load_prototype_db(prototype_path)
+    all_indices = db.model_indices.tolist()
+    all_types = [db.classes[class_id] for class_id in db.pucker]
+    rmsd_all = batch_rmsd(backbone, db.coords)
+
+    ensemble = []
+    for model, phase, sugar, rmsd_values in zip(structure.models, phases.tolist(), sugars, rmsd_all):
+        rows = db.rows(sugar)
+        prototype, model_type, rmsd = _best_prototype(rmsd_values[rows], all_indices[rows], all_types[rows])
+        ensemble.append({'model': model, 'phase': phase, 'sugar': sugar, 'prototype': prototype,
+                         'model_type': model_type, 'rmsd': rmsd})
+
+    sugar = Counter(sugars).most_common(1)[0][0]
+    rows = db.rows(sugar)
+    mean_rmsd = rmsd_all[:, rows].mean(axis=0)
+    indices, model_types = all_indices[rows], all_types[rows]
+
+    if consensus == 'majority':
+        voters = {}
+        for entry in ensemble:
+            vote = (entry['prototype'], entry['model_type']) if entry['prototype'] else None
+            voters.setdefault(vote, []).append(entry['rmsd'])
+        vote = min(voters, key=lambda vote: (-len(voters[vote]), vote is None, np.mean(voters[vote])))
+        if vote is None:
+            model, model_type = (f"Error: No suitable prototype found for {len(voters[None])} of the {len(ensemble)} "
+                                 f"models as the RMSD values exceed the thresholds."), None
+        else:
+            model, model_type = vote
+    else:
+        model, model_type, rmsd = _best_prototype(mean_rmsd, indices, model_types)
+        if model is None:
+            model = (f"Error: No suitable prototype found as the mean RMSD value exceeds the threshold for "
+                     f"{model_type}. RMSD: {rmsd:.3f} Å, Threshold: {RMSD_THRESHOLDS[model_type]} Å")
+            model_type = None
+
+    agreement = (sum((entry['prototype'], entry['model_type']) == (model, model_type) for entry in ensemble)
+                 / len(ensemble)) if model_type is not None else 0.0
+    if model_type is None:
+        logger.warning(model)
+    else:
+        logger.info(f"Consensus ({consensus}) for {bulge_res}{bulge_resi} over {len(ensemble)} models: "
+                    f"{model} ({model_type}), agreement {agreement:.0%}")
+
+    return {'sugar': sugar, 'rmsd': mean_rmsd.tolist(), 'model_indices': indices, 'model_types': model_types,
+            'model': model, 'model_type': model_type, 'consensus': consensus, 'agreement': agreement,
+            'ensemble': ensemble}
@@ -0,0 +1,192 @@
+from itertools import product
+from utils.read_structure import as_structure
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Finds bulge nucleotides in a whole RNA structure from base-pairing geometry.
+
+Base pairs are detected from hydrogen-bonding contacts between the polar nucleobase atoms (donor/acceptor
+distance <= `hbond_cutoff`, at least `min_hbonds` contacts, C1'-C1' distance within the range of a paired
+duplex). Neighbouring atoms are found with a cell list, so the cost grows linearly with the structure size.
+Every residue keeps at most one partner (the one with most contacts). A bulge is a run of at most
+`max_size` unpaired residues whose flanking residues pair with two consecutive residues of the opposite
+strand, with at least `min_stem` consecutive base pairs on each side.
+
+Parameters:
+- pdb_name (str or Structure): The structure to search.
+- max_size (int): The largest number of consecutive unpaired residues reported as a bulge. Default: 1.
+- min_stem (int): The number of stacked base pairs required on each side of the bulge. Default: 1.
+
+Returns:
+- bulges (list of tuple): (chain_id, residue_number, residue_name) for every bulge residue, in file order.
+
+The pipeline addresses residues by number and name, so `bulge_residue_ids(bulges, pdb_name)` turns the bulges into
+the residue name and number lists of generate_plumed and raises a ValueError when a residue number occurs in
+more than one chain, where it could resolve to the wrong residue.
+"""
+
+BASE_POLAR_ATOMS = {
+    'A': ("N1", "N3", "N6", "N7"),
+    'G': ("N1", "N2", "N3", "O6", "N7"),
+    'C': ("N3", "N4", "O2"),
+    'U': ("N3", "O2", "O4"),
+}
+
+
+def base_type(residue_name):
+    name = residue_name.strip().upper()
+    if len(name) > 1 and name[-1] in "53":
+        name = name[:-1]
+    if len(name) > 1 and name[0] in "RD":
+        name = name[1:]
+    return name if name in BASE_POLAR_ATOMS else None
+
+
+def neighbor_pairs(coords, cutoff):
+    coords = np.asarray(coords, dtype=np.float64)
+    n_atoms = len(coords)
+    if n_atoms < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    cells = np.floor((coords - coords.min(axis=0)) / cutoff).astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    pairs = []
+    for dx, dy, dz in product((-1, 0, 1), repeat=3):
+        neighbor_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+        start = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+        counts = np.searchsorted(sorted_keys, neighbor_keys, side='right') - start
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        first = np.repeat(np.arange(n_atoms), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        second = order[np.repeat(start, counts) + offsets]
+        keep = first < second
+        first, second = first[keep], second[keep]
+        distance = np.linalg.norm(coords[first] - coords[second], axis=1)
+        keep = distance <= cutoff
+        pairs.append(np.column_stack([first[keep], second[keep]]))
+
+    return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+
+def _residue_table(structure):
+    keys = list(zip(structure.chain_id.tolist(), structure.residue_number.tolist(), structure.residue_name.tolist()))
+    residue_of_atom = np.empty(len(keys), dtype=np.int64)
+    residues = {}
+    for row, key in enumerate(keys):
+        residue_of_atom[row] = residues.setdefault(key, len(residues))
+    return list(residues), residue_of_atom
+
+
+def find_base_pairs(pdb_name, hbond_cutoff=3.4, min_hbonds=2, c1_range=(8.0, 12.5)):
+    structure = as_structure(pdb_name)
+    if len(structure.models) > 1:
+        structure = structure.select_model()
+    residues, residue_of_atom = _residue_table(structure)
+
+    polar = np.zeros(len(structure), dtype=bool)
+    c1_coords = np.full((len(residues), 3), np.nan)
+    for row, (atom_name, residue_name) in enumerate(zip(structure.atom_name.tolist(), structure.residue_name.tolist())):
+        base = base_type(residue_name)
+        if base is None:
+            continue
+        if atom_name in BASE_POLAR_ATOMS[base]:
+            polar[row] = True
+        elif atom_name == "C1'":
+            c1_coords[residue_of_atom[row]] = structure.coords[row]
+
+    polar_rows = np.flatnonzero(polar)
+    atom_pairs = neighbor_pairs(structure.coords[polar_rows], hbond_cutoff)
+    res_i = residue_of_atom[polar_rows[atom_pairs[:, 0]]]
+    res_j = residue_of_atom[polar_rows[atom_pairs[:, 1]]]
+    different = res_i != res_j
+    res_pairs = np.sort(np.column_stack([res_i[different], res_j[different]]), axis=1)
+    if len(res_pairs) == 0:
+        return residues, np.full(len(residues), -1, dtype=np.int64)
+
+    res_pairs, contacts = np.unique(res_pairs, axis=0, return_counts=True)
+    c1_distance = np.linalg.norm(c1_coords[res_pairs[:, 0]] - c1_coords[res_pairs[:, 1]], axis=1)
+    keep = (contacts >= min_hbonds) & (c1_distance >= c1_range[0]) & (c1_distance <= c1_range[1])
+    res_pairs, contacts, c1_distance = res_pairs[keep], contacts[keep], c1_distance[keep]
+
+    partner = np.full(len(residues), -1, dtype=np.int64)
+    for i, j in res_pairs[np.lexsort((c1_distance, -contacts))]:
+        if partner[i] < 0 and partner[j] < 0:
+            partner[i] = j
+            partner[j] = i
+
+    logger.info(f"Found {int((partner >= 0).sum()) // 2} base pairs among {len(residues)} residues.")
+    return residues, partner
+
+
+def find_bulges(pdb_name, max_size=1, min_stem=1):
+    residues, partner = find_base_pairs(pdb_name)
+    n_residues = len(residues)
+
+    # next_residue[i] is the sequence neighbour of residue i in the same chain, or -1 at a chain break.
+    next_residue = np.full(n_residues, -1, dtype=np.int64)
+    for i in range(n_residues - 1):
+        if residues[i][0] == residues[i + 1][0] and residues[i + 1][1] == residues[i][1] + 1:
+            next_residue[i] = i + 1
+    prev_residue = np.full(n_residues, -1, dtype=np.int64)
+    prev_residue[next_residue[next_residue >= 0]] = np.flatnonzero(next_residue >= 0)
+
+    def partners_adjacent(a, b):
+        # The partners of a and b are sequence neighbours in one chain (not merely consecutive indices).
+        return next_residue[partner[a]] == partner[b] or next_residue[partner[b]] == partner[a]
+
+    def stem_length(residue, step):
+        length = 0
+        while residue >= 0 and partner[residue] >= 0:
+            length += 1
+            neighbor = step[residue]
+            if neighbor < 0 or partner[neighbor] < 0 or not partners_adjacent(residue, neighbor):
+                break
+            residue = neighbor
+        return length
+
+    bulges = []
+    i = 0
+    while i < n_residues:
+        if partner[i] >= 0 or prev_residue[i] < 0:
+            i += 1
+            continue
+
+        run = [i]
+        while next_residue[run[-1]] >= 0 and partner[next_residue[run[-1]]] < 0 and len(run) <= max_size:
+            run.append(next_residue[run[-1]])
+        left, right = prev_residue[i], next_residue[run[-1]]
+
+        if (len(run) <= max_size and left >= 0 and right >= 0 and partner[left] >= 0 and partner[right] >= 0
+                and partners_adjacent(left, right)
+                and stem_length(left, prev_residue) >= min_stem and stem_length(right, next_residue) >= min_stem):
+            bulges.extend(residues[residue] for residue in run)
+
+        i = run[-1] + 1
+
+    logger.info(f"Found {len(bulges)} bulge residue(s): {', '.join(f'{name}{resi}' for _, resi, name in bulges)}")
+    return bulges
+
+
+def bulge_residue_ids(bulges, pdb_name):
+    structure = as_structure(pdb_name)
+    ambiguous = []
+    for chain_id, resi, resname in bulges:
+        chains = sorted(set(structure.chain_id[structure.residue_mask(resi)].tolist()))
+        if len(chains) > 1:
+            ambiguous.append(f"{resname}{resi} (chain {chain_id}; number also used in chain(s) "
+                             f"{', '.join(repr(chain) for chain in chains if chain != chain_id)})")
+    if ambiguous:
+        error_msg = (f"Detected bulge residue numbers are ambiguous across chains in {structure.source}: "
+                     f"{'; '.join(ambiguous)}. Renumber the chains or name the bulges explicitly.")
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    return [resname for _, _, resname in bulges], [resi for _, resi, _ in bulges]
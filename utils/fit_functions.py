@@ -0,0 +1,270 @@
+import os
+import csv
+import json
+import numpy as np
+import logging
+from utils.read_structure import read_structure
+from utils.get_atom_id import get_atom_id
+from utils.get_function import read_function_table
+from utils.generate_plumed import md_residue_request
+from utils.fourier import FourierSeries
+from utils.torsions import pseudo_torsions
+from utils.trajectory import open_trajectory, frame_chunks, ordered_map
+from utils.analyze_trajectory import BOLTZMANN
+
+logger = logging.getLogger(__name__)
+
+"""
+Fits the eta/theta correction functions of fix_function.txt from reference and simulated trajectories.
+
+Every manifest entry names a trajectory of one bulge, the prototype (sugar type and model) it belongs to and its
+role: 'reference' (the target ensemble, e.g. from experiment-restrained or high-level simulations) or
+'simulated' (the force field to be corrected). The eta/theta pseudo-torsions of the bulge are streamed from the
+trajectories in chunks of frames and binned straight into per-prototype histograms over [-pi, pi), so only the
+histograms are kept in memory; chunks are spread over `workers` processes and only their bin counts are sent
+back. `TorsionHistograms` can be saved and loaded again, so new trajectories are added to earlier counts.
+
+The correction of every prototype and torsion is the free-energy difference of the two ensembles,
+dF(x) = kT ln(P_sim(x) / P_ref(x)), with `pseudocount` added to every bin. It is fitted with a Fourier series of
+`order` terms by weighted least squares, the weight of a bin being the inverse variance of the log ratio,
+1 / (1/n_ref + 1/n_sim), so sparsely sampled bins count little. All series share the design matrix of the bin
+centres, so the normal equations of every prototype and torsion are built and solved in one batched call. The
+constant is shifted to put the minimum of every function at zero. This changes no forces, but the absolute bias
+energies differ from those of the bundled fix_function.txt, whose minima are not at zero.
+
+The manifest is a CSV file with a header row or a JSON-lines file (`.jsonl`/`.json`) with the fields
+`sugar_type`, `prototype` (e.g. model2), `role`, `trajectory`, `bulge_name` and `bulge_id`, and the optional
+field `topology` (required for non-PDB trajectories). Relative paths are resolved against the manifest directory.
+
+Parameters:
+- manifest (str): The path to the manifest file.
+- output (str): The function file to write, in the format read by get_function.
+- histograms (TorsionHistograms, optional): Counts to add the trajectories to. Default: new histograms.
+- n_bins (int): The number of histogram bins over [-pi, pi). Default: 72.
+- order (int): The number of Fourier orders. Default: 5.
+- temperature (float): The temperature in K used for kT. Default: 300.
+- pseudocount (float): The count added to every bin. Default: 0.5.
+- chunk_size (int): The number of frames per chunk. Default: 10000.
+- workers (int): The number of worker processes. Default: 1.
+- base_file (str, optional): A function file whose functions are kept for the prototypes that are not fitted.
+
+Returns:
+- summary (dict): The number of frames read, the histograms, and per fitted function the number of reference and
+  simulated samples and the weighted RMS residual of the fit (kJ/mol).
+"""
+
+ROLES = ('reference', 'simulated')
+DIHEDRALS = ('eta', 'theta')
+MANIFEST_FIELDS = ('sugar_type', 'prototype', 'role', 'trajectory', 'bulge_name', 'bulge_id')
+
+# Ridge added to the normal equations, relative to their trace, so that series with unsampled regions stay solvable.
+RIDGE = 1e-8
+
+
+class TorsionHistograms:
+    def __init__(self, n_bins=72, keys=None, counts=None):
+        self.n_bins = int(n_bins)
+        self.keys = [tuple(key) for key in keys] if keys is not None else []
+        self.counts = (np.asarray(counts, dtype=np.float64) if counts is not None
+                       else np.zeros((0, len(ROLES), len(DIHEDRALS), self.n_bins)))
+        self._rows = {key: row for row, key in enumerate(self.keys)}
+
+    def row(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self.keys)
+            self.keys.append(key)
+            self.counts = np.concatenate([self.counts, np.zeros((1,) + self.counts.shape[1:])])
+        return row
+
+    def add(self, key, role, counts):
+        row = self.row(key)
+        self.counts[row, ROLES.index(role)] += counts
+
+    def bin_centres(self):
+        return -np.pi + (np.arange(self.n_bins) + 0.5) * 2 * np.pi / self.n_bins
+
+    def save(self, histogram_file):
+        np.savez(histogram_file, n_bins=self.n_bins, keys=np.array(self.keys, dtype=str).reshape(-1, 2),
+                 counts=self.counts)
+
+    @classmethod
+    def load(cls, histogram_file):
+        with np.load(histogram_file) as data:
+            return cls(int(data['n_bins']), data['keys'].tolist(), data['counts'])
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def read_fit_manifest(manifest):
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, 'r', newline='') as file:
+        if manifest.endswith(('.jsonl', '.json')):
+            rows = [json.loads(line) for line in file if line.strip()]
+        else:
+            rows = list(csv.DictReader(file))
+
+    entries = []
+    for line_number, row in enumerate(rows, start=1):
+        missing = [field for field in MANIFEST_FIELDS if not row.get(field)]
+        if missing:
+            error_msg = f"Manifest entry {line_number} in {manifest} lacks the field(s): {', '.join(missing)}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        if row['role'] not in ROLES:
+            error_msg = f"Unknown role '{row['role']}' in manifest entry {line_number}. Valid roles are {', '.join(ROLES)}."
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        entries.append({
+            'key': (row['sugar_type'], row['prototype']),
+            'role': row['role'],
+            'trajectory': os.path.join(base_dir, row['trajectory']),
+            'topology': os.path.join(base_dir, row['topology']) if row.get('topology') else None,
+            'bulge_name': str(row['bulge_name']),
+            'bulge_id': int(row['bulge_id'])
+        })
+    return entries
+
+
+def _torsion_atoms(topology, bulge_resi, bulge_res):
+    structure = read_structure(topology, residues=md_residue_request([bulge_resi], [bulge_res]))
+    eta, theta = get_atom_id(structure, bulge_resi, bulge_res)
+    eta, theta = [int(atom) for atom in eta.split(',')], [int(atom) for atom in theta.split(',')]
+    # The five atoms C4'(i-1), P(i), C4'(i), P(i+1), C4'(i+1) as 0-based trajectory positions.
+    return np.array(eta + theta[-1:], dtype=np.int64) - 1
+
+
+def _histogram_chunk(entry_index, trajectory, topology, start, stop, atom_indices, n_bins):
+    reader = open_trajectory(trajectory, topology)
+    _, _, coords = reader.read(start, stop, atom_indices)
+    eta, theta = pseudo_torsions(*(coords[:, k] for k in range(5)))
+    bins = np.floor((np.stack([eta, theta]) + np.pi) * n_bins / (2 * np.pi)).astype(np.int64) % n_bins
+    counts = np.stack([np.bincount(dihedral_bins, minlength=n_bins) for dihedral_bins in bins])
+    return entry_index, counts
+
+
+def accumulate_histograms(entries, histograms, chunk_size=10000, workers=1):
+    tasks = []
+    atoms = {}
+    for entry_index, entry in enumerate(entries):
+        topology = entry['topology'] or entry['trajectory']
+        key = (topology, entry['bulge_id'], entry['bulge_name'])
+        if key not in atoms:
+            atoms[key] = _torsion_atoms(topology, entry['bulge_id'], entry['bulge_name'])
+        n_frames = open_trajectory(entry['trajectory'], entry['topology']).n_frames
+        tasks.extend((entry_index, entry['trajectory'], entry['topology'], start, stop, atoms[key], histograms.n_bins)
+                     for start, stop in frame_chunks(n_frames, chunk_size))
+
+    n_frames = 0
+    for entry_index, counts in ordered_map(_histogram_chunk, tasks, workers):
+        entry = entries[entry_index]
+        histograms.add(entry['key'], entry['role'], counts)
+        n_frames += int(counts[0].sum())
+    return n_frames
+
+
+def design_matrix(x, order=5):
+    angles = np.asarray(x, dtype=np.float64)[:, np.newaxis] * np.arange(1, order + 1)
+    columns = [np.ones((len(angles), 1))]
+    for k in range(order):
+        columns.extend([np.cos(angles[:, k:k + 1]), np.sin(angles[:, k:k + 1])])
+    return np.hstack(columns)
+
+
+def free_energy_differences(histograms, temperature=300.0, pseudocount=0.5):
+    counts = histograms.counts + pseudocount
+    probabilities = counts / counts.sum(axis=-1, keepdims=True)
+    kT = BOLTZMANN * temperature
+    reference, simulated = ROLES.index('reference'), ROLES.index('simulated')
+    delta = kT * (np.log(probabilities[:, simulated]) - np.log(probabilities[:, reference]))
+    weights = 1.0 / (1.0 / counts[:, reference] + 1.0 / counts[:, simulated])
+    return delta, weights
+
+
+def fit_fourier(x, values, weights, order=5):
+    # values and weights have shape (n_series, n_bins); every series is fitted in the same batched solve.
+    A = design_matrix(x, order)
+    normal = np.einsum('sb,bi,bj->sij', weights, A, A)
+    normal += RIDGE * np.trace(normal, axis1=1, axis2=2)[:, np.newaxis, np.newaxis] * np.eye(A.shape[1])
+    rhs = np.einsum('sb,bi->si', weights * values, A)
+    coeffs = np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0]
+
+    residuals = values - coeffs @ A.T
+    rms = np.sqrt(np.sum(weights * residuals ** 2, axis=1) / np.maximum(weights.sum(axis=1), 1e-300))
+    return coeffs, rms
+
+
+def fit_corrections(histograms, order=5, temperature=300.0, pseudocount=0.5):
+    fitted = [row for row, key in enumerate(histograms.keys) if histograms.counts[row].sum(axis=(1, 2)).all()]
+    for row, key in enumerate(histograms.keys):
+        if row not in fitted:
+            missing = [role for role, total in zip(ROLES, histograms.counts[row].sum(axis=(1, 2))) if not total]
+            logger.warning(f"No {' or '.join(missing)} samples for {key[0]} {key[1]}; not fitted.")
+
+    sub = TorsionHistograms(histograms.n_bins, [histograms.keys[row] for row in fitted], histograms.counts[fitted])
+    delta, weights = free_energy_differences(sub, temperature, pseudocount)
+    n_series = len(fitted) * len(DIHEDRALS)
+    coeffs, rms = fit_fourier(sub.bin_centres(), delta.reshape(n_series, -1), weights.reshape(n_series, -1), order)
+
+    functions = {}
+    fits = {}
+    grid = np.linspace(-np.pi, np.pi, 3601)
+    for series_index, (key, dihedral) in enumerate((key, dihedral) for key in sub.keys for dihedral in DIHEDRALS):
+        c = coeffs[series_index]
+        series = FourierSeries(c[0], c[1::2], c[2::2])
+        series.a0 -= float(series(grid).min())
+        functions[key + (dihedral,)] = series
+        row = sub.keys.index(key)
+        fits[key + (dihedral,)] = {
+            'reference_samples': int(sub.counts[row, ROLES.index('reference'), DIHEDRALS.index(dihedral)].sum()),
+            'simulated_samples': int(sub.counts[row, ROLES.index('simulated'), DIHEDRALS.index(dihedral)].sum()),
+            'rms_residual': float(rms[series_index])
+        }
+    return functions, fits
+
+
+def format_series(series, decimals=4):
+    terms = [f"{series.a0:.{decimals}f}"]
+    for order, (a, b) in enumerate(zip(series.cos_coeffs, series.sin_coeffs), start=1):
+        terms.append(f"{a:+.{decimals}f}*cos({order}*x){b:+.{decimals}f}*sin({order}*x)")
+    return ''.join(terms)
+
+
+def _sort_key(entry):
+    sugar_type, prototype, dihedral = entry
+    digits = ''.join(char for char in prototype if char.isdigit())
+    return sugar_type, DIHEDRALS.index(dihedral) if dihedral in DIHEDRALS else len(DIHEDRALS), \
+        int(digits) if digits else -1, prototype
+
+
+def write_function_file(func_file, functions, base_file=None):
+    table = dict(read_function_table(base_file)) if base_file else {}
+    table.update({entry: format_series(series) if isinstance(series, FourierSeries) else series
+                  for entry, series in functions.items()})
+    with open(func_file, 'w') as file:
+        file.write("Sugar_type\tPrototype\tDihedral\tFunction\n")
+        for entry in sorted(table, key=_sort_key):
+            file.write('\t'.join(entry + (table[entry],)) + '\n')
+    return len(table)
+
+
+def fit_functions(manifest, output, histograms=None, n_bins=72, order=5, temperature=300.0, pseudocount=0.5,
+                  chunk_size=10000, workers=1, base_file=None):
+    histograms = histograms if histograms is not None else TorsionHistograms(n_bins)
+    try:
+        entries = read_fit_manifest(manifest) if manifest else []
+        n_frames = accumulate_histograms(entries, histograms, chunk_size, workers)
+    except Exception as e:
+        logger.error(f"Error reading the trajectories of {manifest}: {e}")
+        raise
+
+    if not len(histograms):
+        error_msg = "No torsion samples to fit."
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    functions, fits = fit_corrections(histograms, order, temperature, pseudocount)
+    n_written = write_function_file(output, functions, base_file)
+    logger.info(f"Fitted {len(functions)} functions from {n_frames} frames; wrote {n_written} functions to {output}")
+    return {'frames': n_frames, 'histograms': histograms, 'fits': fits}
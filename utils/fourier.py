@@ -0,0 +1,158 @@
+import re
+import numpy as np
+
+"""
+Parses the Fourier-series correction functions of fix_function.txt into coefficient arrays.
+
+A function string has the form `a0+a1*cos(1*x)+b1*sin(1*x)+...+aK*cos(K*x)+bK*sin(K*x)` (x in radians).
+`FourierSeries.parse` turns it into the constant `a0` and the cosine/sine coefficient arrays, and calling the
+series evaluates it for an array of angles in one NumPy call; `derivative` gives the analytic dV/dx.
+
+`FourierStack` stacks several series so that x of shape (..., n_series) is evaluated term by term in one call.
+
+`write_bias_grid` tabulates a series (energy and derivative) on a periodic grid over [-pi, pi) in the format
+read by PLUMED's grid-based EXTERNAL bias, and `BiasGrid` reads such a file back and interpolates it with the
+same cubic Hermite spline (values plus derivatives) PLUMED uses. `BiasGrid.stack` combines grids of the same
+layout so that several terms are interpolated in one call.
+"""
+
+_NUMBER = r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+_TERM = re.compile(rf"({_NUMBER})\*(cos|sin)\((\d+)\*x\)")
+_CONSTANT = re.compile(rf"^({_NUMBER})(?=[+-]|$)")
+
+
+class FourierSeries:
+    def __init__(self, a0, cos_coeffs, sin_coeffs):
+        self.a0 = float(a0)
+        self.cos_coeffs = np.asarray(cos_coeffs, dtype=np.float64)
+        self.sin_coeffs = np.asarray(sin_coeffs, dtype=np.float64)
+        self.orders = np.arange(1, len(self.cos_coeffs) + 1, dtype=np.float64)
+
+    @classmethod
+    def parse(cls, function):
+        text = function.replace(' ', '')
+        constant = _CONSTANT.match(text)
+        a0 = float(constant.group(1)) if constant else 0.0
+        position = constant.end() if constant else 0
+
+        terms = {}
+        while position < len(text):
+            term = _TERM.match(text, position)
+            if term is None:
+                raise ValueError(f"Unsupported term in Fourier function at '{text[position:position + 30]}': {function}")
+            coefficient, kind, order = float(term.group(1)), term.group(2), int(term.group(3))
+            terms[(kind, order)] = terms.get((kind, order), 0.0) + coefficient
+            position = term.end()
+
+        n_orders = max([order for _, order in terms], default=0)
+        cos_coeffs = [terms.get(('cos', order), 0.0) for order in range(1, n_orders + 1)]
+        sin_coeffs = [terms.get(('sin', order), 0.0) for order in range(1, n_orders + 1)]
+        return cls(a0, cos_coeffs, sin_coeffs)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        angles = x[..., np.newaxis] * self.orders
+        return self.a0 + np.cos(angles) @ self.cos_coeffs + np.sin(angles) @ self.sin_coeffs
+
+    def derivative(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        angles = x[..., np.newaxis] * self.orders
+        return np.sin(angles) @ (-self.orders * self.cos_coeffs) + np.cos(angles) @ (self.orders * self.sin_coeffs)
+
+    def energy_and_derivative(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        angles = x[..., np.newaxis] * self.orders
+        cos, sin = np.cos(angles), np.sin(angles)
+        energy = self.a0 + cos @ self.cos_coeffs + sin @ self.sin_coeffs
+        derivative = sin @ (-self.orders * self.cos_coeffs) + cos @ (self.orders * self.sin_coeffs)
+        return energy, derivative
+
+    def __repr__(self):
+        return f"<FourierSeries order {len(self.orders)}>"
+
+
+class FourierStack:
+    def __init__(self, series_list):
+        n_orders = max([len(series.orders) for series in series_list], default=0)
+        self.a0 = np.array([series.a0 for series in series_list])
+        self.cos_coeffs = np.zeros((len(series_list), n_orders))
+        self.sin_coeffs = np.zeros((len(series_list), n_orders))
+        for row, series in enumerate(series_list):
+            self.cos_coeffs[row, :len(series.orders)] = series.cos_coeffs
+            self.sin_coeffs[row, :len(series.orders)] = series.sin_coeffs
+        self.orders = np.arange(1, n_orders + 1, dtype=np.float64)
+
+    def energy_and_derivative(self, x):
+        angles = np.asarray(x, dtype=np.float64)[..., np.newaxis] * self.orders
+        cos, sin = np.cos(angles), np.sin(angles)
+        energy = self.a0 + np.sum(cos * self.cos_coeffs + sin * self.sin_coeffs, axis=-1)
+        derivative = np.sum(self.orders * (cos * self.sin_coeffs - sin * self.cos_coeffs), axis=-1)
+        return energy, derivative
+
+    def __call__(self, x):
+        return self.energy_and_derivative(x)[0]
+
+
+class BiasGrid:
+    def __init__(self, x_min, spacing, values, derivatives):
+        self.x_min = float(x_min)
+        self.spacing = float(spacing)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.derivatives = np.asarray(derivatives, dtype=np.float64)
+
+    @classmethod
+    def read(cls, grid_file):
+        settings = {}
+        rows = []
+        with open(grid_file, 'r') as file:
+            for line in file:
+                if line.startswith('#! SET'):
+                    _, _, key, value = line.split()
+                    settings[key.split('_', 1)[0]] = value
+                elif line.strip() and not line.startswith('#'):
+                    rows.append([float(value) for value in line.split()])
+        rows = np.asarray(rows)
+        n_bins = int(settings['nbins'])
+        x_min = -np.pi if settings['min'] == '-pi' else float(settings['min'])
+        x_max = np.pi if settings['max'] == 'pi' else float(settings['max'])
+        return cls(x_min, (x_max - x_min) / n_bins, rows[:, 1], rows[:, 2])
+
+    @classmethod
+    def stack(cls, grids):
+        return cls(grids[0].x_min, grids[0].spacing, np.stack([grid.values for grid in grids]),
+                   np.stack([grid.derivatives for grid in grids]))
+
+    def energy_and_derivative(self, x):
+        n_bins = self.values.shape[-1]
+        position = (np.asarray(x, dtype=np.float64) - self.x_min) / self.spacing
+        left = np.floor(position).astype(np.int64)
+        t = position - left
+        left %= n_bins
+        right = (left + 1) % n_bins
+
+        if self.values.ndim == 2:
+            # Stacked grids: the last axis of x runs over the grids.
+            rows = np.arange(self.values.shape[0])
+            left, right = (rows, left), (rows, right)
+        v0, v1 = self.values[left], self.values[right]
+        d0, d1 = self.derivatives[left] * self.spacing, self.derivatives[right] * self.spacing
+        t2, t3 = t * t, t * t * t
+        energy = (2 * t3 - 3 * t2 + 1) * v0 + (t3 - 2 * t2 + t) * d0 + (-2 * t3 + 3 * t2) * v1 + (t3 - t2) * d1
+        derivative = ((6 * t2 - 6 * t) * v0 + (3 * t2 - 4 * t + 1) * d0 + (-6 * t2 + 6 * t) * v1
+                      + (3 * t2 - 2 * t) * d1) / self.spacing
+        return energy, derivative
+
+    def __call__(self, x):
+        return self.energy_and_derivative(x)[0]
+
+
+def write_bias_grid(grid_file, arg, label, series, n_bins=3600):
+    x = -np.pi + 2 * np.pi * np.arange(n_bins) / n_bins
+    energy, derivative = series.energy_and_derivative(x)
+    with open(grid_file, 'w') as file:
+        file.write(f"#! FIELDS {arg} {label}.bias der_{arg}\n")
+        file.write(f"#! SET min_{arg} -pi\n")
+        file.write(f"#! SET max_{arg} pi\n")
+        file.write(f"#! SET nbins_{arg} {n_bins}\n")
+        file.write(f"#! SET periodic_{arg} true\n")
+        np.savetxt(file, np.column_stack([x, energy, derivative]), fmt='%.10f')
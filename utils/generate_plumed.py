@@ -0,0 +1,190 @@
+from utils.read_structure import as_structure, read_structure, Structure
+from utils.get_trinucleotides import get_trinucleotides
+from utils.get_atom_id import get_atom_id
+from utils.sugar_type import sugar_type
+from utils.get_prototype import select_prototype
+from utils.search_prototypes import search_prototypes
+from utils.ensemble import assign_ensemble, ensemble_signature
+from utils.prototype_db import load_prototype_db
+from utils.get_function import get_function
+from utils.write_plumed import write_plumed
+from utils.incremental import IncrementalState
+from utils.profiling import PROFILER
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Runs the full BulgeFF pipeline for one structure: assigns a prototype to every bulge and writes the PLUMED input.
+
+Parameters:
+- bulge_pdb_name (str or Structure): The bulge structure, used for trinucleotide extraction and sugar pucker.
+- md_pdb_name (str or Structure): The MD structure, used for the eta/theta atom IDs.
+- bulge_resi_list (list of int): The residue numbers of the bulges.
+- bulge_res_list (list of str): The residue names of the bulges.
+- prototype_path (str): The directory containing the prototype database.
+- func_file (str): The path to the function file.
+- plumed_file (str): The path of the PLUMED file to write.
+- md_index (bool): Whether to keep a sidecar residue offset index next to the MD PDB (see read_structure).
+- plumed_options (dict, optional): Extra keyword arguments for write_plumed (e.g., bias_mode, grid_bins).
+- cache (ResultCache, optional): A result cache (see utils.cache). A bulge whose trinucleotide, prototype
+  database and function file match a cached entry reuses its sugar type, model and functions without running
+  the sugar pucker, prototype search or function lookup. Default: None (no cache).
+- consensus (str): How a multi-model bulge structure (NMR ensemble) is assigned, 'majority' or 'mean_rmsd'
+  (see utils.ensemble). Single-model structures ignore it. Default: 'majority'.
+- incremental (bool): Keep per-bulge fingerprints next to the PLUMED file (see utils.incremental), reuse the
+  assignments of unchanged bulges and rewrite only the changed bulge sections of an existing file. Default: False.
+
+The prototypes are found with the pruned top-k search of utils.search_prototypes (TOP_K matches per bulge).
+Only the bulge residues and their neighbours are read from the MD PDB. The time of every stage is recorded in
+utils.profiling.PROFILER.
+
+Returns:
+- results (list of dict): One entry per requested bulge with keys `bulge`, `sugar`, `model`, `model_type`,
+  `eta`, `theta`, `message`, `cached` (the assignment was reused from the cache or the incremental state) and `matches` (the closest prototypes as (model, model type, RMSD),
+  best first). `model_type` is None for bulges without a suitable prototype.
+  For an ensemble the entries also hold `agreement` and `ensemble` (the per-model assignments).
+"""
+
+TOP_K = 5
+
+
+def md_residue_request(bulge_resi_list, bulge_res_list):
+    residues = {}
+    for bulge_resi, bulge_res in zip(bulge_resi_list, bulge_res_list):
+        residues.setdefault(bulge_resi - 1, None)
+        residues.setdefault(bulge_resi + 1, None)
+    for bulge_resi, bulge_res in zip(bulge_resi_list, bulge_res_list):
+        residues[bulge_resi] = bulge_res
+    return residues
+
+
+def assign_prototype(bulge_structure, bulge_resi, bulge_res, reference, prototype_path, func_file):
+    with PROFILER.stage('pucker'):
+        sugar = sugar_type(bulge_structure, bulge_resi, bulge_res)
+    with PROFILER.stage('rmsd_search'):
+        rmsd_values, indices, model_types = search_prototypes(sugar, reference, prototype_path, k=TOP_K)
+    with PROFILER.stage('select'):
+        model, model_type = select_prototype(rmsd_values, indices, model_types)
+
+    assignment = {'sugar': sugar, 'rmsd': [float(value) for value in rmsd_values], 'model_indices': indices,
+                  'model_types': model_types, 'model': model, 'model_type': model_type,
+                  'eta_func': None, 'theta_func': None}
+    if model_type is not None:
+        with PROFILER.stage('function_lookup'):
+            assignment['eta_func'], assignment['theta_func'] = get_function(model_type, model, func_file)
+    return assignment
+
+
+def assign_ensemble_prototype(bulge_structure, bulge_resi, bulge_res, prototype_path, func_file, consensus):
+    with PROFILER.stage('rmsd_search'):
+        assignment = assign_ensemble(bulge_structure, bulge_resi, bulge_res, prototype_path, consensus)
+    PROFILER.count('ensemble_models', len(assignment['ensemble']))
+    assignment['eta_func'] = assignment['theta_func'] = None
+    if assignment['model_type'] is not None:
+        with PROFILER.stage('function_lookup'):
+            assignment['eta_func'], assignment['theta_func'] = get_function(assignment['model_type'],
+                                                                            assignment['model'], func_file)
+    return assignment
+
+
+def generate_plumed(bulge_pdb_name, md_pdb_name, bulge_resi_list, bulge_res_list, prototype_path, func_file, plumed_file,
+                    md_index=False, plumed_options=None, cache=None, consensus='majority', incremental=False):
+    eta_list = []
+    theta_list = []
+    eta_func_list = []
+    theta_func_list = []
+    written_res_list = []
+    written_resi_list = []
+    results = []
+
+    state = IncrementalState(plumed_file) if incremental else None
+    with PROFILER.stage('parse'):
+        # An unchanged bulge structure is parsed again only for bulges without a recorded assignment.
+        reuse_source = state is not None and state.source_unchanged(bulge_pdb_name, consensus)
+        bulge_structure = None if reuse_source else as_structure(bulge_pdb_name)
+        if isinstance(md_pdb_name, Structure):
+            md_structure = md_pdb_name
+        else:
+            md_structure = read_structure(md_pdb_name, residues=md_residue_request(bulge_resi_list, bulge_res_list),
+                                          use_index=md_index)
+    if cache is not None or state is not None:
+        with PROFILER.stage('cache_lookup'):
+            db_version = load_prototype_db(prototype_path).version
+
+    for bulge_resi, bulge_res in zip(bulge_resi_list, bulge_res_list):
+        PROFILER.count('bulges')
+        identifier = f"{bulge_res}{bulge_resi}"
+        assignment = None
+        content_digest = state.recorded_content(identifier) if reuse_source else None
+        if content_digest is not None:
+            with PROFILER.stage('cache_lookup'):
+                assignment = state.assignment(identifier, content_digest, db_version, func_file)
+
+        if assignment is None:
+            if bulge_structure is None:
+                with PROFILER.stage('parse'):
+                    bulge_structure = as_structure(bulge_pdb_name)
+            is_ensemble = len(bulge_structure.models) > 1
+            with PROFILER.stage('trinucleotides'):
+                reference = get_trinucleotides(bulge_structure, bulge_resi, bulge_res)
+        with PROFILER.stage('atom_ids'):
+            eta, theta = get_atom_id(md_structure, bulge_resi, bulge_res)
+
+        cached = assignment is not None
+        if not cached and (cache is not None or state is not None):
+            with PROFILER.stage('cache_lookup'):
+                content = reference
+                if is_ensemble:
+                    content += ensemble_signature(bulge_structure, bulge_resi, bulge_res, consensus)
+                if state is not None:
+                    content_digest = state.content_digest(content)
+                    assignment = state.assignment(identifier, content_digest, db_version, func_file)
+                if assignment is None and cache is not None:
+                    key = cache.key(content, db_version, func_file)
+                    assignment = cache.get(key)
+                    PROFILER.count('cache_hits' if assignment is not None else 'cache_misses')
+            cached = assignment is not None
+        if state is not None:
+            PROFILER.count('bulges_reused' if cached else 'bulges_changed')
+        if not cached and is_ensemble:
+            assignment = assign_ensemble_prototype(bulge_structure, bulge_resi, bulge_res, prototype_path, func_file,
+                                                   consensus)
+        elif not cached:
+            assignment = assign_prototype(bulge_structure, bulge_resi, bulge_res, reference, prototype_path, func_file)
+        if not cached and cache is not None:
+            cache.put(key, assignment)
+        if state is not None:
+            state.record(identifier, content_digest, db_version, func_file, assignment)
+
+        model, model_type = assignment['model'], assignment['model_type']
+        matches = sorted(zip(assignment['rmsd'], assignment['model_indices'], assignment['model_types']))[:TOP_K]
+        result = {'bulge': identifier, 'sugar': assignment['sugar'], 'model': None,
+                  'model_type': model_type, 'eta': eta, 'theta': theta, 'message': None, 'cached': cached,
+                  'matches': [(f"model{index}", match_type, rmsd) for rmsd, index, match_type in matches]}
+        if 'ensemble' in assignment:
+            result['agreement'], result['ensemble'] = assignment['agreement'], assignment['ensemble']
+        results.append(result)
+
+        if model_type is None:
+            result['message'] = model
+            continue
+
+        eta_func, theta_func = assignment['eta_func'], assignment['theta_func']
+        result['model'] = model
+
+        eta_list.append(eta)
+        theta_list.append(theta)
+        eta_func_list.append(eta_func)
+        theta_func_list.append(theta_func)
+        written_res_list.append(bulge_res)
+        written_resi_list.append(bulge_resi)
+
+    with PROFILER.stage('write'):
+        if state is not None:
+            state.write(eta_list, theta_list, eta_func_list, theta_func_list, written_res_list, written_resi_list,
+                        plumed_options)
+        else:
+            write_plumed(plumed_file, eta_list, theta_list, eta_func_list, theta_func_list, written_res_list,
+                         written_resi_list, **(plumed_options or {}))
+    return results
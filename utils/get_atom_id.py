@@ -1,14 +1,13 @@
-from utils.get_pdb_info import get_pdb_info
+from utils.read_structure import as_structure
 import logging
 
-logging.basicConfig(filename='BulgeFix.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 """
 Retrieves the atom IDs for a specified bulge residue and its neighboring residues from a PDB file.
 
 Parameters:
-pdb_name (str): The name of the PDB file to be read.
+pdb_name (str or Structure): The name of the PDB file to be read, or an already parsed Structure.
 bulge_resi (int): The residue number of the bulge residue.
 bulge_res (str): The name of the bulge residue.
 
@@ -20,40 +19,27 @@ tuple: A tuple containing two strings:
 
 def get_atom_id(pdb_name, bulge_resi, bulge_res):
 
-    pdb_info = get_pdb_info(pdb_name, option="full")
+    structure = as_structure(pdb_name)
 
-    logging.info(f"Processing: bulge residue: {bulge_res}, bulge residue id: {bulge_resi}")
+    logger.debug("Processing: bulge residue: %s, bulge residue id: %s", bulge_res, bulge_resi)
 
-    atom_id = {}
-    chain_id = None
-    found_residue = False
+    chain_id = structure.find_chain(bulge_resi, bulge_res)
 
-    for atom in pdb_info:
-        if atom['residue_number'] == bulge_resi and atom['residue_name'] == bulge_res:
-            chain_id = atom['chain_id']
-            found_residue = True
-            break
-    
-    if not found_residue:
+    if chain_id is None:
         error_msg = f"Residue {bulge_res} with ID {bulge_resi} not found in any chain."
-        logging.error(error_msg)
+        logger.error(error_msg)
         raise ValueError(error_msg)
 
-    for atom in pdb_info:
-        if atom['chain_id'] == chain_id:
-            if atom['residue_number'] == bulge_resi and atom['residue_name'] == bulge_res:
-                if atom['atom_name'] == "P":
-                    atom_id['P_i'] = (atom['atom_number'], atom['residue_number'])
-                elif atom['atom_name'] == "C4'":
-                    atom_id['C4_i'] = (atom['atom_number'], atom['residue_number'])
-            elif atom['residue_number'] == bulge_resi - 1:
-                if atom['atom_name'] == "C4'":
-                    atom_id['C4_i-1'] = (atom['atom_number'], atom['residue_number'])
-            elif atom['residue_number'] == bulge_resi + 1:
-                if atom['atom_name'] == "P":
-                    atom_id['P_i+1'] = (atom['atom_number'], atom['residue_number'])
-                elif atom['atom_name'] == "C4'":
-                    atom_id['C4_i+1'] = (atom['atom_number'], atom['residue_number'])
+    atom_id = {}
+    for key, resi, atom_name in [('C4_i-1', bulge_resi - 1, "C4'"),
+                                 ('P_i', bulge_resi, "P"),
+                                 ('C4_i', bulge_resi, "C4'"),
+                                 ('P_i+1', bulge_resi + 1, "P"),
+                                 ('C4_i+1', bulge_resi + 1, "C4'")]:
+        row = structure.find(chain_id, resi, atom_name)
+        if row is None or (resi == bulge_resi and structure.residue_name[row] != bulge_res):
+            continue
+        atom_id[key] = (int(structure.atom_number[row]), resi)
 
     required_atoms = {
         'C4_i-1': f"C4'_{bulge_resi-1}",
@@ -66,13 +52,13 @@ def get_atom_id(pdb_name, bulge_resi, bulge_res):
     missing_atoms = [required_atoms[atom] for atom in required_atoms if atom_id.get(atom) is None]
     if missing_atoms:
         error_msg = f"Missing atom(s) for eta/theta: {', '.join(missing_atoms)}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         raise ValueError(error_msg)
     
     eta = f"{atom_id['C4_i-1'][0]},{atom_id['P_i'][0]},{atom_id['C4_i'][0]},{atom_id['P_i+1'][0]}"
     theta = f"{atom_id['P_i'][0]},{atom_id['C4_i'][0]},{atom_id['P_i+1'][0]},{atom_id['C4_i+1'][0]}"
     
-    logging.info(f"Atom id of eta: {eta}")
-    logging.info(f"Atom id of theta: {theta}")
+    logger.debug("Atom id of eta: %s", eta)
+    logger.debug("Atom id of theta: %s", theta)
     
     return eta, theta
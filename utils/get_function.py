@@ -1,6 +1,8 @@
+import os
 import logging
+from utils.fourier import FourierSeries
 
-logging.basicConfig(filename='BulgeFix.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 """
 Reads a function file to retrieve the eta and theta functions based on the provided sugar type and prototype.
@@ -14,12 +16,28 @@ Returns:
 - tuple: A tuple containing two elements:
     - `eta_function` (str or None): The eta function corresponding to the provided sugar type and prototype, or None if not found.
     - `theta_function` (str or None): The theta function corresponding to the provided sugar type and prototype, or None if not found.
+
+The function table is parsed once per file (and re-read when the file changes) by `read_function_table`.
+`compile_function_table` returns the same table with every function compiled into a FourierSeries
+(coefficient arrays with vectorized energy and analytic derivative evaluation).
 """
 
-def get_function(sugar_type, prototype, func_file):
-    eta_function = None
-    theta_function = None
+_TABLE_CACHE = {}
+
+
+def read_function_table(func_file):
+    try:
+        stat = os.stat(func_file)
+    except FileNotFoundError:
+        logger.error(f"Function file not found: {func_file}")
+        raise
+
+    key = os.path.realpath(func_file)
+    cached = _TABLE_CACHE.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime, stat.st_size):
+        return cached[1]
 
+    table = {}
     try:
         with open(func_file, 'r') as file:
             lines = file.readlines()
@@ -28,24 +46,41 @@ def get_function(sugar_type, prototype, func_file):
                 parts = line.strip().split()
                 if len(parts) == 4:
                     st, pt, dihedral, function = parts
-                    if st == sugar_type and pt == prototype:
-                        if dihedral == 'eta':
-                            eta_function = function
-                            logging.info(f"Found eta function for {sugar_type}, {prototype}: {function}")
-                        elif dihedral == 'theta':
-                            theta_function = function
-                            logging.info(f"Found theta function for {sugar_type}, {prototype}: {function}")
-
-            if eta_function is None:
-                logging.warning(f"No eta function found for {sugar_type}, {prototype}")
-            if theta_function is None:
-                logging.warning(f"No theta function found for {sugar_type}, {prototype}")
+                    table[(st, pt, dihedral)] = function
 
-    except FileNotFoundError:
-        logging.error(f"Function file not found: {func_file}")
-        raise
     except Exception as e:
-        logging.error(f"Error reading function file {func_file}: {e}")
+        logger.error(f"Error reading function file {func_file}: {e}")
         raise
 
-    return eta_function, theta_function
\ No newline at end of file
+    _TABLE_CACHE[key] = ((stat.st_mtime, stat.st_size), table)
+    return table
+
+
+def compile_function_table(func_file):
+    table = read_function_table(func_file)
+    key = ('compiled', os.path.realpath(func_file))
+    cached = _TABLE_CACHE.get(key)
+    if cached is not None and cached[0] is table:
+        return cached[1]
+
+    compiled = {entry: FourierSeries.parse(function) for entry, function in table.items()}
+    _TABLE_CACHE[key] = (table, compiled)
+    return compiled
+
+
+def get_function(sugar_type, prototype, func_file):
+    table = read_function_table(func_file)
+
+    eta_function = table.get((sugar_type, prototype, 'eta'))
+    theta_function = table.get((sugar_type, prototype, 'theta'))
+
+    if eta_function is None:
+        logger.warning(f"No eta function found for {sugar_type}, {prototype}")
+    else:
+        logger.debug("Found eta function for %s, %s: %s", sugar_type, prototype, eta_function)
+    if theta_function is None:
+        logger.warning(f"No theta function found for {sugar_type}, {prototype}")
+    else:
+        logger.debug("Found theta function for %s, %s: %s", sugar_type, prototype, theta_function)
+
+    return eta_function, theta_function
@@ -1,29 +1,35 @@
-from Bio import PDB
-from io import StringIO
-from utils.calc_rmsd import calc_rmsd
+from utils.search_prototypes import search_prototypes
+import numpy as np
 import logging
 
-logging.basicConfig(filename='BulgeFix.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 """
 Finds and selects the best prototype model based on RMSD value from the provided prototypes.
 
 Parameters:
 - sugar (str): The type of sugar (e.g., "Others", "C2'-endo", "C3'-endo") to determine which prototype files to load.
-- reference (str): The PDB-format string of the reference structure for RMSD calculation.
+- reference (str or numpy.ndarray): The PDB-format string of the reference structure, or its C4'/P coordinates, for RMSD calculation.
 - prototype_path (str): The directory path where prototype PDB files are located.
 
 Returns:
 - model (str): The name of the selected model based on the lowest RMSD value.
 - model_type (str): The type of the selected model (e.g., "C2'-endo", "C3'-endo", or the value of `sugar`).
+
+`get_prototype` finds the closest candidates with the pruned search of utils.search_prototypes, which superposes
+only the models whose RMSD lower bound can beat the best match, and `select_prototype` picks the model from the
+returned RMSD values.
 """
 
+RMSD_THRESHOLDS = {"C2'-endo": 1.3, "C3'-endo": 1.2}
+
+
 def get_prototype_models(pdb_name):
     try:
         with open(pdb_name, 'r') as file:
             pdb_lines = file.readlines()
     except Exception as e:
-        logging.error(f"Error reading PDB file {pdb_name}: {e}")
+        logger.error(f"Error reading PDB file {pdb_name}: {e}")
         raise
 
     model_indices = []
@@ -40,45 +46,31 @@ def get_prototype_models(pdb_name):
     if current_model:
         models.append(''.join(current_model))
     
-    logging.info(f"Successfully parsed {len(models)} models from {pdb_name}")
+    logger.debug("Successfully parsed %d models from %s", len(models), pdb_name)
     return models, model_indices
 
 
-def get_prototype(sugar, reference, prototype_path):
-    threshold = {"C2'-endo": 1.3, "C3'-endo": 1.2}
-    
-    try:
-        if sugar == "Others":
-            logging.info("Sugar type is 'Others', loading both C2'-endo and C3'-endo prototypes.")
-            prototypes_C2, indices_C2 = get_prototype_models(f"{prototype_path}/C2'-endo.pdb")
-            prototypes_C3, indices_C3 = get_prototype_models(f"{prototype_path}/C3'-endo.pdb")
-            prototypes = prototypes_C2 + prototypes_C3
-            indices = indices_C2 + indices_C3
-        else:
-            prototype_file = f"{prototype_path}/{sugar}.pdb"
-            prototypes, indices = get_prototype_models(prototype_file)
-    except Exception as e:
-        logging.error(f"Error loading prototypes for sugar type {sugar}: {e}")
-        raise
-    
-    rmsd_values = [calc_rmsd(reference, prototype) for prototype in prototypes]
-    lowest_model_index = min(enumerate(rmsd_values), key=lambda x: x[1])[0]
+def select_prototype(rmsd_values, indices, model_types):
+    threshold = RMSD_THRESHOLDS
+
+    lowest_model_index = int(np.argmin(rmsd_values))
     lowest_rmsd_value = rmsd_values[lowest_model_index]
-    
+
     actual_model_index = indices[lowest_model_index]
-    
-    if sugar == "Others":
-        model_type = "C2'-endo" if lowest_model_index < len(prototypes_C2) else "C3'-endo"
-    else:
-        model_type = sugar
+    model_type = model_types[lowest_model_index]
 
-    logging.info(f"Lowest RMSD value for {model_type}: {lowest_rmsd_value:.3f} Å")
+    logger.info("Lowest RMSD value for %s: %.3f Å", model_type, lowest_rmsd_value)
 
     if model_type in threshold and lowest_rmsd_value > threshold[model_type]:
         warning_message = f"Error: No suitable prototype found as the RMSD value exceeds the threshold for {model_type}. RMSD: {lowest_rmsd_value:.3f} Å, Threshold: {threshold[model_type]} Å"
-        logging.warning(warning_message)
+        logger.warning(warning_message)
         return warning_message, None
     
     model = f"model{actual_model_index}"
-    logging.info(f"Selected model: {model} for sugar type: {model_type}")
+    logger.info("Selected model: %s for sugar type: %s", model, model_type)
     return model, model_type
+
+
+def get_prototype(sugar, reference, prototype_path):
+    rmsd_values, indices, model_types = search_prototypes(sugar, reference, prototype_path)
+    return select_prototype(rmsd_values, indices, model_types)
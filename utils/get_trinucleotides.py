@@ -1,52 +1,60 @@
-from utils.get_pdb_info import get_pdb_info
+from utils.read_structure import as_structure
 from utils.atom_to_pdb import atom_to_pdb
+import numpy as np
 import logging
 
-logging.basicConfig(filename='BulgeFix.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 """
 Extracts trinucleotide information from a PDB file based on the specified bulge residue and its neighboring residues.
 
 Parameters:
-- pdb_name (str): The name of the PDB file to be read.
+- pdb_name (str or Structure): The name of the PDB file to be read, or an already parsed Structure.
 - bulge_resi (int): The residue number of the bulge.
 - bulge_res (str): The residue name of the bulge.
 
 Returns:
 - trinucleotides (str): A PDB-format string representing the atoms of the trinucleotide structure including the bulge and its neighboring residues.
+
+For an ensemble the atoms of the first model are used; `trinucleotide_rows` returns their structure rows.
 """
 
+def trinucleotide_rows(structure, bulge_resi, bulge_res):
+    residue_numbers = structure.residue_number
+    mask = (np.isin(residue_numbers, [bulge_resi - 1, bulge_resi, bulge_resi + 1]) &
+            ((residue_numbers != bulge_resi) | (structure.residue_name == bulge_res)))
+    if structure.first_model_mask is not None:
+        mask &= structure.first_model_mask
+    return np.flatnonzero(mask)
+
+
 def get_trinucleotides(pdb_name, bulge_resi, bulge_res):
     try:
-        pdb_info = get_pdb_info(pdb_name, option="full")
-        logging.info(f"Processing trinucleotides with bulge residue: {bulge_resi}-{bulge_res}")
+        structure = as_structure(pdb_name)
+        logger.debug("Processing trinucleotides with bulge residue: %s-%s", bulge_resi, bulge_res)
 
         target_residues = {bulge_resi - 1, bulge_resi, bulge_resi + 1}
-        atom_info = []
-        residue_names = {}
-        found_residues = set()
+        residue_numbers = structure.residue_number
+        rows = trinucleotide_rows(structure, bulge_resi, bulge_res)
 
-        for atom in pdb_info:
-            if (atom['residue_number'] in target_residues and
-                (atom['residue_number'] != bulge_resi or atom['residue_name'] == bulge_res)):
-                atom_info.append(atom)
-                found_residues.add(atom['residue_number'])
-                residue_names[atom['residue_number']] = atom['residue_name']
+        residue_names = dict(zip(residue_numbers[rows].tolist(), structure.residue_name[rows].tolist()))
+        found_residues = set(residue_names)
+        atom_info = structure.atom_info(rows)
 
         missing_residues = target_residues - found_residues
         if missing_residues:
             error_msg = f"Missing residues in target set: {missing_residues}"
-            logging.error(error_msg)
+            logger.error(error_msg)
             raise ValueError(error_msg)
 
-        found_residues_info = {res_num: residue_names[res_num] for res_num in found_residues}
-        logging.info(f"Found trinucleotide atoms for residues: {found_residues_info}")
+        if logger.isEnabledFor(logging.DEBUG):
+            found_residues_info = {res_num: residue_names[res_num] for res_num in found_residues}
+            logger.debug("Found trinucleotide atoms for residues: %s", found_residues_info)
 
         trinucleotides = atom_to_pdb(atom_info)
 
     except Exception as e:
-        logging.error(f"An error occurred while processing trinucleotides: {str(e)}")
+        logger.error(f"An error occurred while processing trinucleotides: {str(e)}")
         raise
 
     return trinucleotides
@@ -0,0 +1,210 @@
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+from utils.cache import file_digest
+from utils.write_plumed import write_plumed, write_bulge_section
+from utils.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+"""
+Keeps the per-bulge inputs of a PLUMED file so that a rerun recomputes and rewrites only the bulges that changed.
+
+The state is stored next to the PLUMED file in `<plumed_file>.bfstate.json`. For every bulge it records
+- `content`: the SHA-256 of the trinucleotide atoms of the bulge structure (all models for an ensemble, with the
+  consensus mode);
+- `fingerprint`: the SHA-256 of `content`, the version of the compiled prototype database and the SHA-256 of the
+  function file;
+- `assignment`: the prototype assignment computed for that fingerprint (sugar type, matches, model, functions);
+- `section`: the SHA-256 of what its `# Bulge` block is written from (the eta/theta atom serials of the MD
+  structure and the two functions), and `functions`, that of the two functions alone.
+It also records the SHA-256 of the bulge structure file, the write options and the SHA-256 of the PLUMED file as
+written.
+
+On a rerun a bulge whose fingerprint is unchanged reuses its assignment, so only the changed bulges go through
+the pucker, prototype search and function lookup. While the bulge structure file is unchanged (the usual case when
+only the MD structure is iterated on) the recorded `content` digests are used and the file is not even parsed.
+When the options, the written bulges and the PLUMED file itself (not edited since) are unchanged, only the
+`# Bulge` blocks whose section hash changed are regenerated (in grid mode with new grid files only when the
+functions changed) and spliced into the existing file; otherwise the whole file is rewritten from the assignments. The lean layout merges every
+bulge into one action and is always rewritten.
+
+`watch_inputs(paths, run, interval, on_error)` calls `run()` once and again whenever one of the files changes (its
+size and mtime are polled every `interval` seconds and must be stable for one interval), until interrupted. A
+failed regeneration is logged and passed to `on_error`, and watching continues.
+"""
+
+STATE_FORMAT = 1
+STATE_SUFFIX = '.bfstate.json'
+SECTION_MARKER = "\n# Bulge "
+
+
+def state_file_name(plumed_file):
+    return f"{plumed_file}{STATE_SUFFIX}"
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class IncrementalState:
+    def __init__(self, plumed_file):
+        self.plumed_file = plumed_file
+        self.path = state_file_name(plumed_file)
+        self.previous = {}
+        self.bulges = {}
+        self.source = None
+        try:
+            with open(self.path, 'r') as file:
+                state = json.load(file)
+            if state.get('format') == STATE_FORMAT:
+                self.previous = state
+        except (OSError, ValueError):
+            pass
+
+    def source_unchanged(self, bulge_pdb_name, consensus):
+        # The digest of the bulge structure file; a parsed Structure has none and is always re-read.
+        self.source = _digest(file_digest(bulge_pdb_name), consensus) if isinstance(bulge_pdb_name, str) else None
+        return self.source is not None and self.source == self.previous.get('source')
+
+    def content_digest(self, content):
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def recorded_content(self, identifier):
+        return self.previous.get('bulges', {}).get(identifier, {}).get('content')
+
+    def _fingerprint(self, content_digest, db_version, func_file):
+        return _digest(STATE_FORMAT, db_version, file_digest(func_file), content_digest)
+
+    def assignment(self, identifier, content_digest, db_version, func_file):
+        entry = self.previous.get('bulges', {}).get(identifier)
+        if entry is not None and entry['fingerprint'] == self._fingerprint(content_digest, db_version, func_file):
+            return entry['assignment']
+        return None
+
+    def record(self, identifier, content_digest, db_version, func_file, assignment):
+        self.bulges[identifier] = {'content': content_digest,
+                                   'fingerprint': self._fingerprint(content_digest, db_version, func_file),
+                                   'assignment': assignment}
+
+    def _splice(self, sections, options):
+        # Returns the identifiers of the rewritten blocks, or None when the file has to be written in full.
+        previous = self.previous
+        if not previous or previous.get('options') != options or options.get('layout', 'default') != 'default':
+            return None
+        if previous.get('written') != [identifier for identifier, _, _ in sections]:
+            return None
+        try:
+            with open(self.plumed_file, 'rb') as file:
+                content = file.read()
+        except OSError:
+            return None
+        if hashlib.sha256(content).hexdigest() != previous.get('plumed_digest'):
+            logger.info(f"{self.plumed_file} was changed since it was written; rewriting it.")
+            return None
+
+        parts = content.decode().split(SECTION_MARKER)
+        header, blocks = parts[0], {part.split('\n', 1)[0]: part for part in parts[1:]}
+        if list(blocks) != previous['written']:
+            return None
+
+        grid_dir = os.path.dirname(os.path.abspath(self.plumed_file))
+        changed = []
+        for identifier, section, arguments in sections:
+            recorded = previous['bulges'].get(identifier, {})
+            if recorded.get('section') == section:
+                continue
+            # The grid files depend only on the functions, not on the atoms of the torsions.
+            write_grids = recorded.get('functions') != _digest(*arguments[2:]) or not all(
+                os.path.exists(os.path.join(grid_dir, f"bias_{torsion}_{identifier}.grid")) for torsion in ('eta', 'theta'))
+            buffer = io.StringIO()
+            write_bulge_section(buffer, grid_dir, identifier, *arguments, write_grids=write_grids,
+                                **{key: options[key] for key in ('bias_mode', 'grid_bins', 'print_stride')
+                                   if key in options})
+            blocks[identifier] = buffer.getvalue()[len(SECTION_MARKER):]
+            changed.append(identifier)
+
+        if changed:
+            tmp_file = f"{self.plumed_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w') as file:
+                file.write(header + ''.join(SECTION_MARKER + block for block in blocks.values()))
+            os.replace(tmp_file, self.plumed_file)
+        return changed
+
+    def write(self, eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list, bulge_resi_list,
+              plumed_options=None):
+        options = dict(plumed_options or {})
+        sections = []
+        for eta, theta, eta_func, theta_func, bulge_res, bulge_resi in zip(eta_list, theta_list, eta_func_list,
+                                                                           theta_func_list, bulge_res_list,
+                                                                           bulge_resi_list):
+            identifier = f"{bulge_res}{bulge_resi}"
+            sections.append((identifier, _digest(eta, theta, eta_func, theta_func),
+                             (eta, theta, eta_func, theta_func)))
+
+        changed = self._splice(sections, options)
+        if changed is None:
+            write_plumed(self.plumed_file, eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list,
+                         bulge_resi_list, **options)
+            logger.info(f"Wrote all {len(sections)} bulge sections of {self.plumed_file}")
+        else:
+            PROFILER.count('sections_rewritten', len(changed))
+            logger.info(f"Rewrote {len(changed)} of {len(sections)} bulge sections of {self.plumed_file}"
+                        + (f": {', '.join(changed)}" if changed else ""))
+
+        for identifier, section, arguments in sections:
+            self.bulges[identifier].update(section=section, functions=_digest(*arguments[2:]))
+        with open(self.plumed_file, 'rb') as file:
+            plumed_digest = hashlib.sha256(file.read()).hexdigest()
+        state = {'format': STATE_FORMAT, 'source': self.source, 'options': options,
+                 'written': [identifier for identifier, _, _ in sections], 'plumed_digest': plumed_digest,
+                 'bulges': self.bulges}
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_file, self.path)
+        return changed
+
+
+def _signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return signature
+
+
+def watch_inputs(paths, run, interval=1.0, on_error=None):
+    signature = _signature(paths)
+    run()
+    try:
+        while True:
+            time.sleep(interval)
+            current = _signature(paths)
+            if current == signature:
+                continue
+            # Wait until the files stop changing, e.g. while GROMACS is still writing them.
+            time.sleep(interval)
+            if _signature(paths) != current:
+                continue
+            changed = [path for path, old, new in zip(paths, signature, current) if old != new]
+            signature = current
+            logger.info(f"Changed input(s): {', '.join(changed)}; regenerating.")
+            try:
+                run()
+            except Exception as e:
+                logger.error(f"Regeneration failed: {e}")
+                if on_error is not None:
+                    on_error(e)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching the inputs.")
@@ -0,0 +1,240 @@
+import logging
+import numpy as np
+from utils.read_structure import as_structure
+from utils.get_trinucleotides import get_trinucleotides
+from utils.torsions import pseudo_torsions
+from utils.prototype_db import load_prototype_db
+from utils.generate_plumed import assign_prototype, assign_ensemble_prototype
+from utils.fit_functions import TorsionHistograms, ROLES
+from utils.bias_surface import bias_surface, baseline_energies, grid_angles, SurfaceLookup
+from utils.analyze_trajectory import BOLTZMANN
+from utils.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+"""
+Predicts how the assigned BulgeFF corrections shift the eta/theta populations of every bulge, without MD.
+
+Every bulge is assigned a prototype and its eta/theta functions as in the pipeline (the MD structure is not
+needed). Its baseline and biased landscapes are tabulated on a periodic grid and cached (see utils.bias_surface),
+and both are sampled at once by `n_walkers` walkers per surface, all advanced together with array operations:
+- 'mc': Metropolis Monte Carlo with Gaussian moves of `step_size` in both torsions;
+- 'langevin': overdamped Langevin (Brownian) dynamics, x += -D dt/kT grad F + sqrt(2 D dt) xi, with the rms
+  random displacement sqrt(2 D dt) set to `step_size`.
+The walkers start uniformly on the torus, the first `burn_in` fraction of the steps is discarded and the
+populations are accumulated every `sample_every` steps, since consecutive steps of a walker are strongly correlated.
+
+The population of a bulge is the fraction of samples within `window` (in both torsions) of the eta/theta of its
+assigned prototype; the shift is the biased minus the baseline population. The same fraction computed exactly as
+a Boltzmann sum over the grid is reported alongside as a convergence check, with the circular mean eta/theta and
+the most populated 10-degree cell of both ensembles.
+
+Parameters:
+- bulge_pdb_name (str or Structure): The bulge structure.
+- bulge_resi_list (list of int): The residue numbers of the bulges.
+- bulge_res_list (list of str): The residue names of the bulges.
+- prototype_path (str): The directory containing the prototype database.
+- func_file (str): The path to the function file.
+- output (str): The population table to write. Default: 'prescreen.dat'.
+- baseline (str or TorsionHistograms, optional): Histograms of utils.fit_functions whose 'simulated' counts of the
+  assigned prototype give the baseline landscape. Default: None (flat baseline, i.e. the bias alone).
+- n_grid (int): The number of grid points per torsion. Default: 360.
+- n_walkers (int): The number of walkers per surface. Default: 4096.
+- n_steps (int): The number of steps. Default: 2000.
+- sampler (str): 'mc' or 'langevin'. Default: 'mc'.
+- step_size (float): The step size in degrees. Default: 10.
+- window (float): The half-width of the prototype window in degrees. Default: 30.
+- temperature (float): The temperature in K used for kT. Default: 300.
+- burn_in (float): The fraction of the steps discarded. Default: 0.2.
+- sample_every (int): The number of steps between samples. Default: 10.
+- seed (int, optional): The random seed. Default: None.
+- surface_dir (str, optional): The surface cache directory (see utils.bias_surface).
+- consensus (str): How a multi-model bulge structure is assigned (see utils.ensemble). Default: 'majority'.
+
+Returns:
+- results (list of dict): One entry per bulge with keys `bulge`, `sugar`, `model`, `model_type`, `message` and,
+  for assigned bulges, `prototype` (eta, theta in degrees) and `baseline`/`biased`, each a dict with
+  `population`, `exact`, `mean` (eta, theta) and `mode` (eta, theta) in degrees; and `shift`.
+"""
+
+SAMPLERS = ('mc', 'langevin')
+MODE_BINS = 36
+
+
+def prototype_torsions(prototype_path, model, model_type):
+    db = load_prototype_db(prototype_path)
+    rows = np.flatnonzero((db.model_indices == int(model[len('model'):]))
+                          & (db.pucker == db.classes.index(model_type)))
+    coords = db.coords[rows[0]]
+    # Backbone order P, C4' of residues i-1, i, i+1: eta and theta are spanned by the atoms 1-5.
+    return np.degrees(pseudo_torsions(*coords[1:6]))
+
+
+def _wrap(x):
+    return (x + np.pi) % (2 * np.pi) - np.pi
+
+
+def _window_mask(eta, theta, centres, window):
+    return ((np.abs(_wrap(eta - centres[:, 0:1])) <= window)
+            & (np.abs(_wrap(theta - centres[:, 1:2])) <= window))
+
+
+def sample_surfaces(surfaces, centres, kT, n_walkers=4096, n_steps=2000, sampler='mc', step_size=np.radians(10.0),
+                    window=np.radians(30.0), burn_in=0.2, sample_every=10, seed=None):
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler: {sampler}. Valid samplers are {', '.join(SAMPLERS)}.")
+
+    lookup = SurfaceLookup(surfaces)
+    n_surfaces = len(surfaces)
+    rng = np.random.default_rng(seed)
+    eta = rng.uniform(-np.pi, np.pi, (n_surfaces, n_walkers))
+    theta = rng.uniform(-np.pi, np.pi, (n_surfaces, n_walkers))
+    energy = lookup.energy(eta, theta)
+    drift = step_size ** 2 / (2 * kT)
+
+    in_window = np.zeros(n_surfaces)
+    trig = np.zeros((n_surfaces, 4))
+    cells = np.zeros(n_surfaces * MODE_BINS * MODE_BINS, dtype=np.int64)
+    offsets = (np.arange(n_surfaces) * MODE_BINS * MODE_BINS)[:, np.newaxis]
+    accepted = 0
+    n_samples = 0
+    first = int(burn_in * n_steps)
+    for step in range(n_steps):
+        if sampler == 'mc':
+            trial_eta = _wrap(eta + step_size * rng.standard_normal(eta.shape))
+            trial_theta = _wrap(theta + step_size * rng.standard_normal(theta.shape))
+            trial_energy = lookup.energy(trial_eta, trial_theta)
+            accept = rng.random(eta.shape) < np.exp(np.minimum(0.0, (energy - trial_energy) / kT))
+            eta = np.where(accept, trial_eta, eta)
+            theta = np.where(accept, trial_theta, theta)
+            energy = np.where(accept, trial_energy, energy)
+            accepted += int(accept.sum())
+        else:
+            eta_gradient, theta_gradient = lookup.gradient(eta, theta)
+            eta = _wrap(eta - drift * eta_gradient + step_size * rng.standard_normal(eta.shape))
+            theta = _wrap(theta - drift * theta_gradient + step_size * rng.standard_normal(theta.shape))
+
+        if step < first or (step - first) % sample_every:
+            continue
+        n_samples += n_walkers
+        in_window += _window_mask(eta, theta, centres, window).sum(axis=1)
+        trig += np.stack([np.cos(eta).sum(axis=1), np.sin(eta).sum(axis=1),
+                          np.cos(theta).sum(axis=1), np.sin(theta).sum(axis=1)], axis=1)
+        i = np.minimum(((eta + np.pi) * MODE_BINS / (2 * np.pi)).astype(np.int64), MODE_BINS - 1)
+        j = np.minimum(((theta + np.pi) * MODE_BINS / (2 * np.pi)).astype(np.int64), MODE_BINS - 1)
+        cells += np.bincount((offsets + i * MODE_BINS + j).ravel(), minlength=len(cells))
+
+    mode = np.argmax(cells.reshape(n_surfaces, -1), axis=1)
+    width = 360.0 / MODE_BINS
+    statistics = {
+        'population': in_window / max(n_samples, 1),
+        'mean': np.degrees(np.stack([np.arctan2(trig[:, 1], trig[:, 0]), np.arctan2(trig[:, 3], trig[:, 2])], axis=1)),
+        'mode': np.stack([-180.0 + (mode // MODE_BINS + 0.5) * width, -180.0 + (mode % MODE_BINS + 0.5) * width], axis=1),
+        'acceptance': accepted / (n_steps * n_surfaces * n_walkers) if sampler == 'mc' else None
+    }
+    return statistics
+
+
+def exact_populations(surfaces, centres, kT, window=np.radians(30.0)):
+    surfaces = np.asarray(surfaces, dtype=np.float64)
+    x = grid_angles(surfaces.shape[-1])
+    weights = np.exp(-(surfaces - surfaces.min(axis=(1, 2), keepdims=True)) / kT)
+    eta_in = np.abs(_wrap(x[np.newaxis, :] - centres[:, 0:1])) <= window
+    theta_in = np.abs(_wrap(x[np.newaxis, :] - centres[:, 1:2])) <= window
+    inside = np.einsum('sij,si,sj->s', weights, eta_in, theta_in)
+    return inside / weights.sum(axis=(1, 2))
+
+
+def _format(values):
+    return ' '.join(f"{value:.1f}" for value in values)
+
+
+def prescreen(bulge_pdb_name, bulge_resi_list, bulge_res_list, prototype_path, func_file, output='prescreen.dat',
+              baseline=None, n_grid=360, n_walkers=4096, n_steps=2000, sampler='mc', step_size=10.0, window=30.0,
+              temperature=300.0, burn_in=0.2, sample_every=10, seed=None, surface_dir=None, consensus='majority'):
+    if isinstance(baseline, str):
+        baseline = TorsionHistograms.load(baseline)
+    kT = BOLTZMANN * temperature
+
+    with PROFILER.stage('parse'):
+        bulge_structure = as_structure(bulge_pdb_name)
+    results = []
+    assigned = []
+    for bulge_resi, bulge_res in zip(bulge_resi_list, bulge_res_list):
+        PROFILER.count('bulges')
+        identifier = f"{bulge_res}{bulge_resi}"
+        if len(bulge_structure.models) > 1:
+            assignment = assign_ensemble_prototype(bulge_structure, bulge_resi, bulge_res, prototype_path,
+                                                   func_file, consensus)
+        else:
+            with PROFILER.stage('trinucleotides'):
+                reference = get_trinucleotides(bulge_structure, bulge_resi, bulge_res)
+            assignment = assign_prototype(bulge_structure, bulge_resi, bulge_res, reference, prototype_path,
+                                          func_file)
+
+        result = {'bulge': identifier, 'sugar': assignment['sugar'], 'model': None,
+                  'model_type': assignment['model_type'], 'message': None}
+        results.append(result)
+        if assignment['model_type'] is None:
+            result['message'] = assignment['model']
+            logger.info(f"{identifier}: {assignment['model']}")
+            continue
+        result['model'] = assignment['model']
+        result['prototype'] = prototype_torsions(prototype_path, assignment['model'], assignment['model_type']).tolist()
+        assigned.append((result, assignment))
+
+    if not assigned:
+        logger.warning("No bulge was assigned a prototype; nothing to sample.")
+    else:
+        surfaces = []
+        with PROFILER.stage('surfaces'):
+            for result, assignment in assigned:
+                base = None
+                key = (assignment['model_type'], assignment['model'])
+                if baseline is not None and key in baseline.keys:
+                    counts = baseline.counts[baseline.keys.index(key), ROLES.index('simulated')]
+                    if counts.sum():
+                        base = baseline_energies(counts, n_grid, temperature)
+                if baseline is not None and base is None:
+                    logger.warning(f"No simulated histogram of {key[0]} {key[1]} for {result['bulge']}; "
+                                   f"using a flat baseline.")
+                base_surface = (np.zeros((n_grid, n_grid)) if base is None
+                                else bias_surface('0', '0', n_grid, base, surface_dir)[0])
+                biased_surface, hit = bias_surface(assignment['eta_func'], assignment['theta_func'], n_grid, base,
+                                                   surface_dir)
+                PROFILER.count('surface_cache_hits' if hit else 'surface_cache_misses')
+                surfaces.extend([base_surface, biased_surface])
+
+        centres = np.radians(np.repeat([result['prototype'] for result, _ in assigned], 2, axis=0))
+        with PROFILER.stage('sampling'):
+            statistics = sample_surfaces(np.stack(surfaces), centres, kT, n_walkers, n_steps, sampler,
+                                         np.radians(step_size), np.radians(window), burn_in, sample_every, seed)
+            exact = exact_populations(np.stack(surfaces), centres, kT, np.radians(window))
+        PROFILER.count('walker_steps', len(surfaces) * n_walkers * n_steps)
+        if statistics['acceptance'] is not None:
+            logger.info(f"Monte Carlo acceptance: {statistics['acceptance']:.1%}")
+
+        for index, (result, _) in enumerate(assigned):
+            for offset, name in enumerate(('baseline', 'biased')):
+                row = 2 * index + offset
+                result[name] = {'population': float(statistics['population'][row]), 'exact': float(exact[row]),
+                                'mean': statistics['mean'][row].tolist(), 'mode': statistics['mode'][row].tolist()}
+            result['shift'] = result['biased']['population'] - result['baseline']['population']
+
+    with open(output, 'w') as file:
+        file.write("# bulge sugar model_type model eta_prototype theta_prototype population_baseline population_biased "
+                   "shift exact_baseline exact_biased mean_eta_baseline mean_theta_baseline mean_eta_biased "
+                   "mean_theta_biased mode_eta_baseline mode_theta_baseline mode_eta_biased mode_theta_biased\n")
+        for result in results:
+            if result['model_type'] is None:
+                file.write(f"# {result['bulge']} {result['sugar']}: {result['message']}\n")
+                continue
+            base, biased = result['baseline'], result['biased']
+            file.write(f"{result['bulge']} {result['sugar']} {result['model_type']} {result['model']} "
+                       f"{_format(result['prototype'])} {base['population']:.4f} {biased['population']:.4f} "
+                       f"{result['shift']:+.4f} {base['exact']:.4f} {biased['exact']:.4f} "
+                       f"{_format(base['mean'])} {_format(biased['mean'])} {_format(base['mode'])} "
+                       f"{_format(biased['mode'])}\n")
+    logger.info(f"Pre-screened {len(assigned)} of {len(results)} bulges with {n_walkers} {sampler} walkers per "
+                f"surface. Output: {output}")
+    return results
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+"""
+Stage timers, counters and logging set-up for BulgeFF runs.
+
+`PROFILER` is the process-wide Profiler. `PROFILER.stage(name)` is a context manager that adds the wall time of
+its block to the stage `name`, and `PROFILER.count(name, n)` increments a counter. Both cost about a microsecond,
+so they stay enabled. The pipeline stages are parse, bulge_detection, trinucleotides, atom_ids, cache_lookup,
+pucker, rmsd_search, select, function_lookup and write. The counters include rmsd_evaluations (one per
+reference/prototype superposition), atoms_parsed, bulges, cache_hits, cache_misses and, in incremental
+mode, bulges_reused, bulges_changed and sections_rewritten. The pre-screening adds the stages surfaces and
+sampling and the counters surface_cache_hits, surface_cache_misses and walker_steps.
+
+`report()` returns the timings, call counts and counters together with the total wall time and the peak
+resident memory of the process (and of its finished child processes) in MiB. `write_report(path)` writes the
+same as JSON. `snapshot()` and `merge()` carry the numbers of worker processes back to the parent.
+
+`configure_logging(level, log_file)` sets up the BulgeFF log for the command-line entry points; the library
+modules only create module loggers. The level 'OFF' disables logging entirely.
+"""
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'OFF')
+
+
+def configure_logging(level='INFO', log_file='BulgeFix.log'):
+    level = level.upper()
+    if level == 'OFF':
+        logging.disable(logging.CRITICAL)
+        return
+    logging.basicConfig(filename=log_file, level=getattr(logging, level), format=LOG_FORMAT)
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return {'self': None, 'children': None}
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale}
+
+
+class Profiler:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        return {'timings': dict(self.timings), 'calls': dict(self.calls), 'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        for name, seconds in snapshot['timings'].items():
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+        for name, calls in snapshot['calls'].items():
+            self.calls[name] = self.calls.get(name, 0) + calls
+        for name, value in snapshot['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, **extra):
+        report = {
+            'wall_time_s': time.perf_counter() - self.started,
+            'stages': {name: {'seconds': self.timings[name], 'calls': self.calls[name]}
+                       for name in sorted(self.timings, key=self.timings.get, reverse=True)},
+            'counters': dict(sorted(self.counters.items())),
+            'peak_memory_mb': peak_memory_mb(),
+            'pid': os.getpid()
+        }
+        report.update(extra)
+        return report
+
+    def write_report(self, report_file, **extra):
+        report = self.report(**extra)
+        with open(report_file, 'w') as file:
+            json.dump(report, file, indent=2)
+        logger.info(f"Wrote profile report {report_file}")
+        return report
+
+
+PROFILER = Profiler()
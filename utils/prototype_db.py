@@ -0,0 +1,212 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+import numpy as np
+from utils.calc_rmsd import backbone_coords, backbone_descriptors
+
+logger = logging.getLogger(__name__)
+
+"""
+Compiles the MODEL-indexed prototype PDB files into a binary store and loads it once per process.
+
+The store lives in `<prototype_path>/.compiled/` and consists of `prototypes.npy` (the C4'/P coordinates
+of every model, shape (n_models, n_atoms, 3), memory-mapped on load) and `prototypes.json` (a small header
+with the model indices, the pucker class of each model and the mtime/size/sha256 of every source file).
+Models are stored grouped by pucker class so that selecting a class is a slice, independent of library size.
+`db.descriptors()` computes the rotation-invariant descriptors of every model (see calc_rmsd) on first use
+and keeps them with the loaded store for the pruned prototype search.
+
+Parameters:
+- prototype_path (str): The directory containing the prototype PDB files (e.g., "C2'-endo.pdb", "C3'-endo.pdb").
+
+Returns:
+- db (PrototypeDB): The loaded prototype database.
+"""
+
+FORMAT_VERSION = 1
+COMPILED_DIR = '.compiled'
+COORDS_FILE = 'prototypes.npy'
+HEADER_FILE = 'prototypes.json'
+
+_DB_CACHE = {}
+
+
+class PrototypeDB:
+    def __init__(self, coords, header):
+        self.coords = coords
+        self.header = header
+        self.classes = header['classes']
+        self.model_indices = np.asarray(header['model_indices'], dtype=np.int64)
+        self.pucker = np.asarray(header['pucker'], dtype=np.int64)
+        self.version = header['version']
+        self._slices = {}
+        self._descriptors = None
+        for class_id, name in enumerate(self.classes):
+            rows = np.flatnonzero(self.pucker == class_id)
+            start, stop = (int(rows[0]), int(rows[-1]) + 1) if len(rows) else (0, 0)
+            self._slices[name] = slice(start, stop)
+
+    def __len__(self):
+        return len(self.model_indices)
+
+    def rows(self, sugar):
+        if sugar == "Others":
+            return slice(0, len(self))
+        if sugar in self._slices:
+            return self._slices[sugar]
+        error_msg = f"No prototypes for sugar type {sugar}. Available: {', '.join(self.classes)}"
+        logger.error(error_msg)
+        raise FileNotFoundError(error_msg)
+
+    def descriptors(self):
+        if self._descriptors is None:
+            self._descriptors = backbone_descriptors(self.coords)
+        return self._descriptors
+
+    def select(self, sugar):
+        rows = self.rows(sugar)
+
+        model_types = [self.classes[class_id] for class_id in self.pucker[rows]]
+        return self.coords[rows], self.model_indices[rows].tolist(), model_types
+
+
+def _source_files(prototype_path):
+    return sorted(glob.glob(os.path.join(prototype_path, '*.pdb')))
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stats(path):
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def _is_current(header, prototype_path):
+    if header.get('format_version') != FORMAT_VERSION:
+        return False
+
+    sources = header.get('sources', {})
+    files = _source_files(prototype_path)
+    if sorted(sources) != sorted(os.path.basename(path) for path in files):
+        return False
+
+    touched = False
+    for path in files:
+        recorded = sources[os.path.basename(path)]
+        stats = _source_stats(path)
+        if stats['mtime'] == recorded['mtime'] and stats['size'] == recorded['size']:
+            continue
+        if stats['size'] != recorded['size'] or _file_digest(path) != recorded['sha256']:
+            return False
+        recorded.update(stats)
+        touched = True
+
+    if touched:
+        # Only the mtimes changed (e.g. after a checkout): record them, so later runs do not hash the files again.
+        compiled_dir = os.path.join(prototype_path, COMPILED_DIR)
+        try:
+            _write_header(compiled_dir, header)
+            logger.info(f"Refreshed the source timestamps of the compiled prototype store {compiled_dir}")
+        except OSError as e:
+            logger.warning(f"Could not refresh the header of the compiled prototype store {compiled_dir}: {e}")
+    return True
+
+
+def _write_header(compiled_dir, header):
+    tmp_header = os.path.join(compiled_dir, f"{HEADER_FILE}.{os.getpid()}.tmp")
+    with open(tmp_header, 'w') as file:
+        json.dump(header, file, indent=1)
+    os.replace(tmp_header, os.path.join(compiled_dir, HEADER_FILE))
+
+
+def compile_prototype_db(prototype_path, write=True):
+    from utils.get_prototype import get_prototype_models
+
+    files = _source_files(prototype_path)
+    if not files:
+        error_msg = f"No prototype PDB files found in {prototype_path}"
+        logger.error(error_msg)
+        raise FileNotFoundError(error_msg)
+
+    coords = []
+    model_indices = []
+    pucker = []
+    classes = []
+    sources = {}
+    for path in files:
+        name = os.path.splitext(os.path.basename(path))[0]
+        models, indices = get_prototype_models(path)
+        classes.append(name)
+        for model in models:
+            coords.append(backbone_coords(model))
+        model_indices.extend(indices)
+        pucker.extend([len(classes) - 1] * len(models))
+        sources[os.path.basename(path)] = dict(_source_stats(path), sha256=_file_digest(path))
+
+    n_atoms = {len(model) for model in coords}
+    if len(n_atoms) != 1:
+        error_msg = f"Prototype models in {prototype_path} have inconsistent C4'/P atom counts: {sorted(n_atoms)}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    coords = np.stack(coords)
+    version = hashlib.sha256(''.join(sources[key]['sha256'] for key in sorted(sources)).encode()).hexdigest()
+    header = {
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'classes': classes,
+        'model_indices': model_indices,
+        'pucker': pucker,
+        'n_atoms': int(coords.shape[1]),
+        'sources': sources
+    }
+
+    if write:
+        compiled_dir = os.path.join(prototype_path, COMPILED_DIR)
+        try:
+            os.makedirs(compiled_dir, exist_ok=True)
+            tmp_coords = os.path.join(compiled_dir, f"{COORDS_FILE}.{os.getpid()}.tmp")
+            with open(tmp_coords, 'wb') as file:
+                np.save(file, coords)
+            os.replace(tmp_coords, os.path.join(compiled_dir, COORDS_FILE))
+            _write_header(compiled_dir, header)
+            logger.info(f"Compiled {len(coords)} prototypes from {prototype_path} into {compiled_dir}")
+        except OSError as e:
+            logger.warning(f"Could not write compiled prototype store to {compiled_dir}: {e}")
+
+    return PrototypeDB(coords, header)
+
+
+def load_prototype_db(prototype_path):
+    key = os.path.realpath(prototype_path)
+    db = _DB_CACHE.get(key)
+    if db is not None and _is_current(db.header, prototype_path):
+        return db
+
+    compiled_dir = os.path.join(prototype_path, COMPILED_DIR)
+    db = None
+    try:
+        with open(os.path.join(compiled_dir, HEADER_FILE), 'r') as file:
+            header = json.load(file)
+        if _is_current(header, prototype_path):
+            coords = np.load(os.path.join(compiled_dir, COORDS_FILE), mmap_mode='r')
+            db = PrototypeDB(coords, header)
+            logger.info(f"Loaded compiled prototype store {compiled_dir} ({len(db)} models)")
+        else:
+            logger.info(f"Compiled prototype store {compiled_dir} is out of date, rebuilding.")
+    except (OSError, ValueError) as e:
+        logger.info(f"No usable compiled prototype store in {compiled_dir} ({e}), building it.")
+
+    if db is None:
+        db = compile_prototype_db(prototype_path)
+
+    _DB_CACHE[key] = db
+    return db
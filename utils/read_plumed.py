@@ -0,0 +1,112 @@
+import os
+import re
+import logging
+from utils.fourier import FourierSeries, BiasGrid
+
+logger = logging.getLogger(__name__)
+
+"""
+Reads the eta/theta torsions and their bias functions back from a PLUMED file written by BulgeFF.
+
+Parameters:
+- plumed_file (str): The path of the PLUMED input file.
+
+Returns:
+- terms (list of dict): One entry per biased torsion, in file order, with keys `label` (the torsion label,
+  e.g. eta_G6), `atoms` (the four 1-based atom indices), `func` (the Fourier bias function string of a
+  CUSTOM bias, or None) and `grid` (the grid file of an EXTERNAL bias, or None).
+
+Both the default layout (one CUSTOM per torsion) and the lean layout (one CUSTOM with VAR=x0,x1,... whose FUNC
+is the sum `(f0)+(f1)+...` of the per-torsion terms) are read into the same per-torsion terms.
+
+`bias_function(term)` returns a callable evaluating the bias of a term (a FourierSeries or a BiasGrid).
+"""
+
+def parse_plumed_actions(plumed_file):
+    actions = []
+    with open(plumed_file, 'r') as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            tokens = line.split()
+            label = None
+            if tokens[0].endswith(':'):
+                label = tokens.pop(0)[:-1]
+            action = tokens.pop(0)
+            keywords = {}
+            for token in tokens:
+                key, _, value = token.partition('=')
+                if key == 'LABEL' and value:
+                    label = value
+                keywords[key] = value
+            actions.append((label, action, keywords))
+    return actions
+
+
+def split_sum(func):
+    terms = []
+    depth = 0
+    start = 0
+    for position, char in enumerate(func):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '+' and depth == 0:
+            terms.append(func[start:position])
+            start = position + 1
+    terms.append(func[start:])
+    return [term[1:-1] if term.startswith('(') and term.endswith(')') else term for term in terms]
+
+
+def _custom_terms(label, keywords, plumed_file):
+    args = keywords.get('ARG', '').split(',')
+    if 'VAR' not in keywords:
+        return [(keywords.get('ARG', ''), keywords['FUNC'])]
+
+    variables = keywords['VAR'].split(',')
+    terms = []
+    for func in split_sum(keywords['FUNC']):
+        used = [k for k, variable in enumerate(variables) if re.search(rf"\b{variable}\b", func)]
+        if len(used) != 1:
+            error_msg = f"Term '{func}' of bias {label} in {plumed_file} does not depend on a single variable"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        terms.append((args[used[0]], re.sub(rf"\b{variables[used[0]]}\b", 'x', func)))
+    return terms
+
+
+def read_plumed(plumed_file):
+    actions = parse_plumed_actions(plumed_file)
+
+    torsions = {label: [int(atom) for atom in keywords['ATOMS'].split(',')]
+                for label, action, keywords in actions if action == 'TORSION'}
+    biased = {arg for _, action, keywords in actions if action == 'BIASVALUE'
+              for arg in keywords.get('ARG', '').split(',')}
+
+    terms = []
+    for label, action, keywords in actions:
+        if action == 'CUSTOM' and label in biased:
+            found = [(arg, {'func': func, 'grid': None}) for arg, func in _custom_terms(label, keywords, plumed_file)]
+        elif action == 'EXTERNAL':
+            grid = os.path.join(os.path.dirname(os.path.abspath(plumed_file)), keywords['FILE'])
+            found = [(keywords.get('ARG', ''), {'func': None, 'grid': grid})]
+        else:
+            continue
+        for arg, term in found:
+            if arg not in torsions:
+                error_msg = f"Bias {label} in {plumed_file} does not act on a single TORSION: ARG={arg}"
+                logger.error(error_msg)
+                raise ValueError(error_msg)
+            term.update({'label': arg, 'atoms': torsions[arg]})
+            terms.append(term)
+
+    logger.info(f"Read {len(terms)} biased torsions from {plumed_file}")
+    return terms
+
+
+def bias_function(term):
+    if term['func'] is not None:
+        return FourierSeries.parse(term['func'])
+    return BiasGrid.read(term['grid'])
@@ -0,0 +1,530 @@
+import os
+import re
+import sys
+import logging
+import numpy as np
+from utils.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+"""
+Reads a PDB, mmCIF/PDBx or GROMACS .gro file once into a column-oriented Structure that every pipeline stage
+can share.
+
+The file is streamed. With `residues` only the requested residues are kept and reading stops once every
+requested residue has been seen and the reader has moved past them, so memory does not grow with the amount of
+solvent. With `use_index` a sidecar byte-offset index (`<pdb_name>.bfidx.npz`, one entry per residue block) is
+written on the first full pass and used by later selective reads to seek straight to the residues.
+
+MODEL records (NMR ensembles) are kept in the `model` column. The atom lookups (`find`, `coord`, `residue_mask`)
+refer to the first model, so a single-structure stage never mixes models; `models`, `select_model` and
+`ensemble_rows` give access to every model. Selective reads keep the first model only.
+
+The format follows the file extension (.cif/.mmcif, .gro, anything else is read as PDB). Atom serials of
+systems past 99,999 atoms are decoded the way the common writers store them: hybrid-36 ("A0000" = 100000)
+and serials wrapped modulo 100000 (as written by GROMACS and MDAnalysis) are both turned back into the true
+serial, and residue numbers likewise (hybrid-36 or modulo 10000). A drop of more than half the modulus is taken
+as a wrap. In PDB files residue numbers restart with every chain and after TER, so their unwrapping is reset there.
+Within a chain a residue wrap is inferred only when the numbering continues across the modulus (9999 -> 0 or 1,
+as GROMACS writes it) or, once the atom serials have passed 99,999, on any drop of more than half the modulus. mmCIF files use the `_atom_site` id and author numbering; .gro files the position of every atom
+(the GROMACS atom index), with coordinates converted from nm to Angstrom and a blank chain ID. The residue
+offset index records the serial wrap count of every residue block and is built for PDB files only; the other
+formats are streamed with the same early stopping.
+
+Parameters:
+- pdb_name (str): The name of the PDB file to read.
+- residues (iterable of int or dict, optional): Residue numbers to keep. A dict maps residue numbers to the
+  expected residue name (or None); early stopping waits until a residue with that name has been seen.
+- use_index (bool): Whether to build and use the sidecar residue offset index.
+
+Returns:
+- structure (Structure): Atom records stored as NumPy columns (serials, coordinates, names, ...)
+  with a (chain_id, residue_number, atom_name) -> row index for constant-time atom lookup.
+"""
+
+INDEX_SUFFIX = '.bfidx.npz'
+CIF_EXTENSIONS = ('.cif', '.mmcif')
+GRO_EXTENSIONS = ('.gro',)
+
+SERIAL_MODULUS = 100000
+RESIDUE_MODULUS = 10000
+GRO_RESIDUE_MODULUS = 100000
+# Largest step across the modulus taken as a continued residue sequence (9999 -> 0 or 1) in a PDB chain.
+MAX_WRAP_STEP = 2
+
+_CIF_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+
+class Structure:
+    def __init__(self, atom_number, atom_name, residue_name, chain_id, residue_number,
+                 coords, occupancy, bfactor, element, source=None, model=None):
+        self.atom_number = np.asarray(atom_number, dtype=np.int64)
+        self.atom_name = np.asarray(atom_name, dtype=object)
+        self.residue_name = np.asarray(residue_name, dtype=object)
+        self.chain_id = np.asarray(chain_id, dtype=object)
+        self.residue_number = np.asarray(residue_number, dtype=np.int64)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.occupancy = np.asarray(occupancy, dtype=np.float64)
+        self.bfactor = np.asarray(bfactor, dtype=np.float64)
+        self.element = np.asarray(element, dtype=object)
+        self.source = source
+        self.model = (np.ones(len(self.atom_number), dtype=np.int64) if model is None
+                      else np.asarray(model, dtype=np.int64))
+
+        self.models = list(dict.fromkeys(self.model.tolist()))
+        self.first_model_mask = self.model == self.models[0] if len(self.models) > 1 else None
+        rows = np.arange(len(self.atom_number)) if self.first_model_mask is None else np.flatnonzero(self.first_model_mask)
+
+        # Later records win, matching the dict-based lookups in get_pdb_info.
+        self.index = {key: row for row, key in zip(rows.tolist(), zip(self.chain_id[rows].tolist(),
+                                                                       self.residue_number[rows].tolist(),
+                                                                       self.atom_name[rows].tolist()))}
+
+    def __len__(self):
+        return len(self.atom_number)
+
+    def __repr__(self):
+        return f"<Structure {self.source or ''} with {len(self)} atoms>"
+
+    def find(self, chain_id, residue_number, atom_name):
+        return self.index.get((chain_id, residue_number, atom_name))
+
+    def residue_mask(self, residue_number, residue_name=None):
+        mask = self.residue_number == residue_number
+        if residue_name is not None:
+            mask &= self.residue_name == residue_name
+        if self.first_model_mask is not None:
+            mask &= self.first_model_mask
+        return mask
+
+    def select_model(self, model=None):
+        model = self.models[0] if model is None else model
+        rows = np.flatnonzero(self.model == model)
+        return Structure(self.atom_number[rows], self.atom_name[rows], self.residue_name[rows], self.chain_id[rows],
+                         self.residue_number[rows], self.coords[rows], self.occupancy[rows], self.bfactor[rows],
+                         self.element[rows], source=self.source, model=self.model[rows])
+
+    def ensemble_rows(self, keys):
+        # (n_models, n_keys) rows of the (chain_id, residue_number, atom_name) keys in every model; -1 if missing.
+        index = {key: row for row, key in enumerate(zip(self.model.tolist(), self.chain_id.tolist(),
+                                                        self.residue_number.tolist(), self.atom_name.tolist()))}
+        return np.array([[index.get((model,) + tuple(key), -1) for key in keys] for model in self.models],
+                        dtype=np.int64).reshape(len(self.models), len(keys))
+
+    def find_chain(self, residue_number, residue_name):
+        rows = np.flatnonzero(self.residue_mask(residue_number, residue_name))
+        if len(rows) == 0:
+            return None
+        return self.chain_id[rows[0]]
+
+    def coord(self, residue_name, residue_number, atom_name):
+        rows = np.flatnonzero(self.residue_mask(residue_number, residue_name) & (self.atom_name == atom_name))
+        if len(rows) == 0:
+            return None
+        return self.coords[rows[-1]]
+
+    def atom_info(self, rows=None):
+        if rows is None:
+            rows = range(len(self))
+        return [{
+            'atom_number': int(self.atom_number[row]),
+            'atom_name': self.atom_name[row],
+            'residue_name': self.residue_name[row],
+            'chain_id': self.chain_id[row],
+            'residue_number': int(self.residue_number[row]),
+            'x': float(self.coords[row, 0]),
+            'y': float(self.coords[row, 1]),
+            'z': float(self.coords[row, 2]),
+            'occupancy': float(self.occupancy[row]),
+            'bfactor': float(self.bfactor[row]),
+            'element': self.element[row]
+        } for row in rows]
+
+
+def as_structure(pdb):
+    if isinstance(pdb, Structure):
+        return pdb
+    return read_structure(pdb)
+
+
+class _Columns:
+    def __init__(self):
+        self.atom_number = []
+        self.atom_name = []
+        self.residue_name = []
+        self.chain_id = []
+        self.residue_number = []
+        self.coords = []
+        self.occupancy = []
+        self.bfactor = []
+        self.element = []
+        self.model = []
+
+    def add(self, atom_number, atom_name, residue_name, chain_id, residue_number, coord, occupancy, bfactor,
+            element, model=1):
+        intern = sys.intern
+        self.atom_number.append(atom_number)
+        self.atom_name.append(intern(atom_name))
+        self.residue_name.append(intern(residue_name))
+        self.chain_id.append(intern(chain_id))
+        self.residue_number.append(residue_number)
+        self.coords.append(coord)
+        self.occupancy.append(occupancy)
+        self.bfactor.append(bfactor)
+        self.element.append(intern(element))
+        self.model.append(model)
+
+    def add_pdb_line(self, line, residue_number, model=1, atom_number=None):
+        intern = sys.intern
+        self.atom_number.append(int(line[6:11]) if atom_number is None else atom_number)
+        self.atom_name.append(intern(line[12:16].decode().strip()))
+        self.residue_name.append(intern(line[17:20].decode().strip()))
+        self.chain_id.append(intern(line[21:22].decode()))
+        self.residue_number.append(residue_number)
+        self.coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+        self.occupancy.append(float(line[54:60]))
+        self.bfactor.append(float(line[60:66]))
+        self.element.append(intern(line[76:78].decode().strip()))
+        self.model.append(model)
+
+    def to_structure(self, source):
+        return Structure(self.atom_number, self.atom_name, self.residue_name, self.chain_id, self.residue_number,
+                         self.coords, self.occupancy, self.bfactor, self.element, source=source, model=self.model)
+
+
+def hy36decode(field, width):
+    text = field.strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    if len(text) == width and text.isalnum():
+        if text[0].isupper() and text.isupper():
+            return int(text, 36) - 10 * 36 ** (width - 1) + 10 ** width
+        if text[0].islower() and text.islower():
+            return int(text, 36) + 16 * 36 ** (width - 1) + 10 ** width
+    raise ValueError(f"Invalid hybrid-36 number: {field!r}")
+
+
+class _Unwrapper:
+    # Turns hybrid-36, wrapped or overflowed ('*****') fixed-width numbers back into the true sequence; an
+    # overflowed field continues the sequence by `overflow_step`. Without `wrapping` only a drop that continues the
+    # sequence across the modulus (e.g. 9999 -> 0) is taken as a wrap.
+    def __init__(self, width, modulus, wraps=0, overflow_step=1, wrapping=True):
+        self.width = width
+        self.modulus = modulus
+        self.wraps = wraps
+        self.overflow_step = overflow_step
+        self.wrapping = wrapping
+        self.previous = None
+
+    def __call__(self, field):
+        try:
+            value = int(field)
+        except ValueError:
+            try:
+                value = hy36decode(field.decode() if isinstance(field, bytes) else field, self.width)
+            except ValueError:
+                value = self.previous + self.overflow_step if self.previous is not None else 0
+                self.previous = value
+                return value + self.wraps * self.modulus
+        previous = self.previous
+        self.previous = value
+        if previous is not None and previous - value > self.modulus // 2:
+            if self.wrapping or value + self.modulus - previous <= MAX_WRAP_STEP:
+                self.wraps += 1
+        return value + self.wraps * self.modulus
+
+
+def structure_format(pdb_name):
+    name = pdb_name.lower()
+    if name.endswith(CIF_EXTENSIONS):
+        return 'cif'
+    if name.endswith(GRO_EXTENSIONS):
+        return 'gro'
+    return 'pdb'
+
+
+def _requested_residues(residues):
+    if residues is None:
+        return None
+    if isinstance(residues, dict):
+        return dict(residues)
+    return {int(resi): None for resi in residues}
+
+
+def index_file_name(pdb_name):
+    return f"{pdb_name}{INDEX_SUFFIX}"
+
+
+def _file_signature(pdb_name):
+    stat = os.stat(pdb_name)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def load_residue_index(pdb_name):
+    try:
+        with np.load(index_file_name(pdb_name)) as index:
+            if not np.array_equal(index['signature'], _file_signature(pdb_name)):
+                logger.info(f"Residue index for {pdb_name} is out of date.")
+                return None
+            return {key: index[key] for key in ('chain_id', 'residue_number', 'residue_name', 'model', 'wraps',
+                                                'start', 'end')}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_residue_index(pdb_name, signature, blocks):
+    chain_id, residue_number, residue_name, model, wraps, start, end = zip(*blocks) if blocks else ([],) * 7
+    index_file = index_file_name(pdb_name)
+    tmp_file = f"{index_file}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmp_file, signature=signature,
+                 chain_id=np.array(chain_id, dtype='S1'), residue_number=np.array(residue_number, dtype=np.int64),
+                 residue_name=np.array(residue_name, dtype='S4'), model=np.array(model, dtype=np.int64),
+                 wraps=np.array(wraps, dtype=np.int64), start=np.array(start, dtype=np.int64), end=np.array(end, dtype=np.int64))
+        os.replace(tmp_file, index_file)
+        logger.info(f"Wrote residue offset index {index_file} ({len(blocks)} residues).")
+    except OSError as e:
+        logger.warning(f"Could not write residue offset index {index_file}: {e}")
+
+
+def _read_with_index(pdb_file, index, requested, columns):
+    first_model = index['model'][0] if len(index['model']) else 1
+    rows = np.flatnonzero(np.isin(index['residue_number'], list(requested)) & (index['model'] == first_model))
+    for row in rows:
+        residue_number = int(index['residue_number'][row])
+        serials = _Unwrapper(5, SERIAL_MODULUS, wraps=int(index['wraps'][row]))
+        pdb_file.seek(int(index['start'][row]))
+        for line in pdb_file.read(int(index['end'][row] - index['start'][row])).splitlines():
+            if line.startswith(b'ATOM'):
+                columns.add_pdb_line(line, residue_number, int(first_model), serials(line[6:11]))
+
+
+def _read_stream(pdb_file, requested, columns, blocks):
+    remaining = set(requested) if requested is not None else None
+    block_key = None
+    block_start = 0
+    offset = 0
+    model = 1
+    n_models = 0
+    serials = _Unwrapper(5, SERIAL_MODULUS)
+    residues = _Unwrapper(4, RESIDUE_MODULUS, overflow_step=0, wrapping=False)
+    chain = None
+    large_system = False
+
+    for line in pdb_file:
+        line_start = offset
+        offset += len(line)
+        if line.startswith(b'MODEL'):
+            n_models += 1
+            if n_models > 1 and requested is not None and blocks is None:
+                break
+            model = int(line[5:].split()[0]) if line[5:].split() else n_models
+            serials = _Unwrapper(5, SERIAL_MODULUS)
+            residues = _Unwrapper(4, RESIDUE_MODULUS, overflow_step=0, wrapping=large_system)
+            chain = None
+            continue
+        if line.startswith(b'TER'):
+            residues = _Unwrapper(4, RESIDUE_MODULUS, overflow_step=0, wrapping=large_system)
+            chain = None
+            continue
+        if not line.startswith(b'ATOM'):
+            continue
+
+        atom_number = serials(line[6:11])
+        if line[21:22] != chain:
+            chain = line[21:22]
+            residues = _Unwrapper(4, RESIDUE_MODULUS, overflow_step=0, wrapping=large_system)
+        if not large_system and atom_number >= SERIAL_MODULUS:
+            large_system = residues.wrapping = True
+        residue_number = residues(line[22:26])
+        if blocks is not None:
+            key = (line[21:22], residue_number, line[17:20].strip(), model)
+            if key != block_key:
+                if block_key is not None:
+                    blocks.append(block_key + (block_wraps, block_start, line_start))
+                block_key = key
+                block_start = line_start
+                block_wraps = serials.wraps
+
+        if requested is None:
+            columns.add_pdb_line(line, residue_number, model, atom_number)
+        elif n_models > 1:
+            continue
+        elif residue_number in requested:
+            columns.add_pdb_line(line, residue_number, model, atom_number)
+            resname = requested[residue_number]
+            if resname is None or line[17:20].decode().strip() == resname:
+                remaining.discard(residue_number)
+        elif not remaining and blocks is None:
+            break
+
+    if blocks is not None and block_key is not None:
+        blocks.append(block_key + (block_wraps, block_start, offset))
+
+
+def _keep_atom(requested, remaining, residue_number, residue_name):
+    # Returns True to keep the atom, False to skip it and None once every requested residue has been read.
+    if requested is None:
+        return True
+    if residue_number in requested:
+        if requested[residue_number] is None or requested[residue_number] == residue_name:
+            remaining.discard(residue_number)
+        return True
+    return None if not remaining else False
+
+
+def _read_cif_stream(cif_file, requested, columns):
+    remaining = set(requested) if requested is not None else None
+    fields = []
+    in_loop = False
+    in_rows = False
+    pending = []
+    serial = 0
+    first_model = None
+
+    for line in cif_file:
+        stripped = line.strip()
+        if not in_rows:
+            if stripped.startswith('loop_'):
+                in_loop = True
+            elif in_loop and stripped.startswith('_atom_site.'):
+                fields.append(stripped.split()[0][len('_atom_site.'):])
+            elif fields:
+                in_rows = True
+            elif stripped.startswith('_'):
+                in_loop = False
+            if not in_rows:
+                continue
+        if not stripped:
+            continue
+        if not pending and stripped.startswith(('_', 'loop_', 'data_', '#')):
+            break
+
+        pending.extend(next(group for group in match.groups() if group is not None)
+                       for match in _CIF_TOKEN.finditer(stripped))
+        if len(pending) < len(fields):
+            continue
+        row = dict(zip(fields, pending))
+        pending = []
+        serial += 1
+        if row.get('group_PDB', 'ATOM') != 'ATOM':
+            continue
+
+        model = int(row.get('pdbx_PDB_model_num', 1))
+        first_model = model if first_model is None else first_model
+        if requested is not None and model != first_model:
+            break
+        residue_number = int(row.get('auth_seq_id', row.get('label_seq_id')))
+        residue_name = row.get('auth_comp_id', row.get('label_comp_id'))
+        keep = _keep_atom(requested, remaining, residue_number, residue_name)
+        if keep is None:
+            break
+        if not keep:
+            continue
+
+        atom_id = row.get('id', '?')
+        columns.add(int(atom_id) if atom_id.isdigit() else serial,
+                    row.get('auth_atom_id', row.get('label_atom_id')), residue_name,
+                    row.get('auth_asym_id', row.get('label_asym_id', ' ')), residue_number,
+                    (float(row['Cartn_x']), float(row['Cartn_y']), float(row['Cartn_z'])),
+                    _cif_float(row.get('occupancy'), 1.0), _cif_float(row.get('B_iso_or_equiv'), 0.0),
+                    row.get('type_symbol', ''), model)
+
+    if not fields:
+        raise ValueError("No _atom_site loop found in the mmCIF file.")
+
+
+def _cif_float(value, default):
+    return default if value in (None, '?', '.') else float(value)
+
+
+def _read_gro_stream(gro_file, requested, columns):
+    remaining = set(requested) if requested is not None else None
+    model = 0
+
+    while True:
+        title = gro_file.readline()
+        count = gro_file.readline()
+        if not title or not count.strip():
+            break
+        model += 1
+        if model > 1 and requested is not None:
+            break
+
+        n_atoms = int(count)
+        residues = _Unwrapper(5, GRO_RESIDUE_MODULUS, overflow_step=0)
+        width = None
+        for atom_index in range(1, n_atoms + 1):
+            line = gro_file.readline()
+            if width is None:
+                # The coordinate precision is free in .gro files; the field width is the spacing of the decimal points.
+                first = line.index('.', 20)
+                width = line.index('.', first + 1) - first
+            residue_number = residues(line[0:5])
+            residue_name = line[5:10].strip()
+            keep = _keep_atom(requested, remaining, residue_number, residue_name)
+            if keep is None:
+                return
+            if not keep:
+                continue
+            atom_name = line[10:15].strip()
+            columns.add(atom_index, atom_name, residue_name, ' ', residue_number,
+                        (float(line[20:20 + width]) * 10.0, float(line[20 + width:20 + 2 * width]) * 10.0,
+                         float(line[20 + 2 * width:20 + 3 * width]) * 10.0),
+                        1.0, 0.0, atom_name[:1], model)
+        gro_file.readline()
+
+
+def _read_pdb(pdb_name, requested, columns, use_index):
+    with open(pdb_name, 'rb') as pdb_file:
+        index = load_residue_index(pdb_name) if use_index else None
+        if index is not None and requested is not None:
+            _read_with_index(pdb_file, index, requested, columns)
+            logger.debug("Read the requested residues of %s via the residue index.", pdb_name)
+            return
+
+        blocks = [] if use_index else None
+        signature = _file_signature(pdb_name) if use_index else None
+        _read_stream(pdb_file, requested, columns, blocks)
+    if use_index:
+        _save_residue_index(pdb_name, signature, blocks)
+
+
+_STREAM_READERS = {'cif': _read_cif_stream, 'gro': _read_gro_stream}
+
+
+def read_structure(pdb_name, residues=None, use_index=False):
+    requested = _requested_residues(residues)
+    columns = _Columns()
+
+    try:
+        structure_type = structure_format(pdb_name)
+        if structure_type == 'pdb':
+            _read_pdb(pdb_name, requested, columns, use_index)
+        else:
+            if use_index:
+                logger.debug("The residue offset index is only kept for PDB files; streaming %s.", pdb_name)
+            with open(pdb_name, 'r') as structure_file:
+                _STREAM_READERS[structure_type](structure_file, requested, columns)
+
+        if requested is None:
+            logger.info(f"Read PDB file: {pdb_name} ({len(columns.atom_number)} atoms).")
+        else:
+            # A selective read stops early and skips the other residues, so only the selected atoms are counted.
+            logger.info(f"Read {len(columns.atom_number)} selected atoms of residue(s) "
+                        f"{', '.join(str(resi) for resi in sorted(requested))} from {pdb_name}.")
+        PROFILER.count('structures_parsed')
+        PROFILER.count('atoms_parsed', len(columns.atom_number))
+
+    except FileNotFoundError:
+        error_msg = f"PDB file '{pdb_name}' not found. Please cheak the file path."
+        logger.error(error_msg)
+        raise FileNotFoundError(error_msg)
+    except Exception as e:
+        error_msg = f"An error occurred: {str(e)}"
+        logger.error(error_msg)
+        raise
+
+    return columns.to_structure(pdb_name)
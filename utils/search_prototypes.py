@@ -0,0 +1,85 @@
+from utils.calc_rmsd import backbone_coords, backbone_descriptors, rmsd_lower_bounds, batch_rmsd
+from utils.prototype_db import load_prototype_db
+from utils.profiling import PROFILER
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Finds the top-k prototypes of a reference by superposed RMSD without superposing every candidate model.
+
+A lower bound of the RMSD against every candidate is computed from the rotation-invariant descriptors of the
+prototype store (centroid distances and internal C4'/P distance matrices, see calc_rmsd). The candidates are
+then superposed in blocks in order of increasing bound, and the search stops as soon as the next bound exceeds
+the k-th best RMSD found so far (or `max_rmsd`), since none of the remaining models can enter the top k. The
+blocks start at 16 models and double, so a small library is still scored in one batched call.
+
+The bounds are exact lower bounds, so the returned matches are exactly those of an exhaustive search, with
+ties broken by the order of the prototype store as np.argmin does.
+
+Parameters:
+- sugar (str): The sugar type selecting the candidate models ("C2'-endo", "C3'-endo" or "Others" for all).
+- reference (str or numpy.ndarray): The PDB-format string of the reference structure, or its C4'/P coordinates.
+- prototype_path (str): The directory containing the prototype database.
+- k (int): The number of matches to return. Default: 1.
+- max_rmsd (float, optional): Skip every model that cannot come within this RMSD. Default: None.
+
+Returns:
+- rmsd_values (numpy.ndarray): The RMSD values of the matches in increasing order (at most k).
+- indices (list of int): The model indices of the matches.
+- model_types (list of str): The model types of the matches.
+"""
+
+FIRST_BLOCK = 16
+
+# Slack for the rounding of the bound against the superposed RMSD when both are (nearly) equal.
+BOUND_TOLERANCE = 1e-9
+
+
+def search_prototypes(sugar, reference, prototype_path, k=1, max_rmsd=None):
+    try:
+        db = load_prototype_db(prototype_path)
+        rows = db.rows(sugar)
+    except Exception as e:
+        logger.error(f"Error loading prototypes for sugar type {sugar}: {e}")
+        raise
+
+    reference_coords = reference if isinstance(reference, np.ndarray) else backbone_coords(reference)
+    coords = db.coords[rows]
+    centroid_distances, pair_distances = db.descriptors()
+    bounds = rmsd_lower_bounds(backbone_descriptors(reference_coords),
+                               (centroid_distances[rows], pair_distances[rows]))
+    order = np.argsort(bounds, kind='stable')
+
+    evaluated = []
+    scores = []
+    best = np.empty(0)
+    start, block_size = 0, max(FIRST_BLOCK, k)
+    while start < len(order):
+        cutoff = best[k - 1] if len(best) >= k else np.inf
+        if max_rmsd is not None:
+            cutoff = min(cutoff, max_rmsd)
+        block = order[start:start + block_size]
+        block = block[bounds[block] <= cutoff + BOUND_TOLERANCE]
+        if not len(block):
+            break
+        evaluated.append(block)
+        scores.append(batch_rmsd(reference_coords, coords[block]))
+        best = np.sort(np.concatenate(scores))[:k]
+        start += block_size
+        block_size *= 2
+
+    candidates = np.concatenate(evaluated) if evaluated else np.empty(0, dtype=np.int64)
+    rmsd_values = np.concatenate(scores) if scores else np.empty(0)
+    PROFILER.count('rmsd_pruned', len(order) - len(candidates))
+
+    ranking = np.lexsort((candidates, rmsd_values))
+    if max_rmsd is not None:
+        ranking = ranking[rmsd_values[ranking] <= max_rmsd]
+    ranking = ranking[:k]
+
+    selected = candidates[ranking] + (rows.start or 0)
+    model_types = [db.classes[class_id] for class_id in db.pucker[selected]]
+    logger.debug("Superposed %d of %d prototypes for sugar type %s.", len(candidates), len(order), sugar)
+    return rmsd_values[ranking], db.model_indices[selected].tolist(), model_types
@@ -0,0 +1,257 @@
+import os
+import json
+import stat
+import time
+import signal
+import asyncio
+import logging
+import tempfile
+import traceback
+from collections import OrderedDict
+from utils.read_structure import read_structure
+from utils.generate_plumed import generate_plumed, md_residue_request
+from utils.get_function import read_function_table
+from utils.prototype_db import load_prototype_db
+from utils.cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+"""
+Resident BulgeFF server: an asyncio front end that answers JSON-lines requests with a warm worker pool.
+
+Clients connect to a Unix socket (`address` is a path) or to a localhost TCP port (`address` is host:port, with
+host one of LOOPBACK_HOSTS; other hosts are refused, since the server has no authentication) and
+send one JSON object per line; every request gets one JSON line back carrying the same `id`. Requests on one
+connection run concurrently, so responses may arrive out of order.
+
+A generate request has the fields `bulge_pdb`, `md_pdb`, `bulge_name` and `bulge_id` (or `auto_bulge`), plus
+the optional fields `id`, `plumed_file` (written by the server; without it the files are written to a
+temporary directory and returned inline), `md_index`, `cache`, `consensus` (for multi-model bulge structures)
+and `options` (keyword arguments for write_plumed). The response has `status` ('ok' or 'error'), `bulges` (the per-bulge results of
+generate_plumed), `plumed_file` or `files` ({file name: text}, the PLUMED file and any grid files),
+`message` and `elapsed_ms`. The requests {"op": "ping"} and {"op": "stats"} check the server. Relative paths
+are resolved against the server's working directory. Everything the server writes (`plumed_file`, its grid files and
+the `md_index` sidecar next to `md_pdb`) must lie inside `output_root`; requests writing elsewhere are refused.
+SIGINT or SIGTERM stops the server and removes its socket. An existing file at the socket path is only replaced
+when it is a socket.
+
+Every worker loads the prototype database and the function table once in its initializer and keeps the last
+`structure_cache` parsed structures (keyed on path, mtime, size and selected residues), so a repeated request
+only runs the prototype assignment and the PLUMED writer.
+
+Parameters:
+- address (str): The Unix socket path or host:port to listen on.
+- prototype_path (str): The directory containing the prototype database.
+- func_file (str): The path to the function file.
+- workers (int): The number of worker processes. Default: 2.
+- structure_cache (int): The number of parsed structures kept per worker. Default: 16.
+- cache_dir (str, optional): The directory of a result cache shared by the workers (see utils.cache).
+- output_root (str, optional): The directory the server may write to. Default: the working directory.
+"""
+
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+_WORKER = {}
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host.strip('[]'), int(port)
+    return address, None
+
+
+def check_listen_address(address):
+    host, port = parse_address(address)
+    if port is not None and host not in LOOPBACK_HOSTS:
+        error_msg = (f"Refusing to listen on {address}: the server is unauthenticated, so TCP addresses must be "
+                     f"loopback ({', '.join(LOOPBACK_HOSTS)}). Use a Unix socket path or 127.0.0.1:<port>.")
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    return host, port
+
+
+def _confined(path, output_root):
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([real_path, output_root]) != output_root:
+        raise ValueError(f"{path} is outside the server's output root {output_root}.")
+    return path
+
+
+def _init_server_worker(prototype_path, func_file, structure_cache, cache_dir, output_root):
+    load_prototype_db(prototype_path)
+    read_function_table(func_file)
+    _WORKER.update({'prototype_path': prototype_path, 'func_file': func_file, 'structures': OrderedDict(),
+                    'structure_cache': structure_cache, 'cache': ResultCache(cache_dir) if cache_dir else None,
+                    'output_root': output_root})
+
+
+def _cached_structure(pdb_name, residues=None, use_index=False):
+    stat = os.stat(pdb_name)
+    key = (os.path.realpath(pdb_name), stat.st_mtime, stat.st_size,
+           tuple(sorted(residues.items())) if residues is not None else None)
+    structures = _WORKER['structures']
+    structure = structures.get(key)
+    if structure is not None:
+        structures.move_to_end(key)
+        return structure
+
+    structure = read_structure(pdb_name, residues=residues, use_index=use_index)
+    structures[key] = structure
+    while len(structures) > _WORKER['structure_cache']:
+        structures.popitem(last=False)
+    return structure
+
+
+def _generate(request):
+    from utils.find_bulges import find_bulges, bulge_residue_ids
+
+    bulge_structure = _cached_structure(request['bulge_pdb'])
+    if request.get('auto_bulge'):
+        bulges = find_bulges(bulge_structure, max_size=request.get('max_bulge_size', 1))
+        bulge_name, bulge_id = bulge_residue_ids(bulges, bulge_structure)
+    else:
+        bulge_name = list(request['bulge_name'])
+        bulge_id = [int(resi) for resi in request['bulge_id']]
+        if len(bulge_name) != len(bulge_id):
+            raise ValueError("The number of bulge residues and residue IDs must match.")
+
+    if request.get('md_index', False):
+        # The residue index is written next to the MD structure.
+        _confined(request['md_pdb'], _WORKER['output_root'])
+    md_structure = _cached_structure(request['md_pdb'], residues=md_residue_request(bulge_id, bulge_name),
+                                     use_index=request.get('md_index', False))
+    cache = _WORKER['cache'] if request.get('cache', True) else None
+
+    def run(plumed_file):
+        return generate_plumed(bulge_structure, md_structure, bulge_id, bulge_name, _WORKER['prototype_path'],
+                               _WORKER['func_file'], plumed_file, plumed_options=request.get('options'), cache=cache,
+                               consensus=request.get('consensus', 'majority'))
+
+    if request.get('plumed_file'):
+        _confined(request['plumed_file'], _WORKER['output_root'])
+        return {'bulges': run(request['plumed_file']), 'plumed_file': request['plumed_file']}
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        bulges = run(os.path.join(output_dir, 'plumed.dat'))
+        files = {}
+        for name in sorted(os.listdir(output_dir)):
+            with open(os.path.join(output_dir, name), 'r') as file:
+                files[name] = file.read()
+    return {'bulges': bulges, 'files': files}
+
+
+def handle_request(request):
+    start = time.perf_counter()
+    response = {'id': request.get('id'), 'status': 'error', 'message': None}
+    try:
+        response.update(_generate(request))
+        response['status'] = 'ok'
+        response['message'] = '; '.join(f"{bulge['bulge']}: {bulge['message']}"
+                                        for bulge in response['bulges'] if bulge['message']) or None
+    except Exception as e:
+        logger.error(f"Request {request.get('id')} failed: {e}\n{traceback.format_exc()}")
+        response['message'] = str(e)
+    response['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return response
+
+
+class BulgeFFServer:
+    def __init__(self, address, prototype_path, func_file, workers=2, structure_cache=16, cache_dir=None,
+                 output_root=None):
+        check_listen_address(address)
+        self.address = address
+        self.output_root = os.path.realpath(output_root or os.getcwd())
+        self.initargs = (prototype_path, func_file, structure_cache, cache_dir, self.output_root)
+        self.workers = workers
+        self.executor = None
+        self.served = 0
+        self.failed = 0
+
+    async def _respond(self, request, writer, lock):
+        if request.get('op') == 'ping':
+            response = {'id': request.get('id'), 'status': 'ok'}
+        elif request.get('op') == 'stats':
+            response = {'id': request.get('id'), 'status': 'ok', 'served': self.served, 'failed': self.failed,
+                        'workers': self.workers}
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.executor, handle_request, request)
+            self.served += 1
+            self.failed += response['status'] != 'ok'
+
+        async with lock:
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("A request must be a JSON object.")
+                except ValueError as e:
+                    async with lock:
+                        writer.write((json.dumps({'id': None, 'status': 'error', 'message': f"Invalid request: {e}"})
+                                      + '\n').encode())
+                        await writer.drain()
+                    continue
+                task = asyncio.ensure_future(self._respond(request, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def serve(self, ready=None):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_server_worker,
+                                            initargs=self.initargs)
+        # Start every worker now, so the first requests do not pay for the imports and the database load.
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            await asyncio.wrap_future(future)
+
+        host, port = check_listen_address(self.address)
+        if port is None:
+            self._remove_socket(host)
+            server = await asyncio.start_unix_server(self._handle_connection, path=host)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host=host, port=port)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+
+        logger.info(f"BulgeFF server listening on {self.address} with {self.workers} worker(s).")
+        if ready is not None:
+            ready()
+        try:
+            async with server:
+                await stop.wait()
+            logger.info(f"BulgeFF server on {self.address} stopped after {self.served} requests.")
+        finally:
+            self.executor.shutdown()
+            if port is None:
+                self._remove_socket(host)
+
+    def _remove_socket(self, path):
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            error_msg = f"{path} exists and is not a socket; not removing it."
+            logger.error(error_msg)
+            raise FileExistsError(error_msg)
+        os.remove(path)
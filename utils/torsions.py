@@ -0,0 +1,69 @@
+import numpy as np
+
+"""
+Vectorized torsion kernels for sugar pucker and eta/theta pseudo-torsions.
+
+Every function takes coordinate arrays of shape (..., 3), so a single call handles one residue, every residue
+of a structure (n_residues, 3) or a whole ensemble (n_frames, n_residues, 3).
+
+- `dihedral(p1, p2, p3, p4)`: Dihedral angles in radians, shape (...).
+- `sugar_torsions(C4, O4, C1, C2, C3)`: The endocyclic torsions nu0-nu4 in radians, shape (..., 5).
+- `pucker_phase(nu)`: The Altona-Sundaralingam phase angle and amplitude in degrees, phase in [0, 360).
+- `classify_pucker(phase)`: "C3'-endo", "C2'-endo" or "Others" for every phase angle.
+- `pseudo_torsions(C4_prev, P, C4, P_next, C4_next)`: The eta and theta pseudo-torsions in radians.
+"""
+
+SUGAR_ATOMS = ("C4'", "O4'", "C1'", "C2'", "C3'")
+
+# Weights of the Altona-Sundaralingam Fourier terms for the torsions ordered nu2, nu3, nu4, nu0, nu1.
+_PHASE_ORDER = [2, 3, 4, 0, 1]
+_PHASE_ANGLES = 0.8 * np.pi * np.arange(5)
+
+
+def dihedral(p1, p2, p3, p4):
+    p1, p2, p3, p4 = (np.asarray(p, dtype=np.float64) for p in (p1, p2, p3, p4))
+    b1 = p1 - p2
+    b2 = p3 - p2
+    b3 = p4 - p3
+
+    b2 = b2 / np.linalg.norm(b2, axis=-1, keepdims=True)
+
+    v = b1 - np.sum(b1 * b2, axis=-1, keepdims=True) * b2
+    w = b3 - np.sum(b3 * b2, axis=-1, keepdims=True) * b2
+
+    x = np.sum(v * w, axis=-1)
+    y = np.sum(np.cross(b2, v) * w, axis=-1)
+
+    return np.arctan2(y, x)
+
+
+def sugar_torsions(C4, O4, C1, C2, C3):
+    return np.stack([
+        dihedral(C4, O4, C1, C2),
+        dihedral(O4, C1, C2, C3),
+        dihedral(C1, C2, C3, C4),
+        dihedral(C2, C3, C4, O4),
+        dihedral(C3, C4, O4, C1),
+    ], axis=-1)
+
+
+def pucker_phase(nu):
+    v = np.asarray(nu, dtype=np.float64)[..., _PHASE_ORDER]
+    A = 0.4 * np.sum(v * np.cos(_PHASE_ANGLES), axis=-1)
+    B = -0.4 * np.sum(v * np.sin(_PHASE_ANGLES), axis=-1)
+
+    amplitude = np.sqrt(A * A + B * B)
+    phase = np.degrees(np.arctan2(B / amplitude, A / amplitude))
+    phase = np.where(phase < 0, phase + 360, phase)
+    return phase, np.degrees(amplitude)
+
+
+def classify_pucker(phase):
+    phase = np.asarray(phase, dtype=np.float64)
+    c3_endo = ((phase >= 0) & (phase <= 54)) | ((phase >= 342) & (phase <= 360))
+    c2_endo = (phase >= 126) & (phase <= 198)
+    return np.where(c3_endo, "C3'-endo", np.where(c2_endo, "C2'-endo", "Others"))
+
+
+def pseudo_torsions(C4_prev, P, C4, P_next, C4_next):
+    return dihedral(C4_prev, P, C4, P_next), dihedral(P, C4, P_next, C4_next)
@@ -0,0 +1,141 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+Reads selected atoms from a trajectory in chunks of frames.
+
+Multi-model PDB files are read directly: the byte offset of every MODEL record is found in one pass and a chunk
+seeks straight to its first frame, parsing only the coordinates of the selected atoms. Every other format
+(XTC, TRR, DCD, ...) is read through MDAnalysis, which is imported only when such a file is opened.
+
+Atom indices are 0-based positions in the MD topology, i.e. the PLUMED atom number minus one.
+
+Parameters:
+- trajectory (str): The trajectory file.
+- topology (str, optional): The topology/structure file, required for non-PDB trajectories.
+
+Returns:
+- reader (TrajectoryReader): `reader.n_frames` and `reader.read(start, stop, atom_indices)`, which returns the
+  frame numbers (F,), the frame times (F,) and the coordinates (F, n_atoms, 3) in Angstrom.
+
+`frame_chunks` splits a frame range into fixed-size chunks and `ordered_map` runs a function over chunks in a
+process pool, yielding the results in input order with a bounded number of chunks in flight.
+"""
+
+PDB_EXTENSIONS = ('.pdb', '.ent')
+
+_READER_CACHE = {}
+
+
+class TrajectoryReader:
+    def __init__(self, trajectory, topology=None):
+        self.trajectory = trajectory
+        self.topology = topology
+        self.is_pdb = trajectory.lower().endswith(PDB_EXTENSIONS)
+        if self.is_pdb:
+            self.offsets = self._model_offsets()
+            self.n_frames = len(self.offsets)
+        else:
+            import MDAnalysis as mda
+            import warnings
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self.universe = mda.Universe(topology or trajectory, trajectory)
+            self.n_frames = len(self.universe.trajectory)
+        logger.info(f"Opened trajectory {trajectory} with {self.n_frames} frames.")
+
+    def _model_offsets(self):
+        offsets = []
+        offset = 0
+        with open(self.trajectory, 'rb') as file:
+            for line in file:
+                if line.startswith(b'MODEL'):
+                    offsets.append(offset)
+                offset += len(line)
+        return np.asarray(offsets or [0], dtype=np.int64)
+
+    def _read_pdb(self, start, stop, atom_indices):
+        wanted = np.unique(atom_indices)
+        position = {int(index): k for k, index in enumerate(wanted)}
+        last = int(wanted[-1]) if len(wanted) else -1
+        coords = np.zeros((stop - start, len(wanted), 3), dtype=np.float64)
+
+        with open(self.trajectory, 'rb') as file:
+            for frame in range(start, stop):
+                file.seek(int(self.offsets[frame]))
+                atom = -1
+                found = 0
+                for line in file:
+                    if line.startswith(b'END') or (line.startswith(b'MODEL') and atom >= 0):
+                        break
+                    if not line.startswith((b'ATOM', b'HETATM')):
+                        continue
+                    atom += 1
+                    k = position.get(atom)
+                    if k is not None:
+                        coords[frame - start, k] = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+                        found += 1
+                    if atom >= last:
+                        break
+                if found != len(wanted):
+                    raise ValueError(f"Frame {frame} of {self.trajectory} has only {atom + 1} atoms; "
+                                     f"atom index {last} was requested.")
+
+        frames = np.arange(start, stop)
+        return frames, frames.astype(np.float64), coords[:, np.searchsorted(wanted, atom_indices)]
+
+    def read(self, start, stop, atom_indices):
+        atom_indices = np.asarray(atom_indices, dtype=np.int64)
+        stop = min(stop, self.n_frames)
+        if self.is_pdb:
+            return self._read_pdb(start, stop, atom_indices)
+
+        atoms = self.universe.atoms[atom_indices]
+        frames, times, coords = [], [], []
+        for ts in self.universe.trajectory[start:stop]:
+            frames.append(ts.frame)
+            times.append(ts.time)
+            coords.append(atoms.positions.astype(np.float64))
+        coords = np.stack(coords) if coords else np.zeros((0, len(atom_indices), 3))
+        return np.asarray(frames, dtype=np.int64), np.asarray(times, dtype=np.float64), coords
+
+
+def open_trajectory(trajectory, topology=None):
+    # Keyed on the process too: a forked worker must not share the parent's open trajectory file.
+    key = (os.getpid(), os.path.realpath(trajectory), topology and os.path.realpath(topology))
+    stat = os.stat(trajectory)
+    cached = _READER_CACHE.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime, stat.st_size):
+        return cached[1]
+    reader = TrajectoryReader(trajectory, topology)
+    _READER_CACHE[key] = ((stat.st_mtime, stat.st_size), reader)
+    return reader
+
+
+def frame_chunks(n_frames, chunk_size, start=0, stop=None):
+    stop = n_frames if stop is None else min(stop, n_frames)
+    for chunk_start in range(start, stop, chunk_size):
+        yield chunk_start, min(chunk_start + chunk_size, stop)
+
+
+def ordered_map(function, tasks, workers=1, window=None):
+    if workers <= 1:
+        for task in tasks:
+            yield function(*task)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    window = window or 2 * workers
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for task in tasks:
+            pending.append(executor.submit(function, *task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
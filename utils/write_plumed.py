@@ -1,15 +1,114 @@
-def write_plumed(plumed_file, eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list, bulge_resi_list):
+import os
+import re
+from utils.fourier import FourierSeries, write_bias_grid
+
+"""
+Writes the PLUMED input with the eta/theta torsions and the BulgeFF correction bias for every bulge.
+
+Parameters:
+- plumed_file (str): The path of the PLUMED file to write.
+- eta_list, theta_list (list of str): The atom IDs of the eta and theta torsions of every bulge.
+- eta_func_list, theta_func_list (list of str): The Fourier correction functions of every bulge.
+- bulge_res_list, bulge_resi_list (list): The residue names and numbers used to label every bulge.
+- bias_mode (str): 'custom' embeds the functions as CUSTOM expressions evaluated by PLUMED's lepton at every step;
+  'grid' tabulates every function (energy and analytic derivative) into `<label>.grid` next to the PLUMED file
+  and applies it with a grid-based EXTERNAL bias. Default: 'custom'.
+- grid_bins (int): The number of grid points over [-pi, pi) in grid mode. Default: 3600.
+- layout (str): 'default' writes a block per bulge with its own bias actions and two PRINT files;
+  'lean' merges every CUSTOM term into a single CUSTOM + BIASVALUE pair (the bias is the same sum of terms)
+  and writes all torsions and biases to a single COLVAR file. Default: 'default'.
+- print_stride (int): The PRINT stride; 0 disables printing. Default: 5000.
+- colvar_file (str): The PRINT file of the lean layout. Default: COLVAR.
+- molinfo (str or None): The MOLINFO structure. 'auto' writes reference.pdb in the default layout and omits
+  MOLINFO in the lean layout, where it is not needed because all atoms are given by index. Default: 'auto'.
+
+`write_bulge_section` writes the `# Bulge <name>` block of one bulge in the default layout, so that a single block
+can be regenerated and spliced into an existing file (see utils.incremental); `write_grids=False` keeps the grid
+files already written for unchanged functions.
+"""
+
+LEAN_BIAS_LABEL = "bulgeff_bias"
+LEAN_BIASVALUE_LABEL = "bulgeff"
+
+_VARIABLE = re.compile(r"\bx\b")
+
+
+def _write_grid_bias(f, grid_dir, cv, func, grid_bins, write_grid=True):
+    grid_file = f"bias_{cv}.grid"
+    if write_grid:
+        write_bias_grid(os.path.join(grid_dir, grid_file), cv, f"bias_{cv}", FourierSeries.parse(func), grid_bins)
+    f.write(f"bias_{cv}: EXTERNAL ARG={cv} FILE={grid_file}\n")
+
+
+def _write_lean(f, grid_dir, cvs, funcs, bias_mode, grid_bins, print_stride, colvar_file):
+    bulges = [cv[len("eta_"):] for cv in cvs if cv.startswith("eta_")]
+    f.write(f"\n# BulgeFF bulges: {', '.join(bulges)}\n")
+    for cv, atoms in cvs.items():
+        f.write(f"{cv}: TORSION ATOMS={atoms}\n")
+
+    if bias_mode == "grid":
+        bias_args = []
+        for cv, func in zip(cvs, funcs):
+            _write_grid_bias(f, grid_dir, cv, func, grid_bins)
+            bias_args.append(f"bias_{cv}.bias")
+    else:
+        variables = [f"x{k}" for k in range(len(funcs))]
+        terms = "+".join(f"({_VARIABLE.sub(variable, func)})" for variable, func in zip(variables, funcs))
+        f.write(f"{LEAN_BIAS_LABEL}: CUSTOM ARG={','.join(cvs)} VAR={','.join(variables)} FUNC={terms} PERIODIC=NO\n")
+        f.write(f"{LEAN_BIASVALUE_LABEL}: BIASVALUE ARG={LEAN_BIAS_LABEL}\n")
+        bias_args = [f"{LEAN_BIASVALUE_LABEL}.bias"]
+
+    if print_stride:
+        f.write(f"PRINT ARG={','.join(list(cvs) + bias_args)} FILE={colvar_file} STRIDE={print_stride}\n")
+
+
+def write_bulge_section(f, grid_dir, identifier, eta, theta, eta_func, theta_func, bias_mode="custom", grid_bins=3600,
+                        print_stride=5000, write_grids=True):
+    f.write(f"\n# Bulge {identifier}\n")
+    f.write(f"eta_{identifier}: TORSION ATOMS={eta}\n")
+    f.write(f"theta_{identifier}: TORSION ATOMS={theta}\n")
+    if bias_mode == "grid":
+        _write_grid_bias(f, grid_dir, f"eta_{identifier}", eta_func, grid_bins, write_grids)
+        _write_grid_bias(f, grid_dir, f"theta_{identifier}", theta_func, grid_bins, write_grids)
+        eta_bias, theta_bias = f"bias_eta_{identifier}", f"bias_theta_{identifier}"
+    else:
+        f.write(f"bias_eta_{identifier}: CUSTOM ARG=eta_{identifier} FUNC={eta_func} PERIODIC=NO\n")
+        f.write(f"bias_theta_{identifier}: CUSTOM ARG=theta_{identifier} FUNC={theta_func} PERIODIC=NO\n")
+        f.write(f"bias_e_{identifier}: BIASVALUE ARG=bias_eta_{identifier}\n")
+        f.write(f"bias_t_{identifier}: BIASVALUE ARG=bias_theta_{identifier}\n")
+        eta_bias, theta_bias = f"bias_e_{identifier}", f"bias_t_{identifier}"
+    if print_stride:
+        f.write(f"PRINT ARG=eta_{identifier},{eta_bias}.bias FILE=eta_{identifier}.dat STRIDE={print_stride}\n")
+        f.write(f"PRINT ARG=theta_{identifier},{theta_bias}.bias FILE=theta_{identifier}.dat STRIDE={print_stride}\n")
+
+
+def write_plumed(plumed_file, eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list, bulge_resi_list,
+                 bias_mode="custom", grid_bins=3600, layout="default", print_stride=5000, colvar_file="COLVAR",
+                 molinfo="auto"):
+    if bias_mode not in ("custom", "grid"):
+        raise ValueError(f"Unknown bias mode: {bias_mode}. Valid modes are 'custom' and 'grid'.")
+    if layout not in ("default", "lean"):
+        raise ValueError(f"Unknown layout: {layout}. Valid layouts are 'default' and 'lean'.")
+    if molinfo == "auto":
+        molinfo = "reference.pdb" if layout == "default" else None
+
+    grid_dir = os.path.dirname(os.path.abspath(plumed_file))
     with open(plumed_file, "w") as f:
-        f.write(f"MOLINFO STRUCTURE=reference.pdb MOLTYPE=rna\n")
+        if molinfo:
+            f.write(f"MOLINFO STRUCTURE={molinfo} MOLTYPE=rna\n")
+
+        if layout == "lean":
+            cvs = {}
+            funcs = []
+            for eta, theta, eta_func, theta_func, bulge_res, bulge_resi in zip(eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list, bulge_resi_list):
+                identifier = f"{bulge_res}{bulge_resi}"
+                cvs[f"eta_{identifier}"] = eta
+                cvs[f"theta_{identifier}"] = theta
+                funcs.extend([eta_func, theta_func])
+            if cvs:
+                _write_lean(f, grid_dir, cvs, funcs, bias_mode, grid_bins, print_stride, colvar_file)
+            return
+
         for eta, theta, eta_func, theta_func, bulge_res, bulge_resi in zip(eta_list, theta_list, eta_func_list, theta_func_list, bulge_res_list, bulge_resi_list):
-            identifier = f"{bulge_res}{bulge_resi}"
-            f.write(f"\n# Bulge {identifier}\n")
-            f.write(f"eta_{identifier}: TORSION ATOMS={eta}\n")
-            f.write(f"theta_{identifier}: TORSION ATOMS={theta}\n")
-            f.write(f"bias_eta_{identifier}: CUSTOM ARG=eta_{identifier} FUNC={eta_func} PERIODIC=NO\n")
-            f.write(f"bias_theta_{identifier}: CUSTOM ARG=theta_{identifier} FUNC={theta_func} PERIODIC=NO\n")
-            f.write(f"bias_e_{identifier}: BIASVALUE ARG=bias_eta_{identifier}\n")
-            f.write(f"bias_t_{identifier}: BIASVALUE ARG=bias_theta_{identifier}\n")
-            f.write(f"PRINT ARG=eta_{identifier},bias_e_{identifier}.bias FILE=eta_{identifier}.dat STRIDE=5000\n")
-            f.write(f"PRINT ARG=theta_{identifier},bias_t_{identifier}.bias FILE=theta_{identifier}.dat STRIDE=5000\n")
-    f.close()
\ No newline at end of file
+            write_bulge_section(f, grid_dir, f"{bulge_res}{bulge_resi}", eta, theta, eta_func, theta_func, bias_mode,
+                                grid_bins, print_stride)